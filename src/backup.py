@@ -1,52 +1,445 @@
-import shutil
 import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
 from datetime import datetime
-import zipfile
-
-def backup_database_and_logs(database_path):
-    backup_dir = "backups"
-    if not os.path.exists(backup_dir):
-        os.makedirs(backup_dir)
-    
-    # Maak een unieke bestandsnaam voor de backup
-    backup_filename = f"{os.path.basename(database_path)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-    backup_path = os.path.join(backup_dir, backup_filename)
-    
-    with zipfile.ZipFile(backup_path, 'w') as backup_zip:
-        # Voeg de database toe aan de zip
-        backup_zip.write(database_path, os.path.basename(database_path))
-        
-        # Voeg logbestanden toe aan de zip
-        log_files = ["data/logs.csv", "data/encrypted_logs.csv", "data/system.log"]  # Voeg hier alle relevante logbestanden toe
-        for log_file in log_files:
-            if os.path.exists(log_file):
-                backup_zip.write(log_file, os.path.basename(log_file))
-            else:
-                print(f"Logbestand {log_file} niet gevonden, overslaan.")
-
-    print(f"Back-up succesvol gemaakt: {backup_path}")
+from contextlib import contextmanager
+from connection import get_connection_manager
+from log import audit_logger
+from encrypt_decrypt import key_manager
+
+BACKUP_DIR = "backups"
+CHUNK_DIR = os.path.join(BACKUP_DIR, "chunks")
+CHUNK_SIZE = 64 * 1024  # Veelvoud van de SQLite-paginagrootte, zodat ongewijzigde pagina's dezelfde chunks opleveren
+LOG_FILES = ["data/system.log"]  # Voeg hier alle relevante logbestanden toe; de auditlog zit in de database
+LEGACY_LOG_FILES = ["data/logs.csv", "data/encrypted_logs.csv"]  # Alleen nog in oude back-ups; worden wel teruggezet
+CHUNK_PRUNE_GRACE_PERIOD = 3600  # Seconden; jongere chunks kunnen bij een back-up horen waarvan het manifest nog komt
+SNAPSHOT_PAGES_PER_STEP = 256  # Pagina's per stap van de SQLite backup-API; tussen stappen is de database vrij
+SNAPSHOT_STEP_SLEEP = 0.01  # Seconden pauze tussen stappen
+SNAPSHOT_INTERVAL = int(os.environ.get("UNIQUE_MEAL_SNAPSHOT_INTERVAL", "0"))  # Seconden tussen automatische snapshots; 0 = uit
+
+def _chunk_path(chunk_hash):
+    return os.path.join(CHUNK_DIR, chunk_hash[:2], chunk_hash)
+
+def store_chunk(data):
+    """Sla een chunk gecomprimeerd op onder zijn SHA-256 hash; bestaande chunks worden hergebruikt."""
+    chunk_hash = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(chunk_hash)
+    if os.path.exists(path):
+        os.utime(path)  # Zo ruimt prune_chunks een chunk die een lopende back-up hergebruikt niet op
+        return chunk_hash, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as chunk_file:
+        chunk_file.write(zlib.compress(data))
+    os.replace(temp_path, path)
+    return chunk_hash, True
+
+def load_chunk(chunk_hash):
+    """Lees en decomprimeer een chunk uit de chunk store."""
+    with open(_chunk_path(chunk_hash), "rb") as chunk_file:
+        data = chunk_file.read()
+    try:
+        return zlib.decompress(data)
+    except zlib.error as e:
+        raise RestoreError(f"Chunk {chunk_hash} is beschadigd: {e}")
+
+def backup_file(path, name=None, stats=None):
+    """Splits een bestand in chunks, sla nieuwe chunks op en retourneer de manifestregel."""
+    file_hash = hashlib.sha256()
+    chunks = []
+    size = 0
+    with open(path, "rb") as source:
+        while True:
+            data = source.read(CHUNK_SIZE)
+            if not data:
+                break
+            file_hash.update(data)
+            size += len(data)
+            chunk_hash, is_new = store_chunk(data)
+            chunks.append(chunk_hash)
+            if stats is not None:
+                stats["chunks"] += 1
+                stats["new_chunks"] += is_new
+                stats["new_bytes"] += len(data) if is_new else 0
+    return {"name": name or os.path.basename(path), "size": size, "sha256": file_hash.hexdigest(), "chunks": chunks}
+
+def prune_chunks(grace_period=CHUNK_PRUNE_GRACE_PERIOD):
+    """Verwijder chunks die in geen enkel manifest meer voorkomen, bijvoorbeeld na het opruimen van oude back-ups.
+
+    Retourneert (aantal verwijderde chunks, vrijgekomen bytes). Een onleesbaar manifest breekt het opruimen af.
+    """
+    if not os.path.isdir(CHUNK_DIR):
+        return 0, 0
+    referenced = set()
+    for name in os.listdir(BACKUP_DIR):
+        if name.endswith(".json"):
+            with open(os.path.join(BACKUP_DIR, name), "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            for entry in manifest["files"]:
+                referenced.update(entry["chunks"])
+
+    removed, freed = 0, 0
+    cutoff = time.time() - grace_period
+    for directory, _, names in os.walk(CHUNK_DIR):
+        for name in names:
+            if name in referenced:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime >= cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+def snapshot_database(database_path, target_path, pages=SNAPSHOT_PAGES_PER_STEP, sleep=SNAPSHOT_STEP_SLEEP, progress=None):
+    """Maak een consistente kopie van een draaiende database met de SQLite backup-API, in kleine stappen."""
+    target = sqlite3.connect(target_path)
+    try:
+        with get_connection_manager(database_path).reader() as source:
+            source.backup(target, pages=pages, sleep=sleep, progress=progress)
+    finally:
+        target.close()
+
+def _write_manifest(manifest, database_path):
+    """Schrijf het manifest onder een nieuwe, unieke naam; een bestaand manifest wordt nooit overschreven."""
+    fd, temp_path = tempfile.mkstemp(suffix=".json.tmp", dir=BACKUP_DIR)
+    try:
+        with os.fdopen(fd, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        # Microseconden in de naam, en een volgnummer als twee back-ups toch dezelfde tijd krijgen
+        base_name = f"{os.path.basename(database_path)}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        for attempt in range(1000):
+            backup_path = os.path.join(BACKUP_DIR, f"{base_name}{f'_{attempt}' if attempt else ''}.json")
+            try:
+                os.link(temp_path, backup_path)  # Faalt als de naam al bestaat, in tegenstelling tot os.replace
+                return backup_path
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"Geen vrije naam voor het manifest {base_name}")
+    finally:
+        os.remove(temp_path)
+
+def _master_key_ids(database_file):
+    """Vingerafdrukken van de master keys waarmee de data keys in een databasebestand verpakt zijn."""
+    conn = sqlite3.connect(database_file)
+    try:
+        return sorted({row[0] for row in conn.execute("SELECT master_key_id FROM data_keys")})
+    except sqlite3.OperationalError:
+        return []  # Database van vóór envelope-encryptie: alleen de oude sleutels zijn nodig
+    finally:
+        conn.close()
+
+def backup_database_and_logs(database_path, quiet=False):
+    if not os.path.exists(BACKUP_DIR):
+        os.makedirs(BACKUP_DIR)
+    report = logging.info if quiet else print
+
+    stats = {"chunks": 0, "new_chunks": 0, "new_bytes": 0}
+    manifest = {"created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "chunk_size": CHUNK_SIZE, "files": []}
+
+    # Maak een online snapshot van de database en voeg deze toe aan de backup
+    audit_logger.flush()  # Zorg dat openstaande logs in de snapshot terechtkomen
+    started = time.perf_counter()
+    last_report = [0]
+
+    def progress(status, remaining, total):
+        done = total - remaining
+        if not quiet and total and (done == total or done - last_report[0] >= total // 10):
+            last_report[0] = done
+            print(f"Snapshot: {done}/{total} pagina's gekopieerd ({done * 100 // total}%)")
+
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", dir=BACKUP_DIR)
+    os.close(fd)
+    try:
+        snapshot_database(database_path, snapshot_path, progress=progress)
+        snapshot_seconds = time.perf_counter() - started
+        manifest["files"].append(backup_file(snapshot_path, name=os.path.basename(database_path), stats=stats))
+        # Zo weet retire_master_keys welke oude master keys deze back-up nog nodig heeft
+        manifest["master_key_ids"] = _master_key_ids(snapshot_path)
+    finally:
+        os.remove(snapshot_path)
+
+    # Voeg logbestanden toe aan de backup
+    for log_file in LOG_FILES:
+        if os.path.exists(log_file):
+            manifest["files"].append(backup_file(log_file, stats=stats))
+        elif not quiet:
+            print(f"Logbestand {log_file} niet gevonden, overslaan.")
+
+    backup_path = _write_manifest(manifest, database_path)
+
+    report(f"Back-up succesvol gemaakt: {backup_path} "
+           f"({stats['new_chunks']} van {stats['chunks']} chunks nieuw, {stats['new_bytes']} bytes toegevoegd; "
+           f"snapshot {snapshot_seconds:.2f}s, totaal {time.perf_counter() - started:.2f}s)")
+    return backup_path
+
+_running_schedulers = set()  # Gestarte SnapshotSchedulers, zodat een restore ze kan pauzeren
+
+class SnapshotScheduler:
+    """Maakt op de achtergrond periodiek een snapshot-back-up terwijl de applicatie in gebruik blijft."""
+
+    def __init__(self, database_path, interval=SNAPSHOT_INTERVAL):
+        self.database_path = database_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()  # Na stop() opnieuw te starten
+        self._thread = threading.Thread(target=self._run, name="snapshot-scheduler", daemon=True)
+        self._thread.start()
+        _running_schedulers.add(self)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()  # Wacht ook op een snapshot die op dat moment loopt
+            self._thread = None
+        _running_schedulers.discard(self)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                backup_database_and_logs(self.database_path, quiet=True)
+            except Exception as e:
+                logging.error(f"Scheduled snapshot failed: {e}")
+
+@contextmanager
+def _paused_schedulers(database_path):
+    """Stop de snapshots van een database zolang het blok loopt en start ze daarna weer."""
+    paused = [scheduler for scheduler in list(_running_schedulers) if scheduler.database_path == database_path]
+    for scheduler in paused:
+        scheduler.stop()
+    try:
+        yield
+    finally:
+        for scheduler in paused:
+            scheduler.start()
+
+class RestoreError(Exception):
+    """Een back-up kon niet worden geverifieerd en is niet teruggezet."""
+
+def _restore_target(name, database_path):
+    """Bepaal waar een bestand uit de back-up hoort; onbekende namen worden overgeslagen."""
+    if name == os.path.basename(database_path):
+        return database_path
+    if name in [os.path.basename(log_file) for log_file in LOG_FILES + LEGACY_LOG_FILES]:
+        return os.path.join("data", name)
+    return None
+
+def _stage_file(target, chunks, expected_sha256=None, expected_size=None):
+    """Schrijf een reeks (data, verwachte chunk-hash) naar een tijdelijk bestand naast het doel en controleer de hashes."""
+    fd, temp_path = tempfile.mkstemp(suffix=".restore", dir=os.path.dirname(target) or ".")
+    file_hash = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as staged_file:
+            for data, chunk_hash in chunks:
+                if chunk_hash is not None and hashlib.sha256(data).hexdigest() != chunk_hash:
+                    raise RestoreError(f"Chunk {chunk_hash} van {os.path.basename(target)} is beschadigd")
+                file_hash.update(data)
+                size += len(data)
+                staged_file.write(data)
+            staged_file.flush()
+            os.fsync(staged_file.fileno())
+        if expected_sha256 is not None and file_hash.hexdigest() != expected_sha256:
+            raise RestoreError(f"Hash van {os.path.basename(target)} komt niet overeen met het manifest")
+        if expected_size is not None and size != expected_size:
+            raise RestoreError(f"Grootte van {os.path.basename(target)} komt niet overeen met het manifest")
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+def _stage_manifest(backup_path, database_path):
+    """Zet alle bestanden uit een manifest-backup geverifieerd klaar als tijdelijke bestanden."""
+    with open(backup_path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    staged = {}
+    for entry in manifest["files"]:
+        target = _restore_target(entry["name"], database_path)
+        if target is None:
+            continue
+        chunks = ((load_chunk(chunk_hash), chunk_hash) for chunk_hash in entry["chunks"])
+        staged[target] = _stage_file(target, chunks, entry["sha256"], entry["size"])
+    return staged
+
+def _stage_zip(backup_path, database_path):
+    """Zet de bestanden uit een oude zip-back-up klaar; zipfile controleert de CRC tijdens het lezen."""
+    import zipfile  # Alleen nodig voor back-ups in het oude formaat
+    staged = {}
+    with zipfile.ZipFile(backup_path, 'r') as backup_zip:
+        for info in backup_zip.infolist():
+            target = _restore_target(os.path.basename(info.filename), database_path)
+            if target is None:
+                continue
+            with backup_zip.open(info) as member:
+                chunks = ((data, None) for data in iter(lambda: member.read(CHUNK_SIZE), b""))
+                staged[target] = _stage_file(target, chunks, expected_size=info.file_size)
+    return staged
+
+def _backup_master_key_ids(backup_path):
+    """Master keys die een back-up nodig heeft; oudere back-ups zonder deze lijst worden daarvoor uitgepakt."""
+    key_ids = set()
+    if backup_path.endswith(".json"):
+        with open(backup_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        if "master_key_ids" in manifest:
+            return set(manifest["master_key_ids"])
+        for entry in manifest["files"]:
+            if entry["name"].endswith(".db"):
+                chunks = ((load_chunk(chunk_hash), chunk_hash) for chunk_hash in entry["chunks"])
+                key_ids.update(_staged_master_key_ids(chunks, entry["sha256"]))
+        return key_ids
+    import zipfile
+    with zipfile.ZipFile(backup_path, 'r') as backup_zip:
+        for info in backup_zip.infolist():
+            if info.filename.endswith(".db"):
+                with backup_zip.open(info) as member:
+                    key_ids.update(_staged_master_key_ids((data, None) for data in iter(lambda: member.read(CHUNK_SIZE), b"")))
+    return key_ids
+
+def _staged_master_key_ids(chunks, expected_sha256=None):
+    staged = _stage_file(os.path.join(BACKUP_DIR, "master-keys.db"), chunks, expected_sha256)
+    try:
+        return _master_key_ids(staged)
+    finally:
+        os.remove(staged)
+
+def referenced_master_key_ids():
+    """Alle master keys die nodig zijn om een van de back-ups terug te zetten en daarna te ontsleutelen."""
+    key_ids = set()
+    if os.path.isdir(BACKUP_DIR):
+        for name in sorted(os.listdir(BACKUP_DIR)):
+            if name.endswith((".json", ".zip")):
+                key_ids |= _backup_master_key_ids(os.path.join(BACKUP_DIR, name))
+    return key_ids
+
+def _check_integrity(staged_database):
+    """Voer PRAGMA integrity_check uit op de klaargezette database."""
+    conn = sqlite3.connect(staged_database)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    if result != [("ok",)]:
+        raise RestoreError(f"Integriteitscontrole van de database mislukt: {result[:5]}")
+
+def _restore_journal(database_path):
+    return database_path + "-restore.json"
+
+def _roll_back(journal):
+    """Zet de bewaarde bestanden uit een restore-journaal terug; bestanden die er eerst niet waren verdwijnen weer."""
+    for target, saved in journal.items():
+        if saved is None:
+            if os.path.exists(target):
+                os.remove(target)
+        elif os.path.exists(saved):
+            os.replace(saved, target)
+
+def _swap_files(staged, database_path):
+    """Zet alle klaargezette bestanden op hun plek, of bij een fout geen enkele."""
+    # Het journaal legt vast welke bestanden opzij zijn gezet, zodat ook een onderbroken restore terug te draaien is
+    journal = {target: f"{target}.pre-restore" if os.path.exists(target) else None for target in staged}
+    journal_path = _restore_journal(database_path)
+    with open(journal_path + ".tmp", "w") as journal_file:
+        json.dump(journal, journal_file)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    os.replace(journal_path + ".tmp", journal_path)
+    try:
+        for target, saved in journal.items():
+            if saved is not None:
+                os.replace(target, saved)
+        for target, temp_path in staged.items():
+            os.replace(temp_path, target)
+    except BaseException:
+        _roll_back(journal)
+        os.remove(journal_path)
+        raise
+    os.remove(journal_path)  # Vanaf hier is de restore voltooid
+    for saved in journal.values():
+        if saved is not None:
+            os.remove(saved)
+
+def recover_interrupted_restore(database_path):
+    """Draai een restore terug die halverwege is afgebroken, bijvoorbeeld door een crash; aanroepen bij het opstarten."""
+    journal_path = _restore_journal(database_path)
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path) as journal_file:
+        journal = json.load(journal_file)
+    _roll_back(journal)
+    os.remove(journal_path)
+    logging.warning(f"Rolled back an interrupted restore of {database_path}")
+    return True
+
+def restore_backup(backup_path, database_path):
+    """Verifieer een back-up, wissel de bestanden atomisch om en retourneer een nieuwe databaseverbinding."""
+    from database import create_connection, initialize_database  # Importeer alleen binnen de functie
+
+    staged = _stage_manifest(backup_path, database_path) if backup_path.endswith(".json") else _stage_zip(backup_path, database_path)
+    try:
+        if database_path not in staged:
+            raise RestoreError("De back-up bevat geen database")
+        _check_integrity(staged[database_path])
+
+        audit_logger.flush()
+        key_manager.data_keys.close()  # De teruggezette database kan andere data keys bevatten
+        from worker_pool import close_shared_pool
+        close_shared_pool()  # Ook de workers van de zoekfunctie hebben de oude data keys in het geheugen
+        # Geen snapshots, schrijvers of lezers meer tot de bestanden zijn omgewisseld
+        with _paused_schedulers(database_path), get_connection_manager(database_path).exclusive():
+            _swap_files(staged, database_path)
+    finally:
+        for temp_path in staged.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    new_conn = create_connection(database_path)
+    initialize_database(new_conn)  # Een oudere back-up heeft een lagere schemaversie en wordt gemigreerd
+    return new_conn
 
 def restore_database_from_backup(database_path):
-    backup_dir = "backups"
+    """Vraag om een back-up en zet deze terug; retourneert de nieuwe verbinding of None."""
     backup_file = input("Voer de naam van het back-upbestand in (in de 'backups' map): ")
-    backup_path = os.path.join(backup_dir, backup_file)
-    
-    if os.path.exists(backup_path):
-        with zipfile.ZipFile(backup_path, 'r') as backup_zip:
-            # Extracteer alle bestanden naar de juiste locaties
-            backup_zip.extractall()
-
-            # Verplaats het geëxtraheerde databasebestand naar de juiste locatie
-            extracted_db_path = os.path.join("data", os.path.basename(database_path))
-            if os.path.exists(extracted_db_path):
-                shutil.move(extracted_db_path, database_path)
-
-            # Verplaats de geëxtraheerde logbestanden naar de juiste locaties
-            for file_name in backup_zip.namelist():
-                if file_name.startswith("logs") or file_name.startswith("system.log"):
-                    extracted_file_path = os.path.join("data", os.path.basename(file_name))
-                    shutil.move(extracted_file_path, os.path.join("data", file_name))
-        
-        print("Back-up succesvol hersteld.")
+    backup_path = os.path.join(BACKUP_DIR, os.path.basename(backup_file))
+
+    if not os.path.exists(backup_path):
+        print("Back-upbestand niet gevonden.")
+        return None
+
+    import zipfile
+    try:
+        new_conn = restore_backup(backup_path, database_path)
+    except (RestoreError, zipfile.BadZipFile, OSError, sqlite3.Error, ValueError) as e:
+        logging.error(f"Restore of {backup_path} failed: {e}")
+        print(f"Herstellen mislukt, de huidige database is niet gewijzigd: {e}")
+        return None
+
+    print("Back-up succesvol hersteld.")
+    return new_conn
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "prune":
+        removed, freed = prune_chunks()
+        logging.info(f"Pruned {removed} unreferenced backup chunks ({freed} bytes)")
+        print(f"{removed} ongebruikte chunks verwijderd, {freed} bytes vrijgekomen.")
     else:
-        print("Back-upbestand niet gevonden.")
\ No newline at end of file
+        print("Gebruik: python src/backup.py prune")
+        print("  prune  verwijder chunks die in geen enkel manifest meer voorkomen")
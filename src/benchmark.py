@@ -0,0 +1,185 @@
+# benchmark.py
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+from benchmark_dataset import (generate_dataset, random_member, membership_id_for, username_for, DATASET_PRESETS,
+                               DATASET_SEED, BENCHMARK_DATABASE, BENCHMARK_PASSWORD, LAST_NAMES)
+from connection import get_connection_manager
+from database import close_connections
+from encrypt_decrypt import key_manager, CIPHER_BACKEND
+from log import log_activity, decrypt_log_file, audit_logger
+from member import search_members, save_member, get_member_id
+from user import validate_login
+import backup
+
+BENCHMARK_REPEAT = 20  # Metingen per benchmark; trage benchmarks gebruiken er minder
+REGRESSION_THRESHOLD = 0.10  # Een mediaan die meer dan 10% trager is dan de basismeting telt als regressie
+LOG_BURST_SIZE = 500  # log_activity-aanroepen per meting
+
+def _summary(samples, operations):
+    """Statistieken van een reeks metingen in seconden; per_operation deelt de mediaan door het aantal bewerkingen."""
+    samples = sorted(samples)
+    return {
+        "samples": len(samples),
+        "operations": operations,
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, round(0.95 * (len(samples) - 1)))],
+        "mean": statistics.fmean(samples),
+        "per_operation": statistics.median(samples) / operations,
+    }
+
+def measure(function, repeat=BENCHMARK_REPEAT, operations=1, setup=None):
+    """Voer function na één opwarmronde repeat keer uit en retourneer de samenvatting; setup telt niet mee."""
+    if setup:
+        setup()
+    function()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return _summary(samples, operations)
+
+def run_benchmarks(dataset, repeat=BENCHMARK_REPEAT, report=print):
+    """Meet de hete paden van de applicatie op de dataset in de huidige werkmap."""
+    rng = random.Random(DATASET_SEED)
+    conn = get_connection_manager(BENCHMARK_DATABASE).writer
+    slow_repeat = max(3, repeat // 5)
+    results = {}
+
+    def run(name, function, **kwargs):
+        report(f"  {name}...")
+        results[name] = measure(function, **kwargs)
+
+    # Inloggen: een bestaande gebruiker met het juiste wachtwoord en een onbekende gebruiker
+    users = max(dataset["users"], 1)
+    run("validate_login", lambda: validate_login(conn, username_for(rng.randrange(users)), BENCHMARK_PASSWORD),
+        repeat=repeat)
+    run("validate_login_unknown", lambda: validate_login(conn, "bench_unknown", BENCHMARK_PASSWORD), repeat=repeat)
+
+    # De kern van search_member_prompt: zoeken en de gevonden leden ontsleutelen, zonder de invoer en uitvoer
+    def search(term):
+        return lambda: [member.to_dict() for member in search_members(conn, term)]
+    members = max(dataset["members"], 1)
+    run("search_member_name", search(rng.choice(LAST_NAMES).split()[-1]), repeat=repeat)
+    run("search_member_id", search(membership_id_for(members // 2)), repeat=repeat)
+    run("search_member_short_term", search("an"), repeat=slow_repeat)  # Te kort voor de trigramindex: volledige scan
+
+    # De opslag van update_member; het opvragen van de nieuwe gegevens is interactief en telt niet mee
+    def update():
+        number = rng.randrange(members)
+        membership_id = membership_id_for(number)
+        save_member(conn, get_member_id(conn, membership_id), *random_member(rng, number)[:8], membership_id)
+    run("update_member", update, repeat=repeat)
+
+    # Auditlog: een reeks log_activity-aanroepen inclusief het wegschrijven, en de volledige log ontsleutelen
+    def log_burst():
+        for number in range(LOG_BURST_SIZE):
+            log_activity("bench_user00000", "Member searched", f"Benchmark burst {number}")
+        audit_logger.flush()
+    run("log_activity", log_burst, repeat=slow_repeat, operations=LOG_BURST_SIZE)
+    run("decrypt_log_file", decrypt_log_file, repeat=slow_repeat)
+
+    # Back-up: volledig (lege chunk-map) en incrementeel (alleen gewijzigde chunks)
+    def clear_backups():
+        shutil.rmtree(backup.BACKUP_DIR, ignore_errors=True)
+    run("backup_full", lambda: backup.backup_database_and_logs(BENCHMARK_DATABASE, quiet=True),
+        repeat=slow_repeat, setup=clear_backups)
+    run("backup_incremental", lambda: backup.backup_database_and_logs(BENCHMARK_DATABASE, quiet=True),
+        repeat=slow_repeat, setup=update)
+    return results
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Vergelijk de mediaan per bewerking met een eerdere run; retourneert (naam, basis, nu, verhouding, regressie)."""
+    comparison = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        ratio = result["per_operation"] / base["per_operation"]
+        comparison.append((name, base["per_operation"], result["per_operation"], ratio, ratio > 1 + threshold))
+    return comparison
+
+def _close_connections():
+    """Sluit alle verbindingen zodat de databasebestanden gekopieerd of verwijderd kunnen worden."""
+    audit_logger.flush()
+    key_manager.data_keys.close()
+    close_connections(BENCHMARK_DATABASE)
+
+def run_suite(preset="small", repeat=BENCHMARK_REPEAT, workdir=None, seed=DATASET_SEED, report=print):
+    """Draai alle benchmarks op een verse kopie van de dataset en retourneer het resultaat als dict.
+
+    Met een workdir wordt de dataset daar bewaard en hergebruikt; de benchmarks wijzigen alleen de kopie.
+    """
+    original_dir = os.getcwd()
+    run_dir = tempfile.mkdtemp(prefix="unique_meal_benchmark_")
+    try:
+        # Alle paden van de applicatie zijn relatief, dus de echte data blijft buiten bereik
+        os.makedirs(workdir or run_dir, exist_ok=True)
+        os.chdir(workdir or run_dir)
+        started = time.perf_counter()
+        dataset = generate_dataset(**DATASET_PRESETS[preset], seed=seed, report=report)
+        if workdir:
+            _close_connections()
+            shutil.copytree(os.path.join(workdir, "data"), os.path.join(run_dir, "data"))
+            os.chdir(run_dir)
+        report(f"Dataset klaar in {time.perf_counter() - started:.1f}s; benchmarks draaien...")
+        results = run_benchmarks(dataset, repeat, report)
+    finally:
+        _close_connections()
+        os.chdir(original_dir)
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return {
+        "created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "preset": preset,
+        "dataset": dataset,
+        "repeat": repeat,
+        "cipher_backend": CIPHER_BACKEND,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Meet login, zoeken, bijwerken, auditlog en back-up op een synthetische dataset.")
+    parser.add_argument("--preset", choices=DATASET_PRESETS, default="small")
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument("--seed", type=int, default=DATASET_SEED)
+    parser.add_argument("--workdir", help="Bewaar de dataset hier om deze bij een volgende run te hergebruiken")
+    parser.add_argument("--output", help="JSON-bestand voor de resultaten (standaard benchmark_<preset>_<tijd>.json)")
+    parser.add_argument("--baseline", help="Eerdere resultaten om mee te vergelijken")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or f"benchmark_{args.preset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    suite = run_suite(args.preset, args.repeat, args.workdir and os.path.abspath(args.workdir), args.seed)
+    with open(output, "w") as output_file:
+        json.dump(suite, output_file, indent=2)
+
+    print(f"\n{'benchmark':<26} {'mediaan':>12} {'p95':>12} {'per bewerking':>14}")
+    for name, result in suite["results"].items():
+        print(f"{name:<26} {result['median'] * 1000:>10.2f}ms {result['p95'] * 1000:>10.2f}ms "
+              f"{result['per_operation'] * 1000:>12.3f}ms")
+    print(f"Resultaten opgeslagen in {output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            comparison = compare_results(suite["results"], json.load(baseline_file), args.threshold)
+        print(f"\n{'benchmark':<26} {'basis':>12} {'nu':>12} {'verschil':>9}")
+        for name, base, current, ratio, regression in comparison:
+            print(f"{name:<26} {base * 1000:>10.3f}ms {current * 1000:>10.3f}ms {(ratio - 1) * 100:>+8.1f}%"
+                  f"{'  REGRESSIE' if regression else ''}")
+        if any(regression for *_, regression in comparison):
+            sys.exit(1)
@@ -0,0 +1,130 @@
+# benchmark_dataset.py
+"""Genereert een versleutelde benchmarkdataset.
+
+Leden worden niet één voor één via add_member toegevoegd, maar via de importroute (encrypt_import_batch en
+insert_import_batch): dezelfde codering (record, blinde index en naamtokens), maar zonder een commit en een
+auditlogregel per lid. Dat zou bij de grotere presets uren duren en de gegenereerde auditlog vervuilen.
+"""
+import os
+import json
+import random
+import argparse
+from datetime import date, timedelta
+from connection import get_connection_manager
+from database import initialize_database, insert_user
+from log import log_store
+from member import CITIES
+from member_import import encrypt_import_batch, insert_import_batch, IMPORT_BATCH_SIZE, IMPORT_WORKERS
+
+BENCHMARK_DATABASE = "data/unique_meal.db"
+DATASET_INFO_FILE = "data/benchmark_dataset.json"  # Parameters van de gegenereerde dataset, om deze te kunnen hergebruiken
+BENCHMARK_PASSWORD = "Bench_123?"  # Wachtwoord van alle gegenereerde gebruikers
+DATASET_SEED = 2024
+
+# Standaardgroottes; "large" komt overeen met een grote vereniging met een jarenlange auditlog
+DATASET_PRESETS = {
+    "small": {"members": 1000, "users": 100, "logs": 10000},
+    "medium": {"members": 100000, "users": 10000, "logs": 100000},
+    "large": {"members": 1000000, "users": 10000, "logs": 1000000},
+}
+
+FIRST_NAMES = ["Jan", "Piet", "Klaas", "Anna", "Sophie", "Emma", "Daan", "Lucas", "Julia", "Sem", "Tess", "Finn",
+               "Mila", "Noah", "Sara", "Liam", "Fleur", "Thijs", "Lotte", "Bram"]
+LAST_NAMES = ["de Jong", "Jansen", "de Vries", "van den Berg", "van Dijk", "Bakker", "Janssen", "Visser", "Smit",
+              "Meijer", "de Boer", "Mulder", "de Groot", "Bos", "Vos", "Peters", "Hendriks", "van Leeuwen", "Dekker",
+              "Brouwer"]
+STREETS = ["Dorpsstraat", "Kerkstraat", "Stationsweg", "Molenweg", "Schoolstraat", "Beukenlaan", "Julianastraat"]
+LOG_DESCRIPTIONS = ["Login successful", "Member added", "Member updated", "Member searched", "User logged out",
+                    "Password updated"]
+
+def membership_id_for(number):
+    """Een geldig, uniek lidmaatschapsnummer voor het n-de gegenereerde lid (zelfde opbouw als generate_membership_id)."""
+    base_id = f"24{number:07d}"
+    return base_id + str(sum(int(digit) for digit in base_id) % 10)
+
+def username_for(number):
+    return f"bench_user{number:05d}"
+
+def random_member(rng, number):
+    """Velden van een gegenereerd lid in de volgorde van add_member."""
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    address = (f"{rng.choice(STREETS)} {rng.randint(1, 250)}, {rng.randint(1000, 9999)}"
+               f"{rng.choice('ABCDEFGHJKLMNPRSTVWXZ')}{rng.choice('ABCDEFGHJKLMNPRSTVWXZ')} {rng.choice(CITIES)}")
+    email = f"{first_name.lower()}.{last_name.replace(' ', '').lower()}{number}@example.com"
+    phone = f"+31-6-{rng.randint(0, 99999999):08d}"
+    return (first_name, last_name, rng.randint(18, 90), rng.choice("MF"), round(rng.uniform(45, 130), 1), address,
+            email, phone, membership_id_for(number))
+
+def _generate_members(conn, rng, count, report):
+    """Versleutel de leden parallel met dezelfde codering als add_member en voeg ze via de importroute in blokken toe."""
+    batches = []
+    for start in range(0, count, IMPORT_BATCH_SIZE):
+        batches.append([random_member(rng, number) for number in range(start, min(start + IMPORT_BATCH_SIZE, count))])
+    from concurrent.futures import ThreadPoolExecutor
+    from worker_pool import process_pool
+    with (process_pool(IMPORT_WORKERS) if len(batches) > 1 else ThreadPoolExecutor(max_workers=IMPORT_WORKERS)) as executor:
+        for batch_number, encrypted_rows in enumerate(executor.map(encrypt_import_batch, batches), start=1):
+            insert_import_batch(conn, encrypted_rows)
+            if batch_number % 100 == 0 or batch_number == len(batches):
+                report(f"{min(batch_number * IMPORT_BATCH_SIZE, count)}/{count} leden gegenereerd")
+
+def _generate_users(conn, rng, count, report):
+    for number in range(count):
+        insert_user(conn, username_for(number), BENCHMARK_PASSWORD, rng.choice(["consultant", "system_admin"]),
+                    rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+    report(f"{count} gebruikers gegenereerd")
+
+def _generate_logs(rng, count, users, report):
+    """Schrijf de auditlog via dezelfde opslag als log_activity, verspreid over het afgelopen jaar."""
+    first_day = date.today() - timedelta(days=365)
+    records = []
+    for number in range(count):
+        day = first_day + timedelta(days=number * 365 // max(count, 1))
+        suspicious = "Yes" if rng.random() < 0.01 else "No"
+        records.append((day.strftime('%Y-%m-%d'), f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+                        username_for(rng.randrange(max(users, 1))), rng.choice(LOG_DESCRIPTIONS),
+                        f"Benchmark record {number}", suspicious))
+        if len(records) >= IMPORT_BATCH_SIZE or number == count - 1:
+            log_store.insert_many(records)
+            records = []
+    report(f"{count} logregels gegenereerd")
+
+def generate_dataset(members, users, logs, seed=DATASET_SEED, report=print):
+    """Maak een versleutelde dataset in de data-map van de huidige werkmap; een bestaande identieke dataset wordt hergebruikt.
+
+    Retourneert de parameters van de dataset. Draai dit alleen in een aparte werkmap, nooit naast de echte data.
+    """
+    info = {"members": members, "users": users, "logs": logs, "seed": seed}
+    if os.path.exists(DATASET_INFO_FILE):
+        with open(DATASET_INFO_FILE) as info_file:
+            if json.load(info_file) == info:
+                report("Bestaande benchmarkdataset wordt hergebruikt.")
+                return info
+        raise RuntimeError(f"{os.path.abspath('data')} bevat al een andere dataset")
+    if os.path.exists(BENCHMARK_DATABASE):
+        raise RuntimeError(f"{os.path.abspath(BENCHMARK_DATABASE)} bestaat al en is geen benchmarkdataset")
+
+    os.makedirs("data", exist_ok=True)
+    rng = random.Random(seed)
+    conn = get_connection_manager(BENCHMARK_DATABASE).writer
+    initialize_database(conn)
+    _generate_members(conn, rng, members, report)
+    _generate_users(conn, rng, users, report)
+    _generate_logs(rng, logs, users, report)
+    conn.execute("ANALYZE")
+    conn.commit()
+    with open(DATASET_INFO_FILE, "w") as info_file:
+        json.dump(info, info_file)
+    return info
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genereer een versleutelde benchmarkdataset in een aparte werkmap.")
+    parser.add_argument("directory", help="Werkmap voor de dataset; de data-map daarin wordt aangemaakt")
+    parser.add_argument("--preset", choices=DATASET_PRESETS, default="small")
+    parser.add_argument("--seed", type=int, default=DATASET_SEED)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    os.chdir(args.directory)  # Alle paden van de applicatie zijn relatief aan de werkmap
+    generate_dataset(**DATASET_PRESETS[args.preset], seed=args.seed)
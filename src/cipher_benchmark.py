@@ -0,0 +1,70 @@
+# cipher_benchmark.py
+import os
+import sqlite3
+import argparse
+import tempfile
+import time
+from cryptography.fernet import Fernet, MultiFernet
+from connection import get_connection_manager
+from envelope import DataKeyStore, EnvelopeCipher, CIPHER_BACKENDS
+
+BENCHMARK_FIELDS = 20000  # Aantal velden per meting
+# Typische veldwaarden uit de ledentabel
+SAMPLE_VALUES = ["Jan", "Jansen", "42", "M", "81.5", "Dorpsstraat 12, 1234AB Utrecht", "jan.jansen@example.com",
+                 "+31-6-12345678", "2412345675"]
+
+def _measure(function, values):
+    started = time.perf_counter()
+    results = [function(value) for value in values]
+    return results, time.perf_counter() - started
+
+def _database_size(directory, name, tokens):
+    """Schrijf de versleutelde waarden naar een losse SQLite-database en geef de bestandsgrootte."""
+    path = os.path.join(directory, f"{name}.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE fields (id integer PRIMARY KEY, value)")
+    conn.executemany("INSERT INTO fields (value) VALUES (?)", [(token,) for token in tokens])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path)
+
+def run_benchmark(count=BENCHMARK_FIELDS):
+    """Vergelijk encrypt/decrypt per veld en de opslaggrootte van alle cipher-backends; retourneert een dict per backend."""
+    values = [SAMPLE_VALUES[i % len(SAMPLE_VALUES)] for i in range(count)]
+    results = {}
+    # Werk met tijdelijke sleutels en een tijdelijke database, zodat de echte data ongemoeid blijft
+    with tempfile.TemporaryDirectory() as directory:
+        data_keys = DataKeyStore(os.path.join(directory, "keys.db"), os.path.join(directory, "private_key.pem"),
+                                 os.path.join(directory, "public_key.pem"), os.path.join(directory, "master_keys"))
+        legacy_cipher = MultiFernet([Fernet(Fernet.generate_key())])
+        try:
+            for name in CIPHER_BACKENDS:
+                cipher = EnvelopeCipher(data_keys, legacy_cipher, name)
+                cipher.encrypt_value("warm-up")  # Maak en cache de data key buiten de meting
+                tokens, encrypt_seconds = _measure(cipher.encrypt_value, values)
+                decrypted, decrypt_seconds = _measure(cipher.decrypt_value, tokens)
+                assert decrypted == values
+                results[name] = {
+                    "encrypt_per_second": count / encrypt_seconds,
+                    "decrypt_per_second": count / decrypt_seconds,
+                    "bytes_per_field": sum(len(token) for token in tokens) / count,
+                    "database_bytes": _database_size(directory, name, tokens),
+                }
+        finally:
+            data_keys.close()
+            # Sluit de verbindingen voordat de tijdelijke map wordt verwijderd
+            get_connection_manager(data_keys.database_path).close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vergelijk de snelheid en opslaggrootte van de cipher-backends.")
+    parser.add_argument("--fields", type=int, default=BENCHMARK_FIELDS)
+    args = parser.parse_args()
+
+    plaintext_bytes = sum(len(SAMPLE_VALUES[i % len(SAMPLE_VALUES)]) for i in range(args.fields)) / args.fields
+    print(f"{args.fields} velden, gemiddeld {plaintext_bytes:.1f} bytes platte tekst per veld")
+    print(f"{'backend':<8} {'encrypt/s':>12} {'decrypt/s':>12} {'bytes/veld':>11} {'database':>12}")
+    for name, result in run_benchmark(args.fields).items():
+        print(f"{name:<8} {result['encrypt_per_second']:>12.0f} {result['decrypt_per_second']:>12.0f} "
+              f"{result['bytes_per_field']:>11.1f} {result['database_bytes']:>12}")
@@ -0,0 +1,333 @@
+# connection.py
+import os
+import re
+import time
+import queue
+import sqlite3
+import threading
+import functools
+from contextlib import contextmanager
+import metrics
+
+# Pragma's voor elke verbinding; WAL laat lezers en een schrijver tegelijk werken
+DATABASE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # Negatief = KiB, dus ongeveer 16 MB per verbinding
+    "mmap_size": 64 * 1024 * 1024,
+    "busy_timeout": 5000,  # Milliseconden wachten op een lock in plaats van direct "database is locked"
+}
+READER_POOL_SIZE = 4
+
+TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def statement_key(sql):
+    """Metriek-sleutel voor een SQL-statement: de bewerking en de (eerste) tabel, niet de volledige tekst."""
+    words = sql.split(None, 1)
+    table = TABLE_PATTERN.search(sql)
+    return metrics.metric_key("sql_seconds", operation=words[0].upper() if words else "OTHER",
+                              table=table.group(1) if table else "")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor die de duur van elk statement in de metrics bijhoudt."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.registry.observe(statement_key(sql), time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.registry.observe(statement_key(sql), time.perf_counter() - started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Verbinding waarvan alle statements en commits via InstrumentedCursor gemeten worden."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute slaat een overschreven Cursor.execute over, dus hier via cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.registry.observe(statement_key("COMMIT"), time.perf_counter() - started)
+
+class _SerializedCursorMixin:
+    """Laat elk statement via de schrijflock van de verbinding lopen."""
+
+    def execute(self, sql, parameters=()):
+        with self.connection.statement():
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with self.connection.statement():
+            return super().executemany(sql, seq_of_parameters)
+
+class WriterCursor(_SerializedCursorMixin, sqlite3.Cursor):
+    pass
+
+class InstrumentedWriterCursor(_SerializedCursorMixin, InstrumentedCursor):
+    pass
+
+class WriteLock:
+    """Herintreedbare schrijflock die bijhoudt welke thread hem vasthoudt."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._owner = None  # Ident van de thread die de lock vasthoudt; alleen die thread wijzigt dit
+        self._depth = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self._owner = threading.get_ident()
+        self._depth += 1
+        return True
+
+    def release(self):
+        if not self.held_by_current_thread():
+            raise RuntimeError("cannot release un-acquired lock")
+        self._depth -= 1
+        if not self._depth:
+            self._owner = None
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def held_by_current_thread(self):
+        return self._owner == threading.get_ident()
+
+class WriterConnection(sqlite3.Connection):
+    """De schrijfverbinding: een thread die een transactie opent houdt de schrijflock vast tot de commit of rollback.
+
+    Zo kan code die de verbinding direct gebruikt (zoals het menu) niet door elkaar lopen met transaction() op
+    andere threads, zoals de auditlog; een commit van de ene thread legt nooit half werk van een andere vast.
+    """
+
+    cursor_factory = WriterCursor
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = WriteLock()  # Tot bind() een eigen lock, voor de pragma's bij het openen
+        self._held = False  # Houdt deze verbinding de lock vast voor een open transactie?
+
+    def bind(self, lock):
+        """Gebruik de schrijflock van de ConnectionManager."""
+        self._lock = lock
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _update_hold(self):
+        if self.in_transaction and not self._held:
+            self._lock.acquire()  # Deze thread heeft de lock al; de extra acquire blijft staan tot de commit
+            self._held = True
+        elif not self.in_transaction and self._held:
+            self._held = False
+            self._lock.release()
+
+    @contextmanager
+    def statement(self):
+        with self._lock:
+            was_in_transaction = self.in_transaction
+            try:
+                yield
+            except BaseException:
+                # Een mislukt eerste statement laat een lege transactie open; ruim die op zodat de lock vrijkomt
+                if self.in_transaction and not was_in_transaction:
+                    super().rollback()
+                raise
+            finally:
+                self._update_hold()
+
+    def commit(self):
+        with self._lock:
+            super().commit()
+            self._update_hold()
+
+    def rollback(self):
+        with self._lock:
+            super().rollback()
+            self._update_hold()
+
+    # "with conn:" commit of rollbackt zonder commit() of rollback() aan te roepen
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            try:
+                return super().__exit__(exc_type, exc_value, traceback)
+            finally:
+                self._update_hold()
+
+    def close(self):
+        with self._lock:
+            super().close()
+            if self._held:
+                self._held = False
+                self._lock.release()
+
+class InstrumentedWriterConnection(WriterConnection, InstrumentedConnection):
+    cursor_factory = InstrumentedWriterCursor
+
+class ConnectionManager:
+    """Beheert één geserialiseerde schrijfverbinding en een pool van leesverbindingen per databasebestand."""
+
+    def __init__(self, db_file, pool_size=READER_POOL_SIZE, **pragmas):
+        self.db_file = db_file
+        self.pool_size = pool_size
+        self.pragmas = {**DATABASE_PRAGMAS, **pragmas}
+        self._writer = None
+        self._write_lock = WriteLock()
+        self._in_transaction_block = False  # Loopt er een (buitenste) transaction()? Alleen te lezen met de lock
+        self._readers = queue.Queue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._reader_available = threading.Condition(self._reader_lock)
+        self._loaned = 0  # Uitgeleende leesverbindingen
+        self._exclusive = False  # Zolang exclusive() loopt worden geen leesverbindingen uitgeleend
+
+    def connect(self, read_only=False, factory=None):
+        """Open een nieuwe verbinding met de ingestelde pragma's."""
+        # Alleen met metrics aan een gemeten verbinding; anders de gewone sqlite3.Connection zonder extra kosten
+        factory = factory or (InstrumentedConnection if metrics.METRICS_ENABLED else sqlite3.Connection)
+        conn = sqlite3.connect(self.db_file, timeout=self.pragmas["busy_timeout"] / 1000, check_same_thread=False,
+                               factory=factory)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            conn.execute("PRAGMA query_only=1")
+        return conn
+
+    @property
+    def writer(self):
+        """De gedeelde schrijfverbinding; gebruik transaction() als meerdere threads schrijven."""
+        if self._writer is None:
+            with self._write_lock:
+                if self._writer is None:
+                    writer = self.connect(factory=InstrumentedWriterConnection if metrics.METRICS_ENABLED else WriterConnection)
+                    writer.bind(self._write_lock)
+                    self._writer = writer
+        return self._writer
+
+    def holds_write_lock(self):
+        """Heeft de huidige thread de schrijfverbinding in gebruik (in transaction() of met een open transactie)?"""
+        return self._write_lock.held_by_current_thread()
+
+    @contextmanager
+    def transaction(self):
+        """Geef de schrijfverbinding exclusief en commit (of rollback bij een fout) aan het einde.
+
+        Genest in een andere transaction() op dezelfde thread doet het blok mee met de buitenste transactie.
+        """
+        with self._write_lock:
+            conn = self.writer
+            if self._in_transaction_block:
+                yield conn
+                return
+            self._in_transaction_block = True
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._in_transaction_block = False
+
+    @contextmanager
+    def reader(self):
+        """Leen een leesverbinding uit de pool."""
+        with self._reader_available:
+            while self._exclusive:
+                self._reader_available.wait()
+            self._loaned += 1
+        try:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                with self._reader_lock:
+                    can_open = self._reader_count < self.pool_size
+                    if can_open:
+                        self._reader_count += 1
+                conn = self.connect(read_only=True) if can_open else self._readers.get()
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+        finally:
+            with self._reader_available:
+                self._loaned -= 1
+
+    @contextmanager
+    def exclusive(self):
+        """Neem de database over, bijvoorbeeld om de bestanden om te wisselen; andere threads wachten tot het blok klaar is.
+
+        De WAL wordt eerst in de database verwerkt en alle verbindingen worden gesloten. Weigert met een
+        OperationalError als er nog een verbinding in gebruik is, ook als dat een ander proces is.
+        """
+        with self._write_lock:
+            with self._reader_available:
+                if self._loaned:
+                    raise sqlite3.OperationalError("database is in use by another connection")
+                self._exclusive = True
+            try:
+                if self._writer is not None and self._writer.in_transaction:
+                    raise sqlite3.OperationalError("database has an open transaction")
+                busy, _, _ = self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                if busy:
+                    raise sqlite3.OperationalError("database is in use by another process")
+                self.close()
+                # De laatste verbinding ruimt de WAL op; blijft deze staan, dan heeft een ander proces de database open
+                if os.path.exists(self.db_file + "-wal"):
+                    raise sqlite3.OperationalError("database is in use by another process")
+                yield
+            finally:
+                with self._reader_available:
+                    self._exclusive = False
+                    self._reader_available.notify_all()
+
+    def close(self):
+        """Sluit alle verbindingen; daarna worden bij gebruik nieuwe geopend."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._reader_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._reader_count = 0
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_file):
+    """Geef de ConnectionManager voor een databasebestand (één per proces)."""
+    with _managers_lock:
+        if db_file not in _managers:
+            _managers[db_file] = ConnectionManager(db_file)
+        return _managers[db_file]
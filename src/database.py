@@ -1,26 +1,39 @@
 import sqlite3
 from datetime import datetime
-from encrypt_decrypt import encrypt_data, decrypt_data
+from connection import get_connection_manager
+from encrypt_decrypt import encrypt_data, encrypt_many, decrypt_data, blind_index
+from envelope import create_data_keys_table
+from member_record import decrypt_member_record
+from name_index import create_name_index_table, rebuild_name_index
+from log import import_legacy_logs
 from utils import hash_password  # Gebruik de hash_password-functie vanuit utils
 import logging
 from sqlite3 import Error
 
+# Verhoog bij elke wijziging in create_tables, migrate_database of de vaste gebruikers
+SCHEMA_VERSION = 3
+
 def create_connection(db_file):
-    """Maak een databaseverbinding naar het SQLite databasebestand."""
+    """Geef de schrijfverbinding van de ConnectionManager voor het SQLite databasebestand."""
     conn = None
     try:
-        conn = sqlite3.connect(db_file)
+        conn = get_connection_manager(db_file).writer
         print(f"SQLite verbinding is succesvol: {sqlite3.version}")
     except Error as e:
         print(e)
     return conn
 
+def close_connections(db_file):
+    """Sluit alle verbindingen van de ConnectionManager, bijvoorbeeld voor het terugzetten van een back-up."""
+    get_connection_manager(db_file).close()
+
 def create_tables(conn):
     """Maak de benodigde tabellen aan."""
     try:
         sql_create_users_table = """CREATE TABLE IF NOT EXISTS users (
                                     id integer PRIMARY KEY,
-                                    username text NOT NULL UNIQUE,  # Voeg UNIQUE constraint toe
+                                    username text NOT NULL UNIQUE,  -- Voeg UNIQUE constraint toe
+                                    username_hash text,
                                     password text NOT NULL,
                                     role text NOT NULL,
                                     first_name text NOT NULL,
@@ -39,26 +52,136 @@ def create_tables(conn):
                                       email text,
                                       phone text,
                                       registration_date text NOT NULL,
-                                      membership_id text NOT NULL
+                                      membership_id text NOT NULL,
+                                      membership_id_hash text,
+                                      record text  -- Alle gevoelige velden als één versleuteld record (zie member_record.py)
                                   );"""
 
         sql_create_logs_table = """CREATE TABLE IF NOT EXISTS logs (
                                    id integer PRIMARY KEY,
-                                   date text NOT NULL,
+                                   date text NOT NULL,  -- YYYY-MM-DD zodat datumbereiken via de index lopen
                                    time text NOT NULL,
                                    username text,
                                    description text NOT NULL,
                                    additional_info text,
-                                   suspicious text NOT NULL
+                                   suspicious integer NOT NULL
                                );"""
 
+        sql_create_log_watermarks_table = """CREATE TABLE IF NOT EXISTS log_watermarks (
+                                             user_id integer PRIMARY KEY,
+                                             last_seen_id integer NOT NULL
+                                         );"""
+
         cursor = conn.cursor()
         cursor.execute(sql_create_users_table)
         cursor.execute(sql_create_members_table)
         cursor.execute(sql_create_logs_table)
+        cursor.execute(sql_create_log_watermarks_table)
+        create_data_keys_table(conn)
+    except Error as e:
+        conn.rollback()
+        print(e)
+
+def add_column_if_missing(conn, table, column, definition):
+    """Voeg een kolom toe aan een bestaande tabel als deze nog ontbreekt."""
+    cur = conn.cursor()
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def migrate_username_index(conn):
+    """Voeg de blinde index op gebruikersnamen toe en vul deze voor bestaande gebruikers."""
+    try:
+        add_column_if_missing(conn, "users", "username_hash", "text")
+        cur = conn.cursor()
+        cur.execute("SELECT id, username FROM users WHERE username_hash IS NULL")
+        updates = []
+        for user_id, encrypted_username in cur.fetchall():
+            try:
+                updates.append((blind_index(decrypt_data(encrypted_username)), user_id))
+            except Exception as e:
+                logging.error(f"Error indexing username for user ID {user_id}: {e}")
+        cur.executemany("UPDATE users SET username_hash=? WHERE id=?", updates)
+        # UNIQUE, zodat de CLI en de service (aparte processen) niet allebei dezelfde gebruikersnaam kunnen toevoegen
+        cur.execute("DROP INDEX IF EXISTS idx_users_username_hash")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_hash_unique ON users (username_hash)")
+        conn.commit()
+    except Error as e:
+        conn.rollback()
+        logging.error(f"Error creating unique username index: {e}")
+        print(e)
+
+def migrate_membership_id_index(conn):
+    """Voeg de blinde index op lidmaatschapsnummers toe en vul deze voor bestaande leden."""
+    try:
+        add_column_if_missing(conn, "members", "membership_id_hash", "text")
+        cur = conn.cursor()
+        cur.execute("SELECT id, membership_id, record FROM members WHERE membership_id_hash IS NULL")
+        updates = []
+        for member_id, encrypted_membership_id, record in cur.fetchall():
+            try:
+                membership_id = decrypt_member_record(record)["membership_id"] if record is not None else decrypt_data(encrypted_membership_id)
+                updates.append((blind_index(membership_id, "membership_id"), member_id))
+            except Exception as e:
+                logging.error(f"Error indexing membership ID for member ID {member_id}: {e}")
+        cur.executemany("UPDATE members SET membership_id_hash=? WHERE id=?", updates)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_members_membership_id_hash ON members (membership_id_hash)")
+        conn.commit()
+    except Error as e:
+        conn.rollback()
+        print(e)
+
+def migrate_member_records_column(conn):
+    """Voeg de kolom voor het record-formaat toe; bestaande leden zet member_record.py online om."""
+    try:
+        add_column_if_missing(conn, "members", "record", "text")
+        conn.commit()
+    except Error as e:
+        conn.rollback()
+        print(e)
+
+def migrate_name_index(conn):
+    """Maak de naamzoekindex aan en vul deze eenmalig voor bestaande leden."""
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='member_name_tokens'")
+        if cur.fetchone():
+            return
+        create_name_index_table(conn)
+        rebuild_name_index(conn)
     except Error as e:
+        conn.rollback()
         print(e)
 
+def migrate_logs_table(conn):
+    """Voeg de indexen op de logs-tabel toe en importeer eenmalig de oude CSV-logs."""
+    try:
+        cur = conn.cursor()
+        cur.execute("PRAGMA table_info(logs)")
+        columns = [row[1] for row in cur.fetchall()]
+        if "activity" in columns and "description" not in columns:
+            cur.execute("ALTER TABLE logs RENAME COLUMN activity TO description")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_date ON logs (date, time)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_suspicious ON logs (suspicious, id)")
+        conn.commit()
+        imported, skipped = import_legacy_logs(conn)
+        if imported:
+            print(f"{imported} logregels geïmporteerd uit de oude CSV-logs.")
+        if skipped:
+            logging.warning(f"Skipped {skipped} unreadable legacy log rows")
+            print(f"{skipped} onleesbare logregels overgeslagen.")
+    except Error as e:
+        conn.rollback()
+        print(e)
+
+def migrate_database(conn):
+    """Breng een bestaande database naar het huidige schema."""
+    migrate_username_index(conn)
+    migrate_member_records_column(conn)
+    migrate_membership_id_index(conn)
+    migrate_name_index(conn)
+    migrate_logs_table(conn)
+
 def add_super_admin(conn):
     """Voeg de super admin gebruiker toe als deze nog niet bestaat."""
     try:
@@ -73,32 +196,49 @@ def add_super_admin(conn):
 
         # Voeg super_admin toe als deze nog niet bestaat
         encrypted_username = encrypt_data("super_admin")  # Versleutel de gebruikersnaam
-        sql = """INSERT INTO users (username, password, role, first_name, last_name, registration_date)
-                 VALUES (?, ?, 'super_admin', 'Super', 'Admin', ?)"""
-        cur.execute(sql, (encrypted_username, hashed_password, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        sql = """INSERT INTO users (username, username_hash, password, role, first_name, last_name, registration_date)
+                 VALUES (?, ?, ?, 'super_admin', 'Super', 'Admin', ?)"""
+        cur.execute(sql, (encrypted_username, blind_index("super_admin"), hashed_password, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         conn.commit()
         print("Super admin toegevoegd.")
     except Error as e:
+        conn.rollback()
         print(e)
 
+def get_schema_version(conn):
+    """De schemaversie die in de database staat (0 voor een nieuwe of oudere database)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def initialize_database(conn):
+    """Maak en migreer het schema en voeg de super admin toe, maar alleen als de database niet al actueel is."""
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return False
+    create_tables(conn)
+    migrate_database(conn)
+    add_super_admin(conn)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    logging.info(f"Database schema initialized at version {SCHEMA_VERSION}")
+    return True
+
 def insert_user(conn, username, password, role, first_name, last_name):
     """Voeg een nieuwe gebruiker toe aan de database."""
-    encrypted_username = encrypt_data(username)  # Encrypt de gebruikersnaam
+    encrypted_username, encrypted_first_name, encrypted_last_name = encrypt_many([username, first_name, last_name])
     hashed_password = hash_password(password)    # Hash het wachtwoord voor opslag
-    encrypted_first_name = encrypt_data(first_name)
-    encrypted_last_name = encrypt_data(last_name)
 
     try:
-        sql = """INSERT INTO users (username, password, role, first_name, last_name, registration_date)
-                 VALUES (?, ?, ?, ?, ?, ?)"""
+        sql = """INSERT INTO users (username, username_hash, password, role, first_name, last_name, registration_date)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)"""
         cur = conn.cursor()
-        cur.execute(sql, (encrypted_username, hashed_password, role, encrypted_first_name, encrypted_last_name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        cur.execute(sql, (encrypted_username, blind_index(username), hashed_password, role, encrypted_first_name, encrypted_last_name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         conn.commit()
         return cur.lastrowid  # Retourneer het ID van de toegevoegde gebruiker
     except sqlite3.IntegrityError as e:
-        logging.error(f"Error adding user: {e}")
+        conn.rollback()
+        logging.error(f"Error adding user, username already exists: {e}")
         return None
     except Exception as e:
+        conn.rollback()
         logging.error(f"Error adding user: {e}")
         return None
 
@@ -111,6 +251,7 @@ def remove_user(conn, user_id):
         conn.commit()
         return cur.rowcount  # Geeft het aantal verwijderde rijen terug
     except Error as e:
+        conn.rollback()
         logging.error(f"Error deleting user: {e}")
         return 0
 
@@ -1,32 +1,134 @@
 # encrypt_decrypt.py
 
 import hashlib
-from cryptography.fernet import Fernet
+import hmac
+import os
+import secrets
+import threading
+import metrics
+from envelope import DataKeyStore, EnvelopeCipher
+
+KEY_FILE = "data/secret.key"  # Sleutels voor waarden van vóór envelope-encryptie, één per regel; alleen nog om te ontsleutelen
+INDEX_KEY_FILE = "data/index.key"
+# "fernet" slaat base64-tekst op; "aesgcm" binaire BLOBs (kleiner en sneller). Beide formaten blijven leesbaar.
+CIPHER_BACKEND = os.environ.get("UNIQUE_MEAL_CIPHER_BACKEND", "fernet")
+
+class KeyManager:
+    """Laadt de sleutels één keer per proces en houdt het Fernet-object in het geheugen."""
+
+    def __init__(self, key_file=KEY_FILE, index_key_file=INDEX_KEY_FILE):
+        self.key_file = key_file
+        self.index_key_file = index_key_file
+        self._cipher = None
+        self._keys = None
+        self._index_key = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.data_keys = DataKeyStore()
+
+    def _load(self):
+        """Lees de sleutel van schijf en genereer deze als ze nog niet bestaat."""
+        # cryptography pas laden bij het eerste gebruik van het cipher, niet bij het importeren
+        from cryptography.fernet import Fernet, MultiFernet
+        if not os.path.exists(self.key_file):
+            with open(self.key_file, "wb") as key_file:
+                key_file.write(Fernet.generate_key())
+        with open(self.key_file, "rb") as key_file:
+            keys = [line.strip() for line in key_file.read().splitlines() if line.strip()]
+        self._keys = keys
+        self._cipher = EnvelopeCipher(self.data_keys, MultiFernet([Fernet(key) for key in keys]), CIPHER_BACKEND)
+        self._mtime = os.stat(self.key_file).st_mtime_ns
+
+    @property
+    def cipher(self) -> EnvelopeCipher:
+        """Het gedeelde cipher-object voor dit proces; versleutelt met de actieve data key."""
+        if self._cipher is None:
+            with self._lock:
+                if self._cipher is None:
+                    self._load()
+        return self._cipher
+
+    @property
+    def keys(self) -> list:
+        """Alle geladen sleutels uit het sleutelbestand, de nieuwste eerst."""
+        self.cipher
+        return list(self._keys)
+
+    @property
+    def index_key(self) -> bytes:
+        """De sleutel voor de blinde index, gegenereerd als ze nog niet bestaat."""
+        if self._index_key is None:
+            with self._lock:
+                if self._index_key is None:
+                    if not os.path.exists(self.index_key_file):
+                        with open(self.index_key_file, "wb") as key_file:
+                            key_file.write(secrets.token_bytes(32))
+                    with open(self.index_key_file, "rb") as key_file:
+                        self._index_key = key_file.read()
+        return self._index_key
+
+    def set_database(self, database_path):
+        """Gebruik de data keys uit een andere database, bijvoorbeeld voor een opdracht met --database."""
+        with self._lock:
+            if database_path != self.data_keys.database_path:
+                self.data_keys = DataKeyStore(database_path)
+                self._cipher = None  # Het volgende gebruik bouwt het cipher op met de nieuwe data keys
+
+    def reload(self):
+        """Laad de sleutel opnieuw van schijf, bijvoorbeeld na een sleutelwissel."""
+        with self._lock:
+            self._load()
+
+    def reload_if_changed(self):
+        """Laad de sleutel opnieuw als het sleutelbestand is gewijzigd en kijk of er een nieuwe data key actief is."""
+        if self._cipher is None:
+            return
+        self.data_keys.refresh()
+        try:
+            mtime = os.stat(self.key_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+key_manager = KeyManager()
 
 def load_key():
-    """Laad de eerder gegenereerde sleutel."""
-    key = open("data/secret.key", "rb").read()
-    return key
-
-def encrypt_data(data: str) -> str:
-    """Versleutel data en retourneer als een string."""
-    key = load_key()
-    f = Fernet(key)
-    encrypted_data = f.encrypt(data.encode())
-    return encrypted_data.decode()
-
-def decrypt_data(encrypted_data: str) -> str:
-    """Desleutel data van een string."""
-    key = load_key()
-    f = Fernet(key)
-    decrypted_data = f.decrypt(encrypted_data.encode())
-    return decrypted_data.decode()
+    """Laad de huidige sleutel."""
+    return key_manager.keys[0]
+
+@metrics.timed("crypto_seconds", operation="encrypt")
+def encrypt_data(data: str):
+    """Versleutel data en retourneer de kolomwaarde (een string, of bytes bij een binair backend)."""
+    return key_manager.cipher.encrypt_value(data)
+
+@metrics.timed("crypto_seconds", operation="decrypt")
+def decrypt_data(encrypted_data) -> str:
+    """Desleutel een kolomwaarde (string of bytes)."""
+    return key_manager.cipher.decrypt_value(encrypted_data)
+
+@metrics.timed("crypto_seconds", operation="encrypt_many")
+def encrypt_many(values):
+    """Versleutel een reeks velden in één keer; None blijft None."""
+    cipher = key_manager.cipher
+    return [None if value is None else cipher.encrypt_value(value) for value in values]
+
+@metrics.timed("crypto_seconds", operation="decrypt_many")
+def decrypt_many(values):
+    """Desleutel een reeks velden in één keer; None blijft None."""
+    cipher = key_manager.cipher
+    return [None if value is None else cipher.decrypt_value(value) for value in values]
 
 def hash_username(username: str) -> str:
     """Maak een hash van de gebruikersnaam voor consistente opslag."""
     hashed = hashlib.sha256(username.encode()).hexdigest()
     return hashed
 
+def blind_index(value: str, context: str = "username") -> str:
+    """Maak een HMAC van een waarde zodat versleutelde kolommen op gelijkheid doorzocht kunnen worden."""
+    message = f"{context}:{value}".encode()
+    return hmac.new(key_manager.index_key, message, hashlib.sha256).hexdigest()
+
 def hash_password(password: str) -> str:
     """Maak een hash van het wachtwoord."""
     return hashlib.sha256(password.encode()).hexdigest()
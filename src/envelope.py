@@ -0,0 +1,405 @@
+# envelope.py
+import os
+import sys
+import base64
+import sqlite3
+import struct
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from connection import get_connection_manager
+from generate_keys import generate_key_pair, PRIVATE_KEY_FILE, PUBLIC_KEY_FILE
+
+DATA_KEY_DATABASE = "data/unique_meal.db"
+TAG_PREFIX = b"k"  # Fernet-waarden zien eruit als k<key-id>:<Fernet-token>
+AEAD_FORMAT_VERSION = 1  # Eerste byte van een AES-GCM BLOB; kan niet samenvallen met tekst-tokens
+AEAD_HEADER = struct.Struct(">BI")  # Formaatversie en data key id, geauthenticeerd als associated data
+AEAD_NONCE_SIZE = 12
+MASTER_KEY_ARCHIVE_DIR = "data/master_keys"  # Vorige private keys per vingerafdruk; oudere back-ups hebben ze nodig
+
+# cryptography wordt pas bij het eerste gebruik geladen; het opstarten van de applicatie heeft het niet nodig
+
+def _oaep_padding():
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    return padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+def _invalid_token():
+    from cryptography.fernet import InvalidToken
+    return InvalidToken()
+
+def create_data_keys_table(conn):
+    """Maak de tabel voor de verpakte data keys aan."""
+    conn.execute("""CREATE TABLE IF NOT EXISTS data_keys (
+                        id integer PRIMARY KEY,
+                        wrapped_key blob NOT NULL,  -- Fernet-sleutel, versleuteld met de publieke RSA-sleutel
+                        master_key_id text NOT NULL,
+                        created text NOT NULL,
+                        active integer NOT NULL DEFAULT 0
+                    );""")
+
+def master_key_id(public_key):
+    """Vingerafdruk van een publieke sleutel, om te zien met welke master key een data key verpakt is."""
+    from cryptography.hazmat.primitives import serialization
+    der = public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return hashlib.sha256(der).hexdigest()[:16]
+
+def _load_private_key(path):
+    from cryptography.hazmat.primitives import serialization
+    with open(path, "rb") as key_file:
+        return serialization.load_pem_private_key(key_file.read(), password=None)
+
+class DataKeyStore:
+    """Beheert de data keys in de database; uitgepakte sleutels blijven de hele sessie in het geheugen."""
+
+    def __init__(self, database_path=DATA_KEY_DATABASE, private_key_file=PRIVATE_KEY_FILE, public_key_file=PUBLIC_KEY_FILE,
+                 archive_dir=MASTER_KEY_ARCHIVE_DIR):
+        self.database_path = database_path
+        self.private_key_file = private_key_file
+        self.public_key_file = public_key_file
+        self.archive_dir = archive_dir
+        self._table_ready = False
+        self._private_keys = None
+        self._public_key = None
+        self._keys = {}
+        self._ciphers = {}
+        self._aeads = {}
+        self._active = None
+        self._lock = threading.RLock()
+
+    @property
+    def manager(self):
+        # Schrijven via de geserialiseerde schrijfverbinding van de applicatie, lezen via de leespool
+        manager = get_connection_manager(self.database_path)
+        if not self._table_ready:
+            with self._lock, manager.transaction() as conn:
+                create_data_keys_table(conn)
+            self._table_ready = True
+        return manager
+
+    def _fetchall(self, sql, parameters=()):
+        with self.manager.reader() as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def close(self):
+        """Vergeet de uitgepakte sleutels, bijvoorbeeld na het terugzetten van een back-up."""
+        with self._lock:
+            self._table_ready = False
+            self._keys, self._ciphers, self._aeads = {}, {}, {}
+            self._active = None
+            self._private_keys = None
+            self._public_key = None
+
+    @property
+    def public_key(self):
+        if self._public_key is None:
+            with self._lock:
+                if not os.path.exists(self.private_key_file):
+                    generate_key_pair(self.private_key_file, self.public_key_file)
+                from cryptography.hazmat.primitives import serialization
+                with open(self.public_key_file, "rb") as key_file:
+                    self._public_key = serialization.load_pem_public_key(key_file.read())
+        return self._public_key
+
+    def _private_key(self, key_id):
+        """De private key met de gegeven vingerafdruk; ook gearchiveerde sleutels en een half voltooide rotatie (.new) tellen mee."""
+        if self._private_keys is None:
+            self._private_keys = {}
+            for path in (*self._archived_key_files().values(), self.private_key_file, self.private_key_file + ".new"):
+                if os.path.exists(path):
+                    private_key = _load_private_key(path)
+                    self._private_keys[master_key_id(private_key.public_key())] = private_key
+        if key_id not in self._private_keys:
+            raise _invalid_token()
+        return self._private_keys[key_id]
+
+    def _key(self, dek_id):
+        """De uitgepakte data key; alleen de eerste keer is de private key nodig."""
+        key = self._keys.get(dek_id)
+        if key is None:
+            rows = self._fetchall("SELECT wrapped_key, master_key_id FROM data_keys WHERE id=?", (dek_id,))
+            if not rows:
+                raise _invalid_token()
+            wrapped_key, key_id = rows[0]
+            with self._lock:
+                key = self._keys[dek_id] = self._private_key(key_id).decrypt(wrapped_key, _oaep_padding())
+        return key
+
+    def cipher(self, dek_id):
+        """Het Fernet-object voor een data key."""
+        cipher = self._ciphers.get(dek_id)
+        if cipher is None:
+            from cryptography.fernet import Fernet
+            cipher = self._ciphers[dek_id] = Fernet(self._key(dek_id))
+        return cipher
+
+    def aead(self, dek_id):
+        """Het AES-GCM-object voor een data key, met een eigen afgeleide sleutel naast die van Fernet."""
+        aead = self._aeads.get(dek_id)
+        if aead is None:
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+            hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"unique-meal aes-gcm")
+            aead = self._aeads[dek_id] = AESGCM(hkdf.derive(base64.urlsafe_b64decode(self._key(dek_id))))
+        return aead
+
+    def active(self):
+        """(id, Fernet) van de data key waarmee nieuwe waarden versleuteld worden."""
+        active = self._active
+        if active is None:
+            rows = self._fetchall("SELECT id FROM data_keys WHERE active=1 ORDER BY id DESC LIMIT 1")
+            if not rows:
+                # Via de schrijflock, zodat gelijktijdige aanroepen samen één nieuwe data key maken
+                with self.manager.transaction():
+                    rows = self._fetchall("SELECT id FROM data_keys WHERE active=1 ORDER BY id DESC LIMIT 1")
+                    if not rows:
+                        self.create_data_key()
+                        return self._active
+            with self._lock:
+                self._active = active = (rows[0][0], self.cipher(rows[0][0]))
+        return active
+
+    def refresh(self):
+        """Kijk of een ander proces een nieuwe data key actief heeft gemaakt."""
+        if self._active is None:
+            return
+        rows = self._fetchall("SELECT id FROM data_keys WHERE active=1 ORDER BY id DESC LIMIT 1")
+        with self._lock:
+            if rows and rows[0][0] != self._active[0]:
+                self._active = (rows[0][0], self.cipher(rows[0][0]))
+
+    def create_data_key(self):
+        """Maak een nieuwe data key, verpak deze met de publieke sleutel en maak hem actief."""
+        from cryptography.fernet import Fernet
+        key = Fernet.generate_key()
+        wrapped_key = self.public_key.encrypt(key, _oaep_padding())
+        # Eerst de schrijflock en dan self._lock, zoals elke thread die tijdens een transactie versleutelt
+        with self.manager.transaction() as conn, self._lock:
+            # De sleutel moet vastliggen voordat er iets mee versleuteld wordt; een open transactie kan nog teruggedraaid worden
+            if conn.in_transaction:
+                raise sqlite3.OperationalError("cannot create a data key inside an open transaction")
+            conn.execute("UPDATE data_keys SET active=0 WHERE active=1")
+            cur = conn.execute("INSERT INTO data_keys (wrapped_key, master_key_id, created, active) VALUES (?, ?, ?, 1)",
+                               (wrapped_key, master_key_id(self.public_key), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            dek_id = cur.lastrowid
+            conn.commit()  # Ook binnen een omringende transaction() direct vastleggen
+            self._keys[dek_id] = key
+            self._active = (dek_id, self.cipher(dek_id))
+        return dek_id
+
+    def active_since(self):
+        """Tijdstip (YYYY-MM-DD HH:MM:SS) waarop de actieve data key is gemaakt, of None als er nog geen is."""
+        rows = self._fetchall("SELECT created FROM data_keys WHERE active=1 ORDER BY id DESC LIMIT 1")
+        return rows[0][0] if rows else None
+
+    def remove_inactive_data_keys(self):
+        """Verwijder data keys die niet meer actief zijn; alleen veilig als alle data opnieuw versleuteld is."""
+        with self.manager.transaction() as conn, self._lock:
+            removed = conn.execute("DELETE FROM data_keys WHERE active=0").rowcount
+            self._keys, self._ciphers, self._aeads = {}, {}, {}
+            self._active = None
+        return removed
+
+    def rotate_master_key(self):
+        """Vervang het RSA-sleutelpaar; alleen de data keys worden opnieuw verpakt, de data blijft ongewijzigd."""
+        new_private_file = self.private_key_file + ".new"
+        new_public_file = self.public_key_file + ".new"
+        with self.manager.transaction() as conn, self._lock:
+            rows = conn.execute("SELECT id, wrapped_key, master_key_id FROM data_keys").fetchall()
+            if not os.path.exists(new_private_file):
+                generate_key_pair(new_private_file, new_public_file)
+            self._private_keys = None  # Laad ook de nieuwe private key
+            new_private_key = _load_private_key(new_private_file)
+            new_key_id = master_key_id(new_private_key.public_key())
+
+            rewrapped = []
+            for dek_id, wrapped_key, key_id in rows:
+                if key_id != new_key_id:
+                    key = self._private_key(key_id).decrypt(wrapped_key, _oaep_padding())
+                    rewrapped.append((new_private_key.public_key().encrypt(key, _oaep_padding()), new_key_id, dek_id))
+            conn.executemany("UPDATE data_keys SET wrapped_key=?, master_key_id=? WHERE id=?", rewrapped)
+
+        # Pas na de commit de bestanden omwisselen; tot die tijd blijft de .new sleutel bruikbaar.
+        # De oude private key gaat naar het archief: back-ups van vóór de rotatie zijn er nog mee verpakt
+        with self._lock:
+            self._archive_private_key()
+            os.replace(new_public_file, self.public_key_file)
+            os.replace(new_private_file, self.private_key_file)
+            self._private_keys = None
+            self._public_key = None
+        return len(rewrapped)
+
+    def _archived_key_files(self):
+        """{vingerafdruk: pad} van de gearchiveerde private keys."""
+        if not os.path.isdir(self.archive_dir):
+            return {}
+        return {name[:-len(".pem")]: os.path.join(self.archive_dir, name)
+                for name in sorted(os.listdir(self.archive_dir)) if name.endswith(".pem")}
+
+    def _archive_private_key(self):
+        """Bewaar de huidige private key onder zijn vingerafdruk in het archief."""
+        if not os.path.exists(self.private_key_file):
+            return
+        key_id = master_key_id(_load_private_key(self.private_key_file).public_key())
+        archived_file = os.path.join(self.archive_dir, f"{key_id}.pem")
+        if os.path.exists(archived_file):
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with open(self.private_key_file, "rb") as key_file:
+            pem = key_file.read()
+        fd = os.open(archived_file + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as archive_file:
+            archive_file.write(pem)
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        os.replace(archived_file + ".tmp", archived_file)
+
+    def retire_master_keys(self, referenced_ids):
+        """Verwijder gearchiveerde private keys die geen data key en geen back-up (referenced_ids) meer nodig heeft.
+
+        Retourneert de vingerafdrukken van de verwijderde sleutels.
+        """
+        in_use = {row[0] for row in self._fetchall("SELECT DISTINCT master_key_id FROM data_keys")}
+        with self._lock:
+            if os.path.exists(self.private_key_file):
+                in_use.add(master_key_id(_load_private_key(self.private_key_file).public_key()))
+            retired = []
+            for key_id, path in self._archived_key_files().items():
+                if key_id not in in_use and key_id not in referenced_ids:
+                    os.remove(path)
+                    retired.append(key_id)
+            self._private_keys = None
+        return retired
+
+class FernetBackend:
+    """Base64-tekst k<key-id>:<Fernet-token> (AES-128-CBC met HMAC-SHA256); past in text-kolommen."""
+
+    binary = False
+
+    def __init__(self, data_keys):
+        self.data_keys = data_keys
+
+    def header(self, dek_id):
+        return TAG_PREFIX + str(dek_id).encode() + b":"
+
+    def owns(self, token):
+        tag, separator, _ = token.partition(b":")
+        return tag.startswith(TAG_PREFIX) and separator == b":" and tag[len(TAG_PREFIX):].isdigit()
+
+    def data_key_id(self, token):
+        return int(token.partition(b":")[0][len(TAG_PREFIX):])
+
+    def encrypt(self, dek_id, data):
+        return self.header(dek_id) + self.data_keys.cipher(dek_id).encrypt(data)
+
+    def decrypt(self, token):
+        return self.data_keys.cipher(self.data_key_id(token)).decrypt(token.partition(b":")[2])
+
+class AesGcmBackend:
+    """Binaire BLOB: versie (1 byte), data key id (4 bytes), nonce (12 bytes), ciphertext met GCM-tag."""
+
+    binary = True
+
+    def __init__(self, data_keys):
+        self.data_keys = data_keys
+
+    def header(self, dek_id):
+        return AEAD_HEADER.pack(AEAD_FORMAT_VERSION, dek_id)
+
+    def owns(self, token):
+        return token[:1] == bytes([AEAD_FORMAT_VERSION])
+
+    def data_key_id(self, token):
+        if len(token) < AEAD_HEADER.size:
+            raise _invalid_token()
+        return AEAD_HEADER.unpack_from(token)[1]
+
+    def encrypt(self, dek_id, data):
+        header = self.header(dek_id)
+        nonce = os.urandom(AEAD_NONCE_SIZE)
+        return header + nonce + self.data_keys.aead(dek_id).encrypt(nonce, data, header)
+
+    def decrypt(self, token):
+        if len(token) < AEAD_HEADER.size + AEAD_NONCE_SIZE + 16:
+            raise _invalid_token()
+        dek_id = self.data_key_id(token)
+        header = token[:AEAD_HEADER.size]
+        nonce = token[AEAD_HEADER.size:AEAD_HEADER.size + AEAD_NONCE_SIZE]
+        from cryptography.exceptions import InvalidTag
+        try:
+            return self.data_keys.aead(dek_id).decrypt(nonce, token[AEAD_HEADER.size + AEAD_NONCE_SIZE:], header)
+        except InvalidTag:
+            raise _invalid_token()
+
+CIPHER_BACKENDS = {"fernet": FernetBackend, "aesgcm": AesGcmBackend}
+
+class EnvelopeCipher:
+    """Gedraagt zich als Fernet, maar versleutelt met de actieve data key via het gekozen backend.
+
+    Bij het ontsleutelen bepaalt de header welk backend een waarde heeft gemaakt; waarden zonder header komen
+    uit de tijd vóór envelope-encryptie en worden met de oude sleutels ontsleuteld.
+    """
+
+    def __init__(self, data_keys, legacy_cipher, backend="fernet"):
+        self.data_keys = data_keys
+        self.legacy_cipher = legacy_cipher
+        self.backends = {name: backend_class(data_keys) for name, backend_class in CIPHER_BACKENDS.items()}
+        self.backend = self.backends[backend]
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self.backend.encrypt(self.data_keys.active()[0], data)
+
+    def decrypt(self, token: bytes) -> bytes:
+        for backend in self.backends.values():
+            if backend.owns(token):
+                return backend.decrypt(token)
+        return self.legacy_cipher.decrypt(token)
+
+    def rotate(self, token: bytes) -> bytes:
+        """Versleutel een waarde opnieuw met de actieve data key en het actieve backend."""
+        return self.encrypt(self.decrypt(token))
+
+    def is_current(self, token: bytes) -> bool:
+        """Is deze waarde al met de actieve data key en het actieve backend versleuteld?"""
+        return token.startswith(self.backend.header(self.data_keys.active()[0]))
+
+    def data_key_id(self, value):
+        """Id van de data key van een kolomwaarde, of None voor een waarde van vóór envelope-encryptie."""
+        token = value if isinstance(value, bytes) else value.encode()
+        for backend in self.backends.values():
+            if backend.owns(token):
+                return backend.data_key_id(token)
+        return None
+
+    def encrypt_value(self, value: str):
+        """Versleutel tekst naar een kolomwaarde: str voor tekst-backends, bytes (BLOB) voor binaire."""
+        token = self.encrypt(value.encode())
+        return token if self.backend.binary else token.decode()
+
+    def decrypt_value(self, value) -> str:
+        """Ontsleutel een kolomwaarde, ongeacht of deze als tekst of als BLOB is opgeslagen."""
+        return self.decrypt(value if isinstance(value, bytes) else value.encode()).decode()
+
+if __name__ == "__main__":
+    from encrypt_decrypt import key_manager
+    commands = {"rotate-master": "vervang het RSA-sleutelpaar en verpak de data keys opnieuw",
+                "new-data-key": "maak een nieuwe actieve data key voor nieuwe waarden",
+                "retire-master-keys": "verwijder oude master keys die geen back-up meer nodig heeft"}
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "rotate-master":
+        count = key_manager.data_keys.rotate_master_key()
+        logging.info(f"Master key rotated, {count} data keys rewrapped")
+        print(f"Master key vervangen; {count} data keys opnieuw verpakt.")
+    elif command == "new-data-key":
+        print(f"Nieuwe data key {key_manager.data_keys.create_data_key()} is actief.")
+    elif command == "retire-master-keys":
+        from backup import referenced_master_key_ids  # Leest alle back-ups; alleen hier nodig
+        retired = key_manager.data_keys.retire_master_keys(referenced_master_key_ids())
+        logging.info(f"Retired {len(retired)} archived master keys")
+        print(f"{len(retired)} oude master keys verwijderd.")
+    else:
+        print("Gebruik: python src/envelope.py <opdracht>")
+        for name, description in commands.items():
+            print(f"  {name:<18} {description}")
@@ -0,0 +1,162 @@
+# export.py
+import sys
+import csv
+import json
+import logging
+import argparse
+from encrypt_decrypt import decrypt_data, decrypt_many
+from member_record import decrypt_member_record
+
+EXPORT_FETCH_SIZE = 1000  # Rijen per fetchmany; bepaalt het geheugengebruik, niet de tabelgrootte
+
+# Exporteerbare kolommen per tabel; wachtwoordhashes en blinde indexen worden nooit geëxporteerd
+EXPORT_TABLES = {
+    "members": {
+        "columns": ["membership_id", "first_name", "last_name", "age", "gender", "weight", "address", "email",
+                    "phone", "registration_date"],
+        "encrypted": {"membership_id", "first_name", "last_name", "age", "gender", "weight", "address", "email", "phone"},
+        "record": "record",  # Rijen in het record-formaat hebben alle versleutelde kolommen in deze ene kolom
+    },
+    "users": {
+        "columns": ["username", "role", "first_name", "last_name", "registration_date"],
+        "encrypted": {"username", "first_name", "last_name"},
+    },
+}
+
+def _decrypt_values(values):
+    """Desleutel een blok waarden in één keer; bij een fout per waarde, met None voor onleesbare velden."""
+    try:
+        return decrypt_many(values)
+    except Exception:
+        decrypted = []
+        for value in values:
+            try:
+                decrypted.append(None if value is None else decrypt_data(value))
+            except Exception as e:
+                logging.error(f"Error decrypting value during export: {e}")
+                decrypted.append(None)
+        return decrypted
+
+def _decrypt_columns(rows, indexes):
+    """Desleutel de kolommen op de gegeven posities voor een heel blok rijen tegelijk."""
+    if not indexes:
+        return
+    decrypted = iter(_decrypt_values([row[i] for row in rows for i in indexes]))
+    for row in rows:
+        for i in indexes:
+            row[i] = next(decrypted)
+
+def _decrypt_record(row, selected, encrypted):
+    """Vul de versleutelde kolommen van een rij in vanuit het record in de laatste kolom."""
+    try:
+        record = decrypt_member_record(row[-1])
+    except Exception as e:
+        logging.error(f"Error decrypting record during export: {e}")
+        record = {}
+    for i, column in enumerate(selected):
+        if column in encrypted:
+            row[i] = record.get(column)
+
+def export_rows(conn, table, columns=None, filters=None, fetch_size=None):
+    """Lees een tabel in blokken en geef ontsleutelde rijen als dicts, alleen met de gevraagde kolommen.
+
+    filters is een dict kolom -> waarde; alleen rijen met precies die (ontsleutelde) waarde worden teruggegeven.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Onbekende tabel: {table}")
+    spec = EXPORT_TABLES[table]
+    columns = list(columns or spec["columns"])
+    filters = dict(filters or {})
+    unknown = [column for column in [*columns, *filters] if column not in spec["columns"]]
+    if unknown:
+        raise ValueError(f"Onbekende kolommen voor {table}: {', '.join(unknown)}")
+    fetch_size = fetch_size or EXPORT_FETCH_SIZE
+
+    # Filters op onversleutelde kolommen gaan naar SQL; de rest wordt na het ontsleutelen vergeleken
+    sql_filters = {column: value for column, value in filters.items() if column not in spec["encrypted"]}
+    row_filters = {column: str(value) for column, value in filters.items() if column in spec["encrypted"]}
+    selected = list(dict.fromkeys([*row_filters, *columns]))
+    record_column = spec.get("record")
+    sql = f"SELECT {', '.join(selected)}{f', {record_column}' if record_column else ''} FROM {table}"
+    if sql_filters:
+        sql += " WHERE " + " AND ".join(f"{column} = ?" for column in sql_filters)
+    sql += " ORDER BY id"
+
+    position = {column: i for i, column in enumerate(selected)}
+    filter_indexes = [position[column] for column in row_filters]
+    other_indexes = [i for i, column in enumerate(selected) if column in spec["encrypted"] and column not in row_filters]
+
+    cur = conn.cursor()
+    cur.execute(sql, list(sql_filters.values()))
+
+    def fetch_rows():
+        while True:
+            rows = [list(row) for row in cur.fetchmany(fetch_size)]
+            if not rows:
+                break
+            if record_column:
+                # Rijen in het record-formaat worden met één ontsleuteling per rij volledig ingevuld
+                for row in rows:
+                    if row[-1] is not None:
+                        _decrypt_record(row, selected, spec["encrypted"])
+                field_rows = [row for row in rows if row[-1] is None]
+            else:
+                field_rows = rows
+            # Ontsleutel eerst alleen de filterkolommen, zodat afgewezen rijen niet volledig ontsleuteld worden
+            _decrypt_columns(field_rows, filter_indexes)
+            rows = [row for row in rows if all(row[position[column]] == value for column, value in row_filters.items())]
+            _decrypt_columns([row for row in rows if not record_column or row[-1] is None], other_indexes)
+            for row in rows:
+                yield {column: row[position[column]] for column in columns}
+
+    # De controles hierboven lopen direct; het lezen en ontsleutelen pas tijdens het itereren
+    return fetch_rows()
+
+def write_export(rows, output, columns, fmt="csv"):
+    """Schrijf rijen regel voor regel als CSV of JSONL naar een open bestand; retourneert het aantal rijen."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(output, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            output.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Onbekend exportformaat: {fmt}")
+    return count
+
+def export_table(conn, table, path=None, fmt="csv", columns=None, filters=None, fetch_size=None):
+    """Exporteer een tabel naar een bestand (of stdout); retourneert het aantal geëxporteerde rijen."""
+    columns = list(columns or EXPORT_TABLES[table]["columns"]) if table in EXPORT_TABLES else columns
+    rows = export_rows(conn, table, columns, filters, fetch_size)
+    if path is None:
+        return write_export(rows, sys.stdout, columns, fmt)
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        return write_export(rows, output, columns, fmt)
+
+if __name__ == "__main__":
+    from connection import get_connection_manager
+    parser = argparse.ArgumentParser(description="Exporteer ontsleutelde leden of gebruikers als CSV of JSONL.")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--output", help="Uitvoerbestand; standaard stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--columns", help="Kommagescheiden lijst van kolommen")
+    parser.add_argument("--filter", action="append", default=[], metavar="KOLOM=WAARDE")
+    parser.add_argument("--fetch-size", type=int, default=EXPORT_FETCH_SIZE)
+    args = parser.parse_args()
+
+    manager = get_connection_manager("data/unique_meal.db")
+    try:
+        filters = dict(item.split("=", 1) for item in args.filter)
+        with manager.reader() as conn:
+            count = export_table(conn, args.table, args.output, args.format,
+                                 args.columns.split(",") if args.columns else None, filters, args.fetch_size)
+        print(f"{count} rijen geëxporteerd.", file=sys.stderr)
+    except ValueError as e:
+        print(f"Export mislukt: {e}", file=sys.stderr)
+    finally:
+        manager.close()
@@ -1,30 +1,44 @@
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives import serialization
+import os
 
-# Maak een RSA sleutel paar
-key = rsa.generate_private_key(
-    public_exponent=65537,
-    key_size=2048,
-)
+PRIVATE_KEY_FILE = "data/private_key.pem"
+PUBLIC_KEY_FILE = "data/public_key.pem"
 
-# Exporteer de private key
-private_key = key.private_bytes(
-    encoding=serialization.Encoding.PEM,
-    format=serialization.PrivateFormat.TraditionalOpenSSL,
-    encryption_algorithm=serialization.NoEncryption()
-)
+def generate_key_pair(private_key_file=PRIVATE_KEY_FILE, public_key_file=PUBLIC_KEY_FILE):
+    """Maak een RSA sleutelpaar en sla het op; retourneert de private key."""
+    # Pas hier laden: alleen nodig als er echt een sleutelpaar gemaakt wordt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives import serialization
+    key = rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=2048,
+    )
 
-# Exporteer de public key
-public_key = key.public_key().public_bytes(
-    encoding=serialization.Encoding.PEM,
-    format=serialization.PublicFormat.SubjectPublicKeyInfo
-)
+    # Exporteer de private key
+    private_key = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption()
+    )
 
-# Sla de sleutels op in de data directory
-with open("data/private_key.pem", "wb") as private_file:
-    private_file.write(private_key)
+    # Exporteer de public key
+    public_key = key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
 
-with open("data/public_key.pem", "wb") as public_file:
-    public_file.write(public_key)
+    # Sla de sleutels op; de private key is alleen voor de eigenaar leesbaar
+    with open(private_key_file, "wb") as private_file:
+        private_file.write(private_key)
+    os.chmod(private_key_file, 0o600)
 
-print("Publieke en private sleutels zijn gegenereerd en opgeslagen in de data directory.")
+    with open(public_key_file, "wb") as public_file:
+        public_file.write(public_key)
+    return key
+
+if __name__ == "__main__":
+    if os.path.exists(PRIVATE_KEY_FILE):
+        # Overschrijven maakt de data keys onleesbaar; een nieuw paar gaat via de master key rotatie
+        print("Er bestaat al een sleutelpaar. Gebruik 'python src/envelope.py rotate-master' om het te vervangen.")
+    else:
+        generate_key_pair()
+        print("Publieke en private sleutels zijn gegenereerd en opgeslagen in de data directory.")
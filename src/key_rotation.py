@@ -0,0 +1,277 @@
+# key_rotation.py
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import InvalidToken
+from connection import get_connection_manager
+from encrypt_decrypt import key_manager
+from worker_pool import process_pool
+
+ROTATION_DATABASE = "data/unique_meal.db"
+ROTATION_CHECKPOINT_SUFFIX = ".key_rotation.json"  # Het checkpoint staat naast de database die geroteerd wordt
+LEGACY_CHECKPOINT_FILE = "data/key_rotation.json"  # Vaste plek van vroeger; hoort altijd bij ROTATION_DATABASE
+ROTATION_CHUNK_SIZE = 500  # Rijen per gecommitte transactie; daartussen kunnen andere verbindingen schrijven
+ROTATION_WORKERS = os.cpu_count() or 1
+USE_PROCESSES = True  # False gebruikt een thread pool in plaats van een process pool
+PROGRESS_INTERVAL = 2.0  # Seconden tussen voortgangsmeldingen
+ROTATION_RETRIES = 5  # Pogingen voor een rij die steeds tussen lezen en wegschrijven gewijzigd wordt
+# Seconden na het aanmaken van de nieuwe data key voordat de oude verwijderd mogen worden; zo lang hebben
+# draaiende sessies om de nieuwe sleutel op te pakken (service: elke paar seconden, menu: na elke keuze)
+ROTATION_GRACE_PERIOD = 3600
+
+# Alle versleutelde kolommen per tabel
+ROTATION_TABLES = {
+    "users": ["username", "first_name", "last_name"],
+    "members": ["first_name", "last_name", "age", "gender", "weight", "address", "email", "phone", "membership_id", "record"],
+    "logs": ["username", "description", "additional_info"],
+}
+
+def _rotate_value(cipher, value):
+    """(nieuwe waarde, gewijzigd, onleesbaar) voor één kolomwaarde."""
+    if value is None or value == "" or value == b"":  # Lege kolommen horen bij het record-formaat
+        return value, False, False
+    if not isinstance(value, (str, bytes)):
+        # Bijvoorbeeld een INTEGER-leeftijd of REAL-gewicht uit een oude back-up; nooit versleuteld geweest
+        return value, False, True
+    try:
+        if cipher.is_current(value if isinstance(value, bytes) else value.encode()):
+            return value, False, False
+        # Zet de waarde ook om naar het actieve backend (tekst of BLOB)
+        return cipher.encrypt_value(cipher.decrypt_value(value)), True, False
+    except (InvalidToken, ValueError, TypeError):
+        # Niet versleuteld, beschadigd of met een onbekende sleutel; laat de waarde ongemoeid
+        return value, False, True
+
+def rotate_chunk(rows):
+    """Versleutel de waarden van een blok rijen (id, ...) opnieuw met de actieve data key; draait in een worker.
+
+    Retourneert ([(id, oude waarden, nieuwe waarden)], aantal onleesbare waarden); rijen die al met de actieve
+    data key versleuteld zijn vallen weg.
+    """
+    cipher = key_manager.cipher
+    changes = []
+    unreadable = 0
+    for row_id, *values in rows:
+        rotated = []
+        changed = False
+        for value in values:
+            new_value, value_changed, value_unreadable = _rotate_value(cipher, value)
+            rotated.append(new_value)
+            changed |= value_changed
+            unreadable += value_unreadable
+        if changed:
+            changes.append((row_id, tuple(values), tuple(rotated)))
+    return changes, unreadable
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(path + ".tmp", path)
+
+def rotation_checkpoint_file(database_path):
+    """Pad van het checkpoint voor een database; een checkpoint op de oude vaste plek wordt meeverhuisd."""
+    checkpoint_path = database_path + ROTATION_CHECKPOINT_SUFFIX
+    if database_path == ROTATION_DATABASE and os.path.exists(LEGACY_CHECKPOINT_FILE):
+        os.replace(LEGACY_CHECKPOINT_FILE, checkpoint_path)
+    return checkpoint_path
+
+def start_rotation(checkpoint_path):
+    """Begin een nieuwe rotatie of pak een onderbroken rotatie op; retourneert het checkpoint."""
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        print(f"Onderbroken sleutelrotatie van {checkpoint['started']} wordt hervat.")
+        return checkpoint
+
+    # Nieuwe waarden gaan direct naar de nieuwe data key; de oude blijven bruikbaar om te ontsleutelen,
+    # zodat draaiende processen na reload_if_changed beide versies kunnen lezen
+    data_key_id = key_manager.data_keys.create_data_key()
+    checkpoint = {"started": time.strftime('%Y-%m-%d %H:%M:%S'), "phase": "rotate", "data_key_id": data_key_id,
+                  "tables": {table: 0 for table in ROTATION_TABLES}}
+    _write_json(checkpoint_path, checkpoint)
+    return checkpoint
+
+def _read_chunks(manager, table, columns, after_id, chunk_size):
+    """Lees de tabel in blokken van oplopende id's vanaf after_id."""
+    sql = f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?"
+    while True:
+        with manager.reader() as conn:
+            rows = conn.execute(sql, (after_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        yield rows
+
+def _write_changes(manager, table, columns, changes):
+    """Schrijf opnieuw versleutelde rijen weg, maar alleen als ze sinds het lezen niet gewijzigd zijn.
+
+    Zo overschrijft de rotatie nooit een wijziging die de applicatie tussen het lezen en wegschrijven deed;
+    zulke rijen worden opnieuw gelezen en versleuteld. Retourneert het aantal weggeschreven rijen.
+    """
+    sql_update = (f"UPDATE {table} SET {', '.join(f'{column}=?' for column in columns)} "
+                  f"WHERE id=? AND {' AND '.join(f'{column} IS ?' for column in columns)}")
+    sql_select = f"SELECT id, {', '.join(columns)} FROM {table} WHERE id=?"
+    written = 0
+    for _ in range(ROTATION_RETRIES):
+        conflicts = []
+        with manager.transaction() as conn:
+            for row_id, originals, rotated in changes:
+                if conn.execute(sql_update, (*rotated, row_id, *originals)).rowcount:
+                    written += 1
+                else:
+                    conflicts.append(row_id)
+            rows = [row for row_id in conflicts for row in conn.execute(sql_select, (row_id,)).fetchall()]
+        if not rows:
+            return written
+        changes, _ = rotate_chunk(rows)  # Onleesbare waarden zijn bij het eerste lezen al geteld
+    logging.warning(f"Key rotation gave up on {len(changes)} rows in {table} that kept changing")
+    return written
+
+def _rotate_table(manager, executor, table, checkpoint, checkpoint_path, chunk_size, workers):
+    columns = ROTATION_TABLES[table]
+    after_id = checkpoint["tables"][table]
+    with manager.reader() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ?", (after_id,)).fetchone()[0]
+    started = last_report = time.perf_counter()
+    done = changed = unreadable = 0
+
+    pending = deque()
+    chunks = _read_chunks(manager, table, columns, after_id, chunk_size)
+    while True:
+        # Houd een beperkt aantal blokken in behandeling en verwerk de resultaten op volgorde,
+        # zodat het checkpoint alleen naar voren schuift over volledig weggeschreven blokken
+        while len(pending) < workers * 2:
+            rows = next(chunks, None)
+            if rows is None:
+                break
+            pending.append((rows[-1][0], len(rows), executor.submit(rotate_chunk, rows)))
+        if not pending:
+            break
+        last_id, count, future = pending.popleft()
+        changes, chunk_unreadable = future.result()
+        written = _write_changes(manager, table, columns, changes)
+        checkpoint["tables"][table] = last_id
+        _write_json(checkpoint_path, checkpoint)
+
+        done += count
+        changed += written
+        unreadable += chunk_unreadable
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_INTERVAL or done == total:
+            last_report = now
+            rate = done / (now - started) if now > started else 0
+            eta = (total - done) / rate if rate else 0
+            print(f"{table}: {done}/{total} rijen ({rate:.0f} rijen/s, nog ongeveer {eta:.0f}s)")
+    return changed, unreadable
+
+def rotate_keys(database_path=ROTATION_DATABASE, chunk_size=None, workers=None, use_processes=None):
+    """Versleutel alle versleutelde kolommen opnieuw met een nieuwe data key, hervatbaar via een checkpoint.
+
+    Alleen nodig als een data key gelekt is, om waarden van vóór envelope-encryptie om te zetten of om bestaande
+    waarden naar een ander CIPHER_BACKEND te brengen; voor een nieuwe master key volstaat envelope.py rotate-master.
+    De oude data keys blijven bestaan tot remove_old_keys, zodat draaiende sessies ze nog kunnen lezen.
+    """
+    chunk_size = chunk_size or ROTATION_CHUNK_SIZE
+    workers = workers or ROTATION_WORKERS
+    use_processes = USE_PROCESSES if use_processes is None else use_processes
+
+    key_manager.set_database(database_path)  # De data keys staan in de database die geroteerd wordt
+    checkpoint_path = rotation_checkpoint_file(database_path)
+    checkpoint = start_rotation(checkpoint_path)
+    # Lezen via de leespool en schrijven in korte transacties; de applicatie blijft via WAL gewoon werken
+    manager = get_connection_manager(database_path)
+    with (process_pool(workers, database_path) if use_processes else ThreadPoolExecutor(max_workers=workers)) as executor:
+        while True:
+            changed = unreadable = 0
+            for table in ROTATION_TABLES:
+                table_changed, table_unreadable = _rotate_table(manager, executor, table, checkpoint, checkpoint_path,
+                                                                  chunk_size, workers)
+                changed += table_changed
+                unreadable += table_unreadable
+            if unreadable:
+                logging.warning(f"Key rotation skipped {unreadable} values that could not be decrypted")
+                print(f"{unreadable} waarden konden niet ontsleuteld worden en zijn ongewijzigd gelaten.")
+            if checkpoint["phase"] == "verify":
+                break
+            # Controleer alles nog één keer: processen die de oude sleutel nog in het geheugen
+            # hadden, kunnen tijdens de rotatie rijen hebben geschreven die al gepasseerd waren
+            print(f"{changed} rijen opnieuw versleuteld; controle op achtergebleven rijen...")
+            checkpoint["phase"] = "verify"
+            checkpoint["tables"] = {table: 0 for table in ROTATION_TABLES}
+            _write_json(checkpoint_path, checkpoint)
+
+    os.remove(checkpoint_path)
+    logging.info("Key rotation completed")
+    print("Sleutelrotatie voltooid. Verwijder de oude data keys pas als alle sessies de nieuwe gebruiken, "
+          "met: python src/key_rotation.py --remove-old-keys")
+
+def remove_old_keys(database_path=ROTATION_DATABASE, grace_period=ROTATION_GRACE_PERIOD, chunk_size=None):
+    """Verwijder de inactieve data keys na een rotatie; retourneert het aantal, of None als het nog niet veilig is.
+
+    Weigert tijdens een rotatie, binnen de wachttijd na het aanmaken van de nieuwe data key en zolang er nog
+    waarden zijn die met een oude data key versleuteld zijn.
+    """
+    chunk_size = chunk_size or ROTATION_CHUNK_SIZE
+    key_manager.set_database(database_path)
+    if os.path.exists(rotation_checkpoint_file(database_path)):
+        print("Er loopt nog een sleutelrotatie; voltooi die eerst.")
+        return None
+    active_since = key_manager.data_keys.active_since()
+    if active_since is None:
+        return 0
+    waited = (datetime.now() - datetime.strptime(active_since, '%Y-%m-%d %H:%M:%S')).total_seconds()
+    if waited < grace_period:
+        print(f"De nieuwe data key is pas {waited:.0f}s actief; wacht nog {grace_period - waited:.0f}s zodat "
+              f"alle sessies hem gebruiken.")
+        return None
+
+    # Een sessie die de nieuwe sleutel te laat oppakte kan nog met een oude hebben versleuteld
+    cipher = key_manager.cipher
+    active_id = key_manager.data_keys.active()[0]
+    manager = get_connection_manager(database_path)
+    stale = 0
+    for table, columns in ROTATION_TABLES.items():
+        for rows in _read_chunks(manager, table, columns, 0, chunk_size):
+            for _, *values in rows:
+                for value in values:
+                    if not value or not isinstance(value, (str, bytes)):
+                        continue
+                    try:
+                        dek_id = cipher.data_key_id(value)
+                    except (InvalidToken, ValueError):
+                        continue  # Onleesbaar, en met geen enkele sleutel te ontsleutelen
+                    if dek_id is not None and dek_id != active_id:
+                        stale += 1
+    if stale:
+        logging.warning(f"Not removing old data keys: {stale} values still use them")
+        print(f"{stale} waarden gebruiken nog een oude data key; voer de sleutelrotatie opnieuw uit.")
+        return None
+
+    removed = key_manager.data_keys.remove_inactive_data_keys()
+    logging.info(f"Removed {removed} inactive data keys")
+    print(f"{removed} oude data keys verwijderd.")
+    return removed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roteer de data key en versleutel de hele database opnieuw.")
+    parser.add_argument("--database", default=ROTATION_DATABASE)
+    parser.add_argument("--chunk-size", type=int, default=ROTATION_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=ROTATION_WORKERS)
+    parser.add_argument("--remove-old-keys", action="store_true",
+                        help="Verwijder na een voltooide rotatie de oude data keys in plaats van te roteren")
+    parser.add_argument("--grace-period", type=int, default=ROTATION_GRACE_PERIOD,
+                        help="Seconden na de rotatie voordat de oude data keys verwijderd mogen worden")
+    args = parser.parse_args()
+    logging.basicConfig(filename='data/system.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        if args.remove_old_keys:
+            remove_old_keys(args.database, args.grace_period, args.chunk_size)
+        else:
+            rotate_keys(args.database, args.chunk_size, args.workers)
+    finally:
+        get_connection_manager(args.database).close()
@@ -1,114 +1,259 @@
 import os
 import csv
+import json
+import queue
+import atexit
+import logging
+import threading
 from datetime import datetime
-from cryptography.fernet import Fernet
-from encrypt_decrypt import encrypt_data, decrypt_data
+from connection import get_connection_manager
+import metrics
+from encrypt_decrypt import encrypt_many, decrypt_many, key_manager
 
-LOG_FILE = 'data/logs.csv'
-ENCRYPTED_LOG_FILE = 'data/encrypted_logs.csv'
-KEY_FILE = 'data/secret.key'
+LOG_DATABASE = 'data/unique_meal.db'
+LOG_FILE = 'data/logs.csv'  # Oude CSV-logs, alleen nog nodig voor de eenmalige import
+ENCRYPTED_LOG_FILE = 'data/encrypted_logs.csv'  # Versleutelde kopie van de oude CSV-logs, idem
+ENCRYPTED_LOG_HEADER = b'#unique-meal-log v2\n'  # Formaat met één versleuteld record per regel
+SUSPICIOUS_WATERMARK_FILE = 'data/suspicious_watermarks.json'
+LOG_QUEUE_SIZE = 1000  # Bij een volle wachtrij wacht log_activity tot er weer plek is
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_INTERVAL = 0.2  # Seconden dat de schrijver wacht op meer records voor dezelfde transactie
 
-def generate_key():
-    """Genereer en sla een sleutel op voor encryptie."""
-    key = Fernet.generate_key()
-    with open(KEY_FILE, 'wb') as key_file:
-        key_file.write(key)
+class AuditLogStore:
+    """Slaat auditlogs op in de SQLite-tabel logs met versleutelde gevoelige kolommen."""
 
-def load_key():
-    """Laad de sleutel voor encryptie."""
-    return open(KEY_FILE, 'rb').read()
+    def __init__(self, database_path=LOG_DATABASE):
+        self.database_path = database_path
 
-if not os.path.exists(KEY_FILE):
-    generate_key()
+    @property
+    def manager(self):
+        # Schrijven gaat via de geserialiseerde schrijfverbinding, lezen via de leespool
+        return get_connection_manager(self.database_path)
 
-cipher = Fernet(load_key())
+    def holds_write_lock(self):
+        """Heeft deze thread een schrijftransactie open, zodat een nieuwe pas na afloop daarvan kan beginnen?"""
+        return self.manager.holds_write_lock()
 
-def get_next_log_number():
-    """Bepaal het volgende lognummer door de bestaande logs te tellen."""
-    if not os.path.exists(LOG_FILE):
-        return 1
-    with open(LOG_FILE, 'r') as file:
-        reader = csv.reader(file)
-        log_entries = list(reader)
-        return len(log_entries) + 1
+    @metrics.timed("audit_log_seconds", operation="write")
+    def insert_many(self, records):
+        """Schrijf een reeks records (date, time, username, description, additional_info, suspicious) in één transactie."""
+        rows = []
+        for date, time, username, description, additional_info, suspicious in records:
+            encrypted_username, encrypted_description, encrypted_additional_info = encrypt_many(
+                [username, description, additional_info])
+            rows.append((date, time, encrypted_username, encrypted_description, encrypted_additional_info,
+                         1 if suspicious == 'Yes' else 0))
+        with self.manager.transaction() as conn:
+            conn.executemany("""INSERT INTO logs (date, time, username, description, additional_info, suspicious)
+                                     VALUES (?, ?, ?, ?, ?, ?)""", rows)
+        metrics.increment("audit_log_records_total", len(rows))
 
+    def query(self, start_date=None, end_date=None, suspicious=None, after_id=0):
+        """Haal ontsleutelde logs op binnen een datumbereik (YYYY-MM-DD) en/of met een verdacht-vlag."""
+        sql = "SELECT id, date, time, username, description, additional_info, suspicious FROM logs WHERE id > ?"
+        params = [after_id]
+        if start_date:
+            sql += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            sql += " AND date <= ?"
+            params.append(end_date)
+        if suspicious is not None:
+            sql += " AND suspicious = ?"
+            params.append(1 if suspicious else 0)
+        sql += " ORDER BY id"
+
+        with self.manager.reader() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [_decrypt_log_row(row) for row in rows]
+
+log_store = AuditLogStore()
+
+class AuditLogger:
+    """Schrijft logs via een begrensde wachtrij op een achtergrondthread weg in gebundelde transacties."""
+
+    def __init__(self, store, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="audit-logger", daemon=True)
+                    self._thread.start()
+
+    def submit(self, record, durable=False):
+        """Zet een record in de wachtrij; met durable=True wordt gewacht tot het is weggeschreven."""
+        self._ensure_started()
+        if self.store.holds_write_lock():
+            # De schrijver kan pas na de lopende transactie van deze thread schrijven; daarop wachten loopt vast
+            try:
+                self._queue.put_nowait((record, None))
+            except queue.Full:
+                self.store.insert_many([record])  # Schrijf mee in de lopende transactie
+            return
+        written = threading.Event() if durable else None
+        self._queue.put((record, written))  # Blokkeert als de wachtrij vol is
+        if written:
+            written.wait()
+
+    def flush(self):
+        """Wacht tot alle records in de wachtrij zijn weggeschreven."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        if self.store.holds_write_lock():
+            # De schrijver wacht op de transactie van deze thread; wachten zou nooit eindigen
+            logging.warning("Audit log flush skipped: this thread holds the write lock of an open transaction")
+            return
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                # Verzamel wat er binnen het flush-interval nog bijkomt; een record waarop
+                # gewacht wordt sluit de batch direct af
+                while len(batch) < self.batch_size and batch[-1][1] is None:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+
+            try:
+                self.store.insert_many([record for record, _ in batch])
+            except Exception as e:
+                logging.error(f"Error writing {len(batch)} audit log records: {e}")
+            finally:
+                for _, written in batch:
+                    if written:
+                        written.set()
+                    self._queue.task_done()
+
+audit_logger = AuditLogger(log_store)
+atexit.register(audit_logger.flush)
+
+def _decrypt_log_row(row):
+    """Zet een rij uit de logs-tabel om naar [lognummer, datum, tijd, gebruiker, omschrijving, extra info, verdacht]."""
+    log_id, date, time, username, description, additional_info, suspicious = row
+    return [
+        log_id,
+        datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y'),
+        time,
+        *decrypt_many([username, description, additional_info]),
+        'Yes' if suspicious else 'No'
+    ]
+
+@metrics.timed("audit_log_seconds", operation="submit")
 def log_activity(username, description, additional_info='', suspicious='No'):
     """Log een activiteit."""
-    date = datetime.now().strftime('%d-%m-%Y')
-    time = datetime.now().strftime('%H:%M:%S')
-    log_number = get_next_log_number()
-    
-    # Versleutel de log informatie
-    encrypted_username = encrypt_data(username)
-    encrypted_description = encrypt_data(description)
-    encrypted_additional_info = encrypt_data(additional_info)
-    encrypted_suspicious = encrypt_data(suspicious)
-    
-    log_entry = [log_number, date, time, encrypted_username, encrypted_description, encrypted_additional_info, encrypted_suspicious]
-    
-    # Schrijf de log naar een CSV bestand
-    with open(LOG_FILE, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(log_entry)
-    
-    # Versleutel de log file
-    encrypt_log_file()
-
-def encrypt_log_file():
-    """Versleutel de log file."""
-    with open(LOG_FILE, 'rb') as file:
-        encrypted_data = cipher.encrypt(file.read())
-    
-    with open(ENCRYPTED_LOG_FILE, 'wb') as encrypted_file:
-        encrypted_file.write(encrypted_data)
-
-def decrypt_log_file():
-    """Desleutel de log file en lees de inhoud."""
-    if not os.path.exists(ENCRYPTED_LOG_FILE):
-        return []
-    
-    with open(ENCRYPTED_LOG_FILE, 'rb') as encrypted_file:
-        encrypted_data = encrypted_file.read()
-    
-    decrypted_data = cipher.decrypt(encrypted_data).decode()
-    
-    logs = []
-    reader = csv.reader(decrypted_data.splitlines())
-    for idx, row in enumerate(reader):
-        if len(row) == 7:  # Verwachte lengte met lognummer
-            decrypted_row = [
-                row[0],  # log number
-                row[1],  # date
-                row[2],  # time
-                decrypt_data(row[3]),  # username
-                decrypt_data(row[4]),  # description
-                decrypt_data(row[5]),  # additional info
-                decrypt_data(row[6])   # suspicious
-            ]
-            logs.append(decrypted_row)
-        elif len(row) == 6:  # Oudere log zonder lognummer
-            decrypted_row = [
-                idx + 1,  # log number gebaseerd op de rij index
-                row[0],  # date
-                row[1],  # time
-                decrypt_data(row[2]),  # username
-                decrypt_data(row[3]),  # description
-                decrypt_data(row[4]),  # additional info
-                decrypt_data(row[5])   # suspicious
-            ]
-            logs.append(decrypted_row)
-        else:
-            print(f"Onverwachte rijlengte: {len(row)}. Rij: {row}")
-    
-    return logs
+    now = datetime.now()
+    record = (now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), username, description, additional_info, suspicious)
+    # Verdachte activiteiten worden pas bevestigd als ze echt zijn weggeschreven
+    audit_logger.submit(record, durable=(suspicious == 'Yes'))
+
+def decrypt_log_file(start_date=None, end_date=None):
+    """Desleutel de logs, optioneel binnen een datumbereik (YYYY-MM-DD)."""
+    audit_logger.flush()
+    return log_store.query(start_date=start_date, end_date=end_date)
 
 def get_suspicious_logs():
     """Haal verdachte logs op."""
-    logs = decrypt_log_file()
-    suspicious_logs = [log for log in logs if log[6] == 'Yes']
-    return suspicious_logs
+    audit_logger.flush()
+    return log_store.query(suspicious=True)
+
+def get_unread_suspicious_logs(user_id):
+    """Haal alleen de verdachte logs op die deze beheerder nog niet gezien heeft."""
+    audit_logger.flush()
+    with log_store.manager.reader() as conn:
+        row = conn.execute("SELECT last_seen_id FROM log_watermarks WHERE user_id=?", (user_id,)).fetchone()
+    return log_store.query(suspicious=True, after_id=row[0] if row else 0)
+
+def mark_suspicious_logs_read(user_id, suspicious_logs):
+    """Leg vast tot welk lognummer deze beheerder de verdachte logs gezien heeft."""
+    if not suspicious_logs:
+        return
+    last_seen_id = max(int(log[0]) for log in suspicious_logs)
+    with log_store.manager.transaction() as conn:
+        conn.execute("""INSERT INTO log_watermarks (user_id, last_seen_id) VALUES (?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET last_seen_id=MAX(last_seen_id, excluded.last_seen_id)""",
+                     (user_id, last_seen_id))
+
+def _encrypted_log_lines():
+    """De CSV-regels uit encrypted_logs.csv, in het formaat per record of het oude formaat met één token.
+
+    Een record dat niet te ontsleutelen is levert None op.
+    """
+    from cryptography.fernet import InvalidToken
+    with open(ENCRYPTED_LOG_FILE, 'rb') as encrypted_file:
+        if encrypted_file.readline() == ENCRYPTED_LOG_HEADER:
+            tokens = [token.strip() for token in encrypted_file if token.strip()]
+        else:
+            encrypted_file.seek(0)
+            tokens = [encrypted_file.read().strip()]
+    for token in tokens:
+        try:
+            yield from key_manager.cipher.decrypt(token).decode().splitlines()
+        except (InvalidToken, ValueError):
+            yield None
+
+def _legacy_log_row(idx, row):
+    """Zet een rij uit de oude CSV-logs om naar een rij voor de logs-tabel."""
+    if len(row) == 6:  # Oudere log zonder lognummer
+        row = [idx + 1] + row
+    elif len(row) != 7:
+        raise ValueError(f"Onverwachte rijlengte: {len(row)}")
+    log_number, date, time, username, description, additional_info, suspicious = row
+    # De overige velden zijn al versleuteld en worden ongewijzigd overgenomen
+    return (int(log_number), datetime.strptime(date, '%d-%m-%Y').strftime('%Y-%m-%d'), time,
+            username, description, additional_info, 1 if decrypt_many([suspicious])[0] == 'Yes' else 0)
+
+def import_legacy_logs(conn):
+    """Importeer eenmalig de geschiedenis uit logs.csv en encrypted_logs.csv in de logs-tabel, met behoud van lognummers.
+
+    Retourneert (aantal geïmporteerd, aantal overgeslagen rijen).
+    """
+    from cryptography.fernet import InvalidToken
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM logs")
+    if cur.fetchone()[0] > 0:
+        return 0, 0
+
+    sources = []
+    if os.path.exists(LOG_FILE):
+        with open(LOG_FILE, 'r', newline='') as file:
+            sources.append(file.read().splitlines())
+    # De versleutelde kopie bevat dezelfde rijen; lognummers die al uit logs.csv komen worden genegeerd
+    if os.path.exists(ENCRYPTED_LOG_FILE):
+        sources.append(list(_encrypted_log_lines()))
+
+    rows, skipped = [], 0
+    for lines in sources:
+        for idx, line in enumerate(lines):
+            try:
+                if line is None:
+                    raise InvalidToken()
+                for row in csv.reader([line]):
+                    rows.append(_legacy_log_row(idx, row))
+            except (InvalidToken, ValueError) as e:
+                skipped += 1
+                logging.warning(f"Skipping legacy log row {idx + 1}: {type(e).__name__} {e}")
+    cur.executemany("""INSERT OR IGNORE INTO logs (id, date, time, username, description, additional_info, suspicious)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+    imported = cur.rowcount if rows else 0
+
+    # Neem ook de gelezen-markeringen van verdachte logs over
+    if os.path.exists(SUSPICIOUS_WATERMARK_FILE):
+        with open(SUSPICIOUS_WATERMARK_FILE, 'r') as watermark_file:
+            watermarks = json.load(watermark_file)
+        cur.executemany("INSERT OR REPLACE INTO log_watermarks (user_id, last_seen_id) VALUES (?, ?)",
+                        [(int(user_id), watermark['log_number']) for user_id, watermark in watermarks.items()])
+    conn.commit()
+    return imported, skipped
 
 def log_suspicious_activity(username, description, additional_info=''):
     """Log verdachte activiteiten."""
     log_activity(username, description, additional_info, suspicious='Yes')
-
@@ -1,15 +1,21 @@
+import startup  # Als eerste, zodat de opstartmeting ook de andere imports meeneemt
 import logging
 from sqlite3 import connect
 from datetime import datetime
 from user import validate_login, add_user_prompt, add_system_admin_prompt, add_consultant_prompt, update_password, list_users, update_user_prompt, delete_user_prompt, reset_user_password, delete_admin_prompt, update_admin_prompt, reset_admin_password_prompt
 from member import add_member_prompt, search_member_prompt, update_member_prompt, delete_member_prompt
-from log import log_activity, log_suspicious_activity, get_suspicious_logs, decrypt_log_file
-from database import create_connection, create_tables, add_super_admin
-from backup import backup_database_and_logs,restore_database_from_backup
+from member_import import import_members_prompt
+from log import log_activity, log_suspicious_activity, get_unread_suspicious_logs, mark_suspicious_logs_read, decrypt_log_file, audit_logger
+from database import create_connection, close_connections, initialize_database
+from backup import backup_database_and_logs,restore_database_from_backup, SnapshotScheduler, recover_interrupted_restore
+from encrypt_decrypt import key_manager
+import metrics
 
 # Logging configuratie
 logging.basicConfig(filename='data/system.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+MENU_CHOICES = set("acudrvbhlnsipq") | {str(number) for number in range(1, 20)}
+
 def main_menu(role):
     print("\n===================================")
     print("Welkom bij Unique Meal Management System")
@@ -32,6 +38,7 @@ def main_menu(role):
         print("14. Zoek lid (S/s)")
         print("15. Update lid (U/u)")
         print("16. Verwijder lid (D/d)")
+        print("19. Importeer leden uit bestand (I/i)")
     if role == 'consultant':
         print("13. Registreer nieuw lid (N/n)")
         print("14. Zoek lid (S/s)")
@@ -58,7 +65,7 @@ def login_prompt(conn, max_attempts=3):
             user_id, role = result
             log_activity(username, "Logged in")
             logging.info("Login successful.")
-            return user_id, role
+            return user_id, role, username
         else:
             log_suspicious_activity(username, "Failed login attempt", f"Attempt {attempts + 1}")
             logging.info(f"Failed login attempt {attempts + 1} for username: {username}")
@@ -78,68 +85,97 @@ def login_prompt(conn, max_attempts=3):
 
 def main():
     database = "data/unique_meal.db"
+    startup.mark("imports")
+    recover_interrupted_restore(database)
     conn = create_connection(database)
+    startup.mark("databaseverbinding")
     if conn is not None:
-        create_tables(conn)
-        add_super_admin(conn)
+        # Schema en super admin alleen bijwerken als de schemaversie verouderd is
+        initialize_database(conn)
+    startup.mark("schemacontrole")
+    startup.report()
 
-    user_id, role = login_prompt(conn)
+    user_id, role, username = login_prompt(conn)
     if user_id is None:
         return
 
+    # Automatische snapshots lopen op de achtergrond als UNIQUE_MEAL_SNAPSHOT_INTERVAL is ingesteld
+    snapshot_scheduler = SnapshotScheduler(database)
+    snapshot_scheduler.start()
+    # Met UNIQUE_MEAL_METRICS=1 worden de metrics periodiek naar data/metrics.prom geschreven
+    metrics_writer = metrics.MetricsWriter()
+    metrics_writer.start()
+
     if role in ['super_admin', 'system_admin']:
-        suspicious_logs = get_suspicious_logs()
+        suspicious_logs = get_unread_suspicious_logs(user_id)
         if suspicious_logs:
             print("Er zijn ongelezen verdachte activiteiten!")
             for log_entry in suspicious_logs:
                 print(f"{log_entry[0]} - {log_entry[1]} {log_entry[2]} - {log_entry[3]}: {log_entry[4]} - {log_entry[5]}")
+        mark_suspicious_logs_read(user_id, suspicious_logs)
 
     while True:
         choice = main_menu(role)
-        if choice in ['a', '1'] and role == 'super_admin':
-            add_user_prompt(conn, default_role='system_admin')
-        elif choice in ['c', '2'] and role == 'super_admin':
-            add_user_prompt(conn, default_role='consultant')
-        elif choice in ['u', '3'] and role == 'super_admin':
-            update_admin_prompt(conn)
-        elif choice in ['d', '4'] and role == 'super_admin':
-            delete_admin_prompt(conn)
-        elif choice in ['r', '5'] and role == 'super_admin':
-            reset_admin_password_prompt(conn)
-        elif choice in ['v', '6'] and role in ['super_admin', 'system_admin']:
-            list_users(conn)
-        elif choice in ['u', '7'] and role in ['super_admin', 'system_admin']:
-            update_user_prompt(conn)
-        elif choice in ['d', '8'] and role in ['super_admin', 'system_admin']:
-            delete_user_prompt(conn)
-        elif choice in ['r', '9'] and role in ['super_admin', 'system_admin']:
-            reset_user_password(conn)
-        elif choice in ['b', '10'] and role in ['super_admin', 'system_admin']:
-            backup_database_and_logs(database)
-        elif choice in ['h', '11'] and role in ['super_admin', 'system_admin']:
-            restore_database_from_backup(database)
-        elif choice in ['l', '12'] and role in ['super_admin', 'system_admin']:
-            logs = decrypt_log_file()
-            for log_entry in logs:
-                print(f"{log_entry[0]} - {log_entry[1]} {log_entry[2]} - {log_entry[3]}: {log_entry[4]} - {log_entry[5]} - Verdacht: {log_entry[6]}")
-        elif choice in ['n', '13'] and role in ['super_admin', 'system_admin', 'consultant']:
-            add_member_prompt(conn)
-        elif choice in ['s', '14'] and role in ['super_admin', 'system_admin', 'consultant']:
-            search_member_prompt(conn)
-        elif choice in ['u', '15'] and role in ['super_admin', 'system_admin', 'consultant']:
-            member_id = input("Voer lidmaatschapsnummer in: ")
-            update_member_prompt(conn, member_id)
-        elif choice in ['d', '16'] and role in ['super_admin', 'system_admin']:
-            delete_member_prompt(conn)
-        elif choice in ['p', '17']:
-            update_password(conn, user_id)
-        elif choice in ['q', '18']:
-            print("Afsluiten...")
-            break
-        else:
-            print("Ongeldige keuze. Probeer opnieuw.")
+        # Pas na de invoer: wie lang bij het menu bleef staan, versleutelt daarna toch met de nieuwste data key
+        key_manager.reload_if_changed()
+        # Alleen bekende keuzes als label, zodat willekeurige invoer geen nieuwe metriekseries oplevert
+        action = choice if choice in MENU_CHOICES else "invalid"
+        with metrics.measure("menu_action_seconds", role=role, choice=action):
+            if choice in ['a', '1'] and role == 'super_admin':
+                add_user_prompt(conn, default_role='system_admin')
+            elif choice in ['c', '2'] and role == 'super_admin':
+                add_user_prompt(conn, default_role='consultant')
+            elif choice in ['u', '3'] and role == 'super_admin':
+                update_admin_prompt(conn)
+            elif choice in ['d', '4'] and role == 'super_admin':
+                delete_admin_prompt(conn)
+            elif choice in ['r', '5'] and role == 'super_admin':
+                reset_admin_password_prompt(conn)
+            elif choice in ['v', '6'] and role in ['super_admin', 'system_admin']:
+                list_users(conn)
+            elif choice in ['u', '7'] and role in ['super_admin', 'system_admin']:
+                update_user_prompt(conn)
+            elif choice in ['d', '8'] and role in ['super_admin', 'system_admin']:
+                delete_user_prompt(conn)
+            elif choice in ['r', '9'] and role in ['super_admin', 'system_admin']:
+                reset_user_password(conn)
+            elif choice in ['b', '10'] and role in ['super_admin', 'system_admin']:
+                backup_database_and_logs(database)
+            elif choice in ['h', '11'] and role in ['super_admin', 'system_admin']:
+                new_conn = restore_database_from_backup(database)
+                if new_conn is not None:
+                    conn = new_conn  # Ga verder met de herstelde database zonder herstart
+            elif choice in ['l', '12'] and role in ['super_admin', 'system_admin']:
+                logs = decrypt_log_file()
+                for log_entry in logs:
+                    print(f"{log_entry[0]} - {log_entry[1]} {log_entry[2]} - {log_entry[3]}: {log_entry[4]} - {log_entry[5]} - Verdacht: {log_entry[6]}")
+            elif choice in ['n', '13'] and role in ['super_admin', 'system_admin', 'consultant']:
+                add_member_prompt(conn)
+            elif choice in ['s', '14'] and role in ['super_admin', 'system_admin', 'consultant']:
+                search_member_prompt(conn)
+            elif choice in ['u', '15'] and role in ['super_admin', 'system_admin', 'consultant']:
+                member_id = input("Voer lidmaatschapsnummer in: ")
+                update_member_prompt(conn, member_id)
+            elif choice in ['d', '16'] and role in ['super_admin', 'system_admin']:
+                delete_member_prompt(conn)
+            elif choice in ['i', '19'] and role in ['super_admin', 'system_admin']:
+                import_members_prompt(conn, username)
+            elif choice in ['p', '17']:
+                update_password(conn, user_id)
+            elif choice in ['q', '18']:
+                print("Afsluiten...")
+                break
+            else:
+                print("Ongeldige keuze. Probeer opnieuw.")
+        if conn.in_transaction:
+            # Een actie die na een fout niet terugdraaide houdt de schrijflock vast; de auditlog zou erop blijven wachten
+            logging.warning(f"Rolling back transaction left open by menu choice {action}")
+            conn.rollback()
 
-    conn.close()
+    snapshot_scheduler.stop()
+    metrics_writer.stop()
+    audit_logger.flush()  # Schrijf openstaande logs weg voordat de sessie eindigt
+    close_connections(database)
 
 if __name__ == '__main__':
     main()
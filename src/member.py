@@ -4,8 +4,11 @@ from log import log_activity, log_suspicious_activity
 import random
 import re
 from datetime import datetime
-from encrypt_decrypt import encrypt_data, decrypt_data
+from encrypt_decrypt import decrypt_data, blind_index
+from member_record import encrypt_member_record, decrypt_member_record, CLEAR_FIELD_COLUMNS
 from database import create_connection
+from member_scan import scan_members, member_matches, LazyMember
+from name_index import index_member_names, remove_member_names, find_candidate_ids
 from sqlite3 import Error
 
 CITIES = [
@@ -13,15 +16,33 @@ CITIES = [
     "Tilburg", "Groningen", "Almere", "Breda", "Nijmegen"
 ]
 
-def generate_membership_id():
-    current_year = datetime.now().year
-    short_year = str(current_year)[-2:]  # Verkorte registratiejaar, bv. "23" voor 2023
-    random_digits = ''.join([str(random.randint(0, 9)) for _ in range(7)])  # 7 willekeurige cijfers
-    base_id = short_year + random_digits
-
-    checksum = sum(int(digit) for digit in base_id) % 10  # Controlegetal berekenen
-    membership_id = base_id + str(checksum)
-    return membership_id
+def generate_membership_id(conn=None):
+    """Genereer een lidmaatschapsnummer; met een verbinding wordt een nog ongebruikt nummer gekozen."""
+    while True:
+        current_year = datetime.now().year
+        short_year = str(current_year)[-2:]  # Verkorte registratiejaar, bv. "23" voor 2023
+        random_digits = ''.join([str(random.randint(0, 9)) for _ in range(7)])  # 7 willekeurige cijfers
+        base_id = short_year + random_digits
+
+        checksum = sum(int(digit) for digit in base_id) % 10  # Controlegetal berekenen
+        membership_id = base_id + str(checksum)
+        if conn is None or get_member_id(conn, membership_id) is None:
+            return membership_id
+
+def membership_id_hash(membership_id):
+    """Bereken de blinde index van een lidmaatschapsnummer."""
+    return blind_index(membership_id, "membership_id")
+
+def get_member_id(conn, membership_id):
+    """Zoek het database-id van een lid op via de blinde index van het lidmaatschapsnummer."""
+    cur = conn.cursor()
+    cur.execute("SELECT id, membership_id, record FROM members WHERE membership_id_hash=?", (membership_id_hash(membership_id),))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    # Controleer de versleutelde waarde om botsingen in de index uit te sluiten
+    stored_id = decrypt_member_record(row[2])["membership_id"] if row[2] is not None else decrypt_data(row[1])
+    return row[0] if stored_id == membership_id else None
 
 def validate_email(email):
     regex = r'^\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
@@ -31,27 +52,58 @@ def validate_phone(phone):
     regex = r'^\+31-6-\d{8}$'
     return re.match(regex, phone) is not None
 
+MEMBER_FIELDS = ["first_name", "last_name", "age", "gender", "weight", "street", "house_number",
+                 "zip_code", "city", "email", "phone"]
+
+def validate_member_fields(record):
+    """Valideer een dict met lidgegevens zoals add_member_prompt dat doet; ValueError bij ongeldige invoer."""
+    missing = [field for field in MEMBER_FIELDS if not str(record.get(field) or "").strip()]
+    if missing:
+        raise ValueError(f"Ontbrekende velden: {', '.join(missing)}")
+    age = str(record["age"]).strip()
+    if not age.isdigit() or not 0 < int(age) <= 120:
+        raise ValueError("Ongeldige leeftijd. Voer een numerieke waarde in tussen 1 en 120.")
+    gender = str(record["gender"]).strip().upper()
+    if gender not in ["M", "F"]:
+        raise ValueError("Ongeldig geslacht. Gebruik 'M' of 'F'.")
+    try:
+        weight = float(record["weight"])
+    except (TypeError, ValueError):
+        raise ValueError("Ongeldig gewicht. Voer een numerieke waarde in.")
+    if weight <= 0:
+        raise ValueError("Gewicht moet groter zijn dan 0.")
+    zip_code = str(record["zip_code"]).strip()
+    if not re.match(r'^\d{4}[A-Z]{2}$', zip_code):
+        raise ValueError("Ongeldige postcode. Gebruik het formaat DDDDXX.")
+    city = str(record["city"]).strip()
+    if city not in CITIES:
+        raise ValueError(f"Ongeldige stad. Kies uit: {', '.join(CITIES)}")
+    email = str(record["email"]).strip()
+    if not validate_email(email):
+        raise ValueError("Ongeldig emailadres.")
+    phone = str(record["phone"]).strip()
+    if not validate_phone(phone):
+        raise ValueError("Ongeldig telefoonnummer. Gebruik het formaat +31-6-XXXXXXXX.")
+    address = f"{str(record['street']).strip()} {str(record['house_number']).strip()}, {zip_code} {city}"
+    return (str(record["first_name"]).strip(), str(record["last_name"]).strip(), int(age), gender, weight,
+            address, email, phone)
+
 def add_member(conn, first_name, last_name, age, gender, weight, address, email, phone, membership_id):
     """Voeg een nieuw lid toe aan de database."""
-    encrypted_first_name = encrypt_data(first_name)
-    encrypted_last_name = encrypt_data(last_name)
-    encrypted_age = encrypt_data(str(age))
-    encrypted_gender = encrypt_data(gender)
-    encrypted_weight = encrypt_data(str(weight))
-    encrypted_address = encrypt_data(address)
-    encrypted_email = encrypt_data(email)
-    encrypted_phone = encrypt_data(phone)
-    encrypted_membership_id = encrypt_data(membership_id)
+    # Alle gevoelige velden gaan samen in één versleuteld record
+    record = encrypt_member_record(first_name, last_name, age, gender, weight, address, email, phone, membership_id)
 
     try:
-        sql = """INSERT INTO members (first_name, last_name, age, gender, weight, address, email, phone, registration_date, membership_id)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+        sql = """INSERT INTO members (first_name, last_name, membership_id, record, registration_date, membership_id_hash)
+                 VALUES ('', '', '', ?, ?, ?)"""
         cur = conn.cursor()
-        cur.execute(sql, (encrypted_first_name, encrypted_last_name, encrypted_age, encrypted_gender, encrypted_weight, encrypted_address, encrypted_email, encrypted_phone, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), encrypted_membership_id))
+        cur.execute(sql, (record, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), membership_id_hash(membership_id)))
+        index_member_names(conn, cur.lastrowid, first_name, last_name)
         conn.commit()
         log_activity(membership_id, "Member added", f"Name: {first_name} {last_name}")
         return cur.lastrowid  # Retourneer het ID van het toegevoegde lid
     except Error as e:
+        conn.rollback()  # Geef de schrijflock vrij voordat er gelogd wordt
         logging.error(f"Error adding member: {e}")
         log_suspicious_activity(membership_id, "Failed to add member", f"Attempted to add member {first_name} {last_name}")
         return None
@@ -125,74 +177,59 @@ def add_member_prompt(conn):
             break
         print("Ongeldig telefoonnummer. Gebruik het formaat +31-6-XXXXXXXX.")
     
-    membership_id = generate_membership_id()
+    membership_id = generate_membership_id(conn)
     member_id = add_member(conn, first_name, last_name, age, gender, weight, address, email, phone, membership_id)
     if member_id:
         print(f"Lid {first_name} {last_name} succesvol toegevoegd met lidnummer {membership_id}.")
     else:
         print("Lid toevoegen mislukt.")
 
+def search_members(conn, search_term):
+    """Zoek leden op naam of lidmaatschapsnummer en lever ze als LazyMember."""
+    candidate_ids = find_candidate_ids(conn, search_term)
+    if candidate_ids is None:
+        # Te korte zoekterm voor de trigramindex: doorzoek de hele tabel
+        yield from scan_members(conn, search_term)
+        return
+
+    member_id = get_member_id(conn, search_term)
+    if member_id is not None and member_id not in candidate_ids:
+        candidate_ids.append(member_id)
+
+    # Alleen de kandidaten worden ontsleuteld voor de definitieve controle
+    for candidate_id in candidate_ids:
+        member = LazyMember(conn, candidate_id)
+        try:
+            if member_matches(member, search_term):
+                yield member
+        except KeyError:
+            continue
+
 def search_member(conn, search_key):
-    cur = conn.cursor()
-    sql = """SELECT * FROM members WHERE
-             first_name LIKE ? OR last_name LIKE ? OR address LIKE ? OR email LIKE ? OR phone LIKE ? OR membership_id LIKE ?"""
-    search_key = f"%{search_key}%"
-    cur.execute(sql, (search_key, search_key, search_key, search_key, search_key, search_key))
-    rows = cur.fetchall()
-    return rows
+    """Retourneer alle leden die overeenkomen met de zoekterm als dicts."""
+    return [member.to_dict() for member in search_members(conn, search_key)]
 
 def search_member_prompt(conn):
     """Prompt de gebruiker om een lid te zoeken."""
     search_term = input("Voer de voornaam, achternaam of lidnummer in om te zoeken: ").strip()
 
     try:
-        # Haal alle leden op
-        sql_fetch_all = "SELECT first_name, last_name, membership_id, age, gender, weight, address, email, phone FROM members"
-        cur = conn.cursor()
-        cur.execute(sql_fetch_all)
-        rows = cur.fetchall()
-
-        found_members = []
-
-        # Ontsleutel en zoek in de relevante velden
-        for row in rows:
+        # Ontsleutel en zoek in de relevante velden; resultaten worden getoond zodra ze binnenkomen
+        found = False
+        for member in search_members(conn, search_term):
+            if not found:
+                print("Gevonden leden:")
+                found = True
             try:
-                decrypted_first_name = decrypt_data(row[0])
-                decrypted_last_name = decrypt_data(row[1])
-                decrypted_membership_id = decrypt_data(row[2])
-                decrypted_age = decrypt_data(row[3])  # Correct ontsleutelen
-                decrypted_gender = decrypt_data(row[4])
-                decrypted_weight = decrypt_data(row[5])  # Correct ontsleutelen
-                decrypted_address = decrypt_data(row[6])
-                decrypted_email = decrypt_data(row[7])
-                decrypted_phone = decrypt_data(row[8])
-
-                # Controleer of een van de velden overeenkomt met de zoekterm
-                if (search_term.lower() in decrypted_first_name.lower() or
-                    search_term.lower() in decrypted_last_name.lower() or
-                    search_term == decrypted_membership_id):
-                    found_members.append({
-                        "first_name": decrypted_first_name,
-                        "last_name": decrypted_last_name,
-                        "membership_id": decrypted_membership_id,
-                        "age": decrypted_age,
-                        "gender": decrypted_gender,
-                        "weight": decrypted_weight,
-                        "address": decrypted_address,
-                        "email": decrypted_email,
-                        "phone": decrypted_phone
-                    })
+                # De overige kolommen worden alleen voor gevonden leden opgehaald en ontsleuteld
+                member = member.to_dict()
             except Exception as e:
                 logging.error(f"Error decrypting data: {e}")
-                # Optionally, print a message if you want to notify about decryption issues
                 print(f"Fout bij het ontsleutelen van gegevens voor een lid: {e}")
+                continue
+            print(f"Voornaam: {member['first_name']}, Achternaam: {member['last_name']}, Lidnummer: {member['membership_id']}, Leeftijd: {member['age']}, Geslacht: {member['gender']}, Gewicht: {member['weight']}, Adres: {member['address']}, Email: {member['email']}, Telefoon: {member['phone']}")
 
-        # Resultaten weergeven
-        if found_members:
-            print("Gevonden leden:")
-            for member in found_members:
-                print(f"Voornaam: {member['first_name']}, Achternaam: {member['last_name']}, Lidnummer: {member['membership_id']}, Leeftijd: {member['age']}, Geslacht: {member['gender']}, Gewicht: {member['weight']}, Adres: {member['address']}, Email: {member['email']}, Telefoon: {member['phone']}")
-        else:
+        if not found:
             print("Geen leden gevonden die overeenkomen met de zoekterm.")
     except Error as e:
         logging.error(f"Error searching member: {e}")
@@ -202,20 +239,8 @@ def update_member(conn, membership_id):
     """Update de informatie van een lid op basis van het lidmaatschapsnummer."""
     print("Update informatie van lid.")
 
-    # Eerst alle leden ophalen en decrypten
-    sql_fetch_all = "SELECT id, first_name, last_name, membership_id FROM members"
-    cur = conn.cursor()
-    cur.execute(sql_fetch_all)
-    rows = cur.fetchall()
-
-    member_id = None
-
     # Zoek het lid op basis van het lidmaatschapsnummer
-    for row in rows:
-        decrypted_membership_id = decrypt_data(row[3])
-        if decrypted_membership_id == membership_id:
-            member_id = row[0]
-            break
+    member_id = get_member_id(conn, membership_id)
 
     if not member_id:
         print(f"Lid met lidmaatschapsnummer {membership_id} niet gevonden.")
@@ -291,20 +316,21 @@ def update_member(conn, membership_id):
         print("Ongeldig telefoonnummer. Gebruik het formaat +31-6-XXXXXXXX.")
 
     # Update het lid in de database
-    sql_update = '''UPDATE members SET first_name=?, last_name=?, age=?, gender=?, weight=?, address=?, email=?, phone=? WHERE id=?'''
+    save_member(conn, member_id, first_name, last_name, age, gender, weight, address, email, phone, membership_id)
+    print(f"Lid {first_name} {last_name} succesvol bijgewerkt.")
+
+def save_member(conn, member_id, first_name, last_name, age, gender, weight, address, email, phone, membership_id=None):
+    """Sla nieuwe gegevens op voor een bestaand lid (op database-id); het lid krijgt daarbij het record-formaat."""
+    if membership_id is None:
+        membership_id = LazyMember(conn, member_id)["membership_id"]
+    sql_update = f"UPDATE members SET record=?, {CLEAR_FIELD_COLUMNS} WHERE id=?"
+    cur = conn.cursor()
     cur.execute(sql_update, (
-        encrypt_data(first_name), 
-        encrypt_data(last_name), 
-        encrypt_data(str(age)), 
-        encrypt_data(gender), 
-        encrypt_data(str(weight)), 
-        encrypt_data(address), 
-        encrypt_data(email), 
-        encrypt_data(phone), 
+        encrypt_member_record(first_name, last_name, age, gender, weight, address, email, phone, membership_id),
         member_id
     ))
+    index_member_names(conn, member_id, first_name, last_name)
     conn.commit()
-    print(f"Lid {first_name} {last_name} succesvol bijgewerkt.")
 
 def update_member_prompt(conn, member_id=None):
     """Prompt de gebruiker om een lid bij te werken."""
@@ -314,25 +340,17 @@ def update_member_prompt(conn, member_id=None):
 
 def delete_member(conn, member_id):
     """Verwijder een lid uit de database op basis van het lidmaatschapsnummer."""
-    # Haal alle leden op en decrypt de lidmaatschapsnummers om het juiste lid te vinden
-    sql_fetch_all = "SELECT id, membership_id FROM members"
-    cur = conn.cursor()
-    cur.execute(sql_fetch_all)
-    rows = cur.fetchall()
-
-    member_db_id = None
-
-    for row in rows:
-        decrypted_membership_id = decrypt_data(row[1])
-        if decrypted_membership_id == member_id:
-            member_db_id = row[0]
-            break
+    # Zoek het juiste lid op via de blinde index van het lidmaatschapsnummer
+    member_db_id = get_member_id(conn, member_id)
 
     if member_db_id:
         sql_delete = 'DELETE FROM members WHERE id = ?'
+        cur = conn.cursor()
         cur.execute(sql_delete, (member_db_id,))
+        deleted = cur.rowcount
+        remove_member_names(conn, member_db_id)
         conn.commit()
-        return cur.rowcount  # Geeft het aantal verwijderde rijen terug
+        return deleted  # Geeft het aantal verwijderde rijen terug
     else:
         print(f"Lid met lidmaatschapsnummer {member_id} is niet gevonden.")
         return 0
@@ -0,0 +1,155 @@
+# member_import.py
+import os
+import csv
+import json
+import logging
+import argparse
+from datetime import datetime
+from sqlite3 import Error
+from encrypt_decrypt import blind_index
+from member_record import encrypt_member_record
+from name_index import name_tokens
+from log import log_activity, log_suspicious_activity
+from member import validate_member_fields, generate_membership_id
+
+# Instellingen voor het importeren van leden in bulk
+IMPORT_BATCH_SIZE = 500  # Rijen per transactie (en per auditregel)
+IMPORT_WORKERS = os.cpu_count() or 1
+IMPORT_LOOKUP_SIZE = 500  # Blinde indexen per opzoekquery; blijft onder de parameterlimiet van oudere SQLite-versies
+USE_PROCESSES = True  # False gebruikt een thread pool in plaats van een process pool
+
+def read_import_file(path):
+    """Lees een CSV- of JSONL-bestand en geef (regelnummer, record) per lid; ongeldige JSON geeft een foutmelding als record."""
+    with open(path, "r", newline="", encoding="utf-8") as import_file:
+        if path.lower().endswith((".jsonl", ".json")):
+            for line_number, line in enumerate(import_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = f"Ongeldige JSON: {e}"
+                yield line_number, record if isinstance(record, (dict, str)) else "Verwacht een JSON-object."
+        else:
+            reader = csv.DictReader(import_file)
+            for record in reader:
+                yield reader.line_num, record
+
+def encrypt_import_batch(rows):
+    """Versleutel een blok gevalideerde leden en bereken hun blinde indexen; draait in een worker."""
+    encrypted_rows = []
+    for first_name, last_name, age, gender, weight, address, email, phone, membership_id in rows:
+        record = encrypt_member_record(first_name, last_name, age, gender, weight, address, email, phone, membership_id)
+        encrypted_rows.append((record, blind_index(membership_id, "membership_id"),
+                               sorted(name_tokens(first_name, last_name))))
+    return encrypted_rows
+
+def insert_import_batch(conn, encrypted_rows):
+    """Voeg een blok versleutelde leden en hun naamtokens in één transactie toe."""
+    registration_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cur = conn.cursor()
+    try:
+        cur.executemany("""INSERT INTO members (first_name, last_name, membership_id, record, registration_date, membership_id_hash)
+                           VALUES ('', '', '', ?, ?, ?)""",
+                        [(record, registration_date, id_hash) for record, id_hash, _ in encrypted_rows])
+        # executemany geeft geen lastrowid per rij; de unieke blinde index koppelt de naamtokens aan de nieuwe id's
+        member_ids = {}
+        id_hashes = [id_hash for _, id_hash, _ in encrypted_rows]
+        for start in range(0, len(id_hashes), IMPORT_LOOKUP_SIZE):
+            chunk = id_hashes[start:start + IMPORT_LOOKUP_SIZE]
+            cur.execute(f"SELECT membership_id_hash, id FROM members WHERE membership_id_hash IN ({', '.join('?' for _ in chunk)})",
+                        chunk)
+            member_ids.update(cur.fetchall())
+        cur.executemany("INSERT INTO member_name_tokens (token, member_id) VALUES (?, ?)",
+                        [(token, member_ids[id_hash]) for _, id_hash, tokens in encrypted_rows for token in tokens])
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+
+def import_members(conn, path, username="system", batch_size=None, workers=None, use_processes=None):
+    """Importeer leden uit een CSV- of JSONL-bestand; retourneert (aantal geïmporteerd, lijst van (regel, reden))."""
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    workers = workers or IMPORT_WORKERS
+    use_processes = USE_PROCESSES if use_processes is None else use_processes
+    source = os.path.basename(path)
+    rejects = []
+
+    # Valideer in het hoofdproces; lidmaatschapsnummers moeten ook binnen het bestand uniek zijn
+    batches = []
+    batch = []
+    batch_lines = []
+    used_ids = set()
+    for line_number, record in read_import_file(path):
+        try:
+            if isinstance(record, str):
+                raise ValueError(record)
+            fields = validate_member_fields(record)
+        except ValueError as e:
+            rejects.append((line_number, str(e)))
+            continue
+        membership_id = generate_membership_id(conn)
+        while membership_id in used_ids:
+            membership_id = generate_membership_id(conn)
+        used_ids.add(membership_id)
+        batch.append((*fields, membership_id))
+        batch_lines.append(line_number)
+        if len(batch) >= batch_size:
+            batches.append((batch, batch_lines))
+            batch, batch_lines = [], []
+    if batch:
+        batches.append((batch, batch_lines))
+
+    imported = 0
+    from concurrent.futures import ThreadPoolExecutor  # Pas laden als er echt geïmporteerd wordt
+    from worker_pool import process_pool
+    use_processes = use_processes and len(batches) > 1
+    with (process_pool(workers) if use_processes else ThreadPoolExecutor(max_workers=workers)) as executor:
+        # Versleutel parallel en voeg de blokken in volgorde toe zodra ze klaar zijn
+        encrypted_batches = executor.map(encrypt_import_batch, [rows for rows, _ in batches])
+        for batch_number, ((rows, lines), encrypted_rows) in enumerate(zip(batches, encrypted_batches), start=1):
+            try:
+                insert_import_batch(conn, encrypted_rows)
+            except Error as e:
+                logging.error(f"Error importing batch {batch_number} from {source}: {e}")
+                rejects.extend((line_number, f"Databasefout in blok {batch_number}: {e}") for line_number in lines)
+                log_suspicious_activity(username, "Failed to import members", f"Batch {batch_number} from {source}: {len(rows)} rows")
+                continue
+            imported += len(rows)
+            log_activity(username, "Members imported", f"Batch {batch_number} from {source}: {len(rows)} members")
+
+    rejects.sort()
+    return imported, rejects
+
+def import_members_prompt(conn, username="system"):
+    path = input("Pad naar het importbestand (CSV of JSONL): ").strip()
+    if not os.path.exists(path):
+        print("Importbestand niet gevonden.")
+        return
+    try:
+        imported, rejects = import_members(conn, path, username)
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        logging.error(f"Error reading import file {path}: {e}")
+        print(f"Importbestand kon niet gelezen worden: {e}")
+        return
+    for line_number, reason in rejects:
+        print(f"Regel {line_number} overgeslagen: {reason}")
+    print(f"{imported} leden geïmporteerd, {len(rejects)} regels afgewezen.")
+
+if __name__ == "__main__":
+    from connection import get_connection_manager
+    parser = argparse.ArgumentParser(description="Importeer leden uit een CSV- of JSONL-bestand.")
+    parser.add_argument("path")
+    parser.add_argument("--username", default="system", help="Gebruikersnaam voor de auditlog")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    args = parser.parse_args()
+
+    manager = get_connection_manager("data/unique_meal.db")
+    try:
+        imported, rejects = import_members(manager.writer, args.path, args.username, args.batch_size, args.workers)
+        for line_number, reason in rejects:
+            print(f"Regel {line_number} overgeslagen: {reason}")
+        print(f"{imported} leden geïmporteerd, {len(rejects)} regels afgewezen.")
+    finally:
+        manager.close()
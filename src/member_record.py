@@ -0,0 +1,65 @@
+# member_record.py
+import json
+import time
+import logging
+from encrypt_decrypt import encrypt_data, decrypt_data, decrypt_many
+
+# Velden die samen als één versleuteld record in members.record staan
+RECORD_FIELDS = ["first_name", "last_name", "age", "gender", "weight", "address", "email", "phone", "membership_id"]
+RECORD_MIGRATION_CHUNK_SIZE = 500  # Rijen per gecommitte transactie tijdens de migratie
+
+# De oude kolommen blijven bestaan (SQLite kan NOT NULL niet laten vallen) maar zijn leeg bij rijen met een record
+CLEAR_FIELD_COLUMNS = "first_name='', last_name='', age=NULL, gender=NULL, weight=NULL, address=NULL, email=NULL, phone=NULL, membership_id=''"
+
+def encrypt_member_record(first_name, last_name, age, gender, weight, address, email, phone, membership_id):
+    """Versleutel alle gevoelige velden van een lid samen als één token."""
+    values = [first_name, last_name, str(age), gender, str(weight), address, email, phone, membership_id]
+    return encrypt_data(json.dumps(dict(zip(RECORD_FIELDS, values)), separators=(",", ":"), ensure_ascii=False))
+
+def decrypt_member_record(record):
+    """Ontsleutel een record-token naar een dict met alle velden."""
+    return json.loads(decrypt_data(record))
+
+def decode_member_row(record, field_values):
+    """Ontsleutel een rij in het record-formaat of in het oude formaat (een token per kolom in RECORD_FIELDS-volgorde)."""
+    if record is not None:
+        return decrypt_member_record(record)
+    return dict(zip(RECORD_FIELDS, decrypt_many(field_values)))
+
+def migrate_member_records(conn, chunk_size=None, report=print):
+    """Zet leden in het oude formaat in blokken om naar één record per rij; kan draaien terwijl de applicatie in gebruik is."""
+    chunk_size = chunk_size or RECORD_MIGRATION_CHUNK_SIZE
+    cur = conn.cursor()
+    total = cur.execute("SELECT COUNT(*) FROM members WHERE record IS NULL").fetchone()[0]
+    sql_select = f"SELECT id, {', '.join(RECORD_FIELDS)} FROM members WHERE record IS NULL AND id > ? ORDER BY id LIMIT ?"
+    # Een rij die intussen via save_member is bijgewerkt heeft al een record en wordt niet overschreven
+    sql_update = f"UPDATE members SET record=?, {CLEAR_FIELD_COLUMNS} WHERE id=? AND record IS NULL"
+    started = time.perf_counter()
+    after_id = migrated = failed = 0
+    while True:
+        rows = cur.execute(sql_select, (after_id, chunk_size)).fetchall()
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        updates = []
+        for member_id, *field_values in rows:
+            try:
+                updates.append((encrypt_member_record(*decrypt_many(field_values)), member_id))
+            except Exception as e:
+                logging.error(f"Error migrating member ID {member_id} to record format: {e}")
+                failed += 1
+        with conn:
+            conn.executemany(sql_update, updates)
+        migrated += len(updates)
+        report(f"{migrated + failed}/{total} leden omgezet ({(migrated + failed) / (time.perf_counter() - started):.0f} rijen/s)")
+    return migrated, failed
+
+if __name__ == "__main__":
+    from connection import get_connection_manager
+    # De schrijfverbinding commit per blok; lezers van de applicatie kunnen via WAL doorwerken
+    manager = get_connection_manager("data/unique_meal.db")
+    try:
+        migrated, failed = migrate_member_records(manager.writer)
+        print(f"{migrated} leden omgezet naar het record-formaat, {failed} mislukt.")
+    finally:
+        manager.close()
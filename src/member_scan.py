@@ -0,0 +1,145 @@
+# member_scan.py
+import os
+import logging
+from encrypt_decrypt import decrypt_data, decrypt_many
+from member_record import decrypt_member_record
+
+# Instellingen voor het parallel doorzoeken van de ledentabel
+SCAN_WORKERS = os.cpu_count() or 1
+SCAN_CHUNK_SIZE = 2000
+PARALLEL_THRESHOLD = 25000  # Kleinere tabellen zijn serieel sneller, ook met al draaiende workers
+USE_PROCESSES = True  # False gebruikt een thread pool in plaats van een process pool
+
+MEMBER_COLUMNS = ["first_name", "last_name", "membership_id", "age", "gender", "weight", "address", "email", "phone"]
+MATCH_COLUMNS = ["first_name", "last_name", "membership_id"]  # Alleen deze kolommen zijn nodig om te zoeken
+
+class LazyMember:
+    """Een lid waarvan een kolom pas wordt opgehaald en ontsleuteld bij het eerste lezen."""
+
+    def __init__(self, conn, member_id, decrypted=None, encrypted=None):
+        self.conn = conn
+        self.id = member_id
+        self._decrypted = dict(decrypted or {})
+        self._encrypted = dict(encrypted or {})
+
+    def _load_encrypted(self):
+        """Haal alle nog niet geladen kolommen in één query op."""
+        missing = [column for column in MEMBER_COLUMNS if column not in self._decrypted and column not in self._encrypted]
+        cur = self.conn.cursor()
+        cur.execute(f"SELECT record, {', '.join(missing)} FROM members WHERE id=?", (self.id,))
+        row = cur.fetchone()
+        if row is None:
+            raise KeyError(f"Member ID {self.id} no longer exists")
+        if row[0] is not None:
+            # Record-formaat: één ontsleuteling levert alle kolommen op
+            record = decrypt_member_record(row[0])
+            self._decrypted.update({column: record[column] for column in missing})
+        else:
+            self._encrypted.update(zip(missing, row[1:]))
+
+    def __getitem__(self, column):
+        if column not in self._decrypted:
+            if column not in MEMBER_COLUMNS:
+                raise KeyError(column)
+            if column not in self._encrypted:
+                self._load_encrypted()
+            if column not in self._decrypted:
+                value = self._encrypted.pop(column)
+                self._decrypted[column] = None if value is None else decrypt_data(value)
+        return self._decrypted[column]
+
+    def to_dict(self):
+        """Ontsleutel alle kolommen en retourneer ze als dict."""
+        return {column: self[column] for column in MEMBER_COLUMNS}
+
+def member_matches(member, search_term):
+    """Controleer of een ontsleuteld lid overeenkomt met de zoekterm."""
+    return (search_term.lower() in member["first_name"].lower() or
+            search_term.lower() in member["last_name"].lower() or
+            search_term == member["membership_id"])
+
+def scan_chunk(rows, search_term):
+    """Ontsleutel de zoekkolommen van een blok (id, record, ...) rijen en retourneer (gevonden leden, foutmeldingen)."""
+    found_members = []
+    errors = []
+    for row in rows:
+        try:
+            # Bij het record-formaat levert één ontsleuteling het hele lid op
+            member = decrypt_member_record(row[1]) if row[1] is not None else dict(zip(MATCH_COLUMNS, decrypt_many(row[2:])))
+            if member_matches(member, search_term):
+                member["id"] = row[0]
+                found_members.append(member)
+        except Exception as e:
+            errors.append(str(e))
+    return found_members, errors
+
+def _fetch_match_columns(conn):
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, record, {', '.join(MATCH_COLUMNS)} FROM members")
+    return cur
+
+def _lazy_members(conn, found_members):
+    for member in found_members:
+        yield LazyMember(conn, member.pop("id"), member)
+
+def _report_errors(errors):
+    for error in errors:
+        logging.error(f"Error decrypting data: {error}")
+        print(f"Fout bij het ontsleutelen van gegevens voor een lid: {error}")
+
+def scan_members_serial(conn, search_term):
+    """Doorzoek alle leden op één kern; het pad voor kleine tabellen."""
+    cur = _fetch_match_columns(conn)
+    while True:
+        rows = cur.fetchmany(SCAN_CHUNK_SIZE)
+        if not rows:
+            break
+        found_members, errors = scan_chunk(rows, search_term)
+        _report_errors(errors)
+        yield from _lazy_members(conn, found_members)
+
+def scan_members(conn, search_term, workers=None, chunk_size=None, use_processes=None, threshold=None):
+    """Doorzoek alle leden parallel in blokken en lever overeenkomsten als LazyMember zodra een blok klaar is."""
+    workers = workers or SCAN_WORKERS
+    chunk_size = chunk_size or SCAN_CHUNK_SIZE
+    use_processes = USE_PROCESSES if use_processes is None else use_processes
+    threshold = PARALLEL_THRESHOLD if threshold is None else threshold
+
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM members")
+    if workers <= 1 or cur.fetchone()[0] < threshold:
+        yield from scan_members_serial(conn, search_term)
+        return
+
+    # Pas hier laden: een process pool (multiprocessing) is alleen nodig voor grote tabellen
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+    from worker_pool import shared_process_pool, close_shared_pool
+    cur = _fetch_match_columns(conn)
+    # De process pool blijft na de zoekopdracht bestaan; opstarten kost per worker meer dan het zoeken zelf
+    thread_pool = None if use_processes else ThreadPoolExecutor(max_workers=workers)
+    executor = shared_process_pool(workers) if use_processes else thread_pool
+    pending = set()
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if rows:
+                pending.add(executor.submit(scan_chunk, rows, search_term))
+            # Houd het aantal openstaande blokken beperkt zodat niet de hele tabel in het geheugen komt
+            if pending and (len(pending) >= workers * 2 or not rows):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    found_members, errors = future.result()
+                    _report_errors(errors)
+                    yield from _lazy_members(conn, found_members)
+            if not rows and not pending:
+                break
+    except BrokenProcessPool:
+        close_shared_pool()  # De volgende zoekopdracht start nieuwe workers
+        raise
+    finally:
+        # Een zoekopdracht die niet tot het einde gelezen wordt laat geen blokken achter in de gedeelde pool
+        for future in pending:
+            future.cancel()
+        if thread_pool is not None:
+            thread_pool.shutdown(wait=False)
@@ -0,0 +1,224 @@
+# metrics.py
+import os
+import time
+import atexit
+import bisect
+import logging
+import functools
+import threading
+from contextlib import nullcontext
+
+# Zet UNIQUE_MEAL_METRICS=1 om tellingen en latenties te verzamelen; uit kost het (vrijwel) niets
+METRICS_ENABLED = os.environ.get("UNIQUE_MEAL_METRICS") == "1"
+METRICS_FILE = os.environ.get("UNIQUE_MEAL_METRICS_FILE", "data/metrics.prom")  # Prometheus-tekstformaat
+METRICS_WRITE_INTERVAL = int(os.environ.get("UNIQUE_MEAL_METRICS_INTERVAL", "15"))  # Seconden tussen twee dumps
+METRIC_PREFIX = "unique_meal_"
+# Bovengrenzen van de histogram-buckets in seconden; van een enkele SQL-query tot een volledige back-up
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    "sql_seconds": "Latency of SQL statements by operation and table.",
+    "crypto_seconds": "Latency of field encryption and decryption calls.",
+    "audit_log_seconds": "Latency of audit log submits and batched writes.",
+    "audit_log_records_total": "Audit log records written to the database.",
+    "menu_action_seconds": "Duration of menu actions, including user input.",
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels, extra=None):
+    pairs = [*labels, *([extra] if extra else [])]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class MetricsRegistry:
+    """Houdt tellers en latentie-histogrammen per metriek en labelcombinatie bij."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (naam, labels) -> [tellingen per bucket..., +Inf, som]
+        self._counters = {}  # (naam, labels) -> waarde
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        """Tel een meting in de histogram van key = (naam, labels)."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def increment(self, key, amount=1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """De huidige stand in het Prometheus-tekstformaat."""
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for kind, series in (("histogram", histograms), ("counter", counters)):
+            for name in sorted({name for name, _ in series}):
+                metric = METRIC_PREFIX + name
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {metric} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for (series_name, labels), values in sorted(series.items()):
+                    if series_name != name:
+                        continue
+                    if kind == "counter":
+                        lines.append(f"{metric}{_format_labels(labels)} {values}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*self.buckets, "+Inf"), values[:-1]):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {values[-1]:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def metric_key(name, **labels):
+    """Sleutel voor observe/increment; labels liggen vast in een gesorteerde tuple."""
+    return name, tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    if METRICS_ENABLED:
+        registry.observe(metric_key(name, **labels), seconds)
+
+def increment(name, amount=1, **labels):
+    if METRICS_ENABLED:
+        registry.increment(metric_key(name, **labels), amount)
+
+class _Timer:
+    __slots__ = ("key", "started")
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        registry.observe(self.key, time.perf_counter() - self.started)
+
+_NO_TIMER = nullcontext()
+
+def measure(name, **labels):
+    """Contextmanager die de duur van het blok meet; een gedeelde no-op als metrics uit staan."""
+    if not METRICS_ENABLED:
+        return _NO_TIMER
+    return _Timer(metric_key(name, **labels))
+
+def timed(name, **labels):
+    """Decorator die elke aanroep meet; als metrics uit staan blijft de functie ongewijzigd."""
+    def decorate(function):
+        if not METRICS_ENABLED:
+            return function
+        key = metric_key(name, **labels)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.observe(key, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def write_metrics(path=None):
+    """Schrijf de metrics atomisch naar het Prometheus-tekstbestand."""
+    path = path or METRICS_FILE
+    with open(path + ".tmp", "w") as metrics_file:
+        metrics_file.write(registry.render())
+    os.replace(path + ".tmp", path)
+
+class MetricsWriter:
+    """Schrijft de metrics periodiek weg, zodat bijvoorbeeld node_exporter of een collega ze kan volgen."""
+
+    def __init__(self, path=None, interval=METRICS_WRITE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not METRICS_ENABLED or self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                write_metrics(self.path)
+            except OSError as e:
+                logging.error(f"Writing metrics failed: {e}")
+
+_export = True
+
+def stop_export():
+    """Schrijf in dit proces geen metrics-bestand weg, bijvoorbeeld in een workerproces."""
+    global _export
+    _export = False
+
+def _write_at_exit():
+    if not _export:
+        return
+    try:
+        write_metrics()
+    except OSError as e:
+        logging.error(f"Writing metrics failed: {e}")
+
+if METRICS_ENABLED:
+    atexit.register(_write_at_exit)
+
+def bucket_quantile(buckets, quantile):
+    """Schat een kwantiel uit cumulatieve (bovengrens, aantal)-buckets, zoals histogram_quantile in Prometheus."""
+    total = buckets[-1][1]
+    if not total:
+        return None
+    rank = quantile * total
+    lower_bound, lower_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound  # Boven de hoogste bucket valt niets te interpoleren
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / ((count - lower_count) or 1)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+def read_quantiles(path=None, quantiles=(0.5, 0.99)):
+    """Lees een metrics-bestand en retourneer {serie: (aantal, kwantielen...)} voor elke histogram."""
+    series = {}
+    with open(path or METRICS_FILE) as metrics_file:
+        for line in metrics_file:
+            if "_bucket{" not in line:
+                continue
+            name_labels, count = line.rsplit(" ", 1)
+            name_labels, bound = name_labels.rsplit('le="', 1)
+            name = name_labels.replace("_bucket{", "{").rstrip(",") + "}"
+            series.setdefault(name.replace("{}", ""), []).append((float(bound.rstrip('"}')), int(count)))
+    return {name: (buckets[-1][1], *(bucket_quantile(buckets, q) for q in quantiles)) for name, buckets in series.items()}
+
+if __name__ == "__main__":
+    # Overzicht van de laatst weggeschreven metrics: aantallen en geschatte p50/p99 per serie
+    print(f"{'serie':<70} {'aantal':>9} {'p50':>10} {'p99':>10}")
+    for name, (count, p50, p99) in sorted(read_quantiles().items()):
+        if count:
+            print(f"{name:<70} {count:>9} {p50 * 1000:>8.3f}ms {p99 * 1000:>8.3f}ms")
@@ -0,0 +1,82 @@
+# name_index.py
+import logging
+from sqlite3 import Error
+from encrypt_decrypt import blind_index, decrypt_many
+from member_record import decrypt_member_record
+
+NGRAM_SIZE = 3
+
+def name_ngrams(value):
+    """Geef de verzameling trigrammen van een (kleingeschreven) waarde."""
+    value = value.lower()
+    return {value[i:i + NGRAM_SIZE] for i in range(len(value) - NGRAM_SIZE + 1)}
+
+def name_tokens(first_name, last_name):
+    """Bereken de versleutelde tokens voor de voor- en achternaam van een lid."""
+    ngrams = name_ngrams(first_name) | name_ngrams(last_name)
+    return {blind_index(ngram, "name_ngram") for ngram in ngrams}
+
+def create_name_index_table(conn):
+    """Maak de tokentabel en de indexen voor de naamzoekindex aan."""
+    cur = conn.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS member_name_tokens (
+                       token text NOT NULL,
+                       member_id integer NOT NULL
+                   );""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_member_name_tokens_token ON member_name_tokens (token, member_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_member_name_tokens_member ON member_name_tokens (member_id)")
+
+def index_member_names(conn, member_id, first_name, last_name):
+    """Werk de tokens van één lid bij; de aanroeper commit de transactie."""
+    remove_member_names(conn, member_id)
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO member_name_tokens (token, member_id) VALUES (?, ?)",
+                    [(token, member_id) for token in name_tokens(first_name, last_name)])
+
+def remove_member_names(conn, member_id):
+    """Verwijder de tokens van één lid; de aanroeper commit de transactie."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM member_name_tokens WHERE member_id=?", (member_id,))
+
+def find_candidate_ids(conn, search_term):
+    """Zoek id's van leden met alle trigrammen van de zoekterm; None als de term te kort is."""
+    ngrams = name_ngrams(search_term)
+    if not ngrams:
+        return None
+    tokens = [blind_index(ngram, "name_ngram") for ngram in ngrams]
+    placeholders = ", ".join("?" for _ in tokens)
+    cur = conn.cursor()
+    cur.execute(f"""SELECT member_id FROM member_name_tokens WHERE token IN ({placeholders})
+                    GROUP BY member_id HAVING COUNT(DISTINCT token) = ?""", (*tokens, len(tokens)))
+    return [row[0] for row in cur.fetchall()]
+
+def rebuild_name_index(conn):
+    """Bouw de naamzoekindex opnieuw op voor alle bestaande leden."""
+    create_name_index_table(conn)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM member_name_tokens")
+    cur.execute("SELECT id, record, first_name, last_name FROM members")
+    indexed = 0
+    for member_id, record, encrypted_first_name, encrypted_last_name in cur.fetchall():
+        try:
+            if record is not None:
+                member = decrypt_member_record(record)
+                first_name, last_name = member["first_name"], member["last_name"]
+            else:
+                first_name, last_name = decrypt_many([encrypted_first_name, encrypted_last_name])
+            index_member_names(conn, member_id, first_name, last_name)
+            indexed += 1
+        except Exception as e:
+            logging.error(f"Error indexing names for member ID {member_id}: {e}")
+    conn.commit()
+    return indexed
+
+if __name__ == "__main__":
+    from connection import get_connection_manager
+    manager = get_connection_manager("data/unique_meal.db")
+    try:
+        print(f"Naamzoekindex opnieuw opgebouwd voor {rebuild_name_index(manager.writer)} leden.")
+    except Error as e:
+        print(f"Fout bij het opbouwen van de naamzoekindex: {e}")
+    finally:
+        manager.close()
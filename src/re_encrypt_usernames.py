@@ -1,9 +1,9 @@
-import sqlite3
+from connection import get_connection_manager
 from encrypt_decrypt import encrypt_data, decrypt_data, hash_username
 
 def re_encrypt_usernames(db_file):
     try:
-        conn = sqlite3.connect(db_file)
+        conn = get_connection_manager(db_file).writer
         cursor = conn.cursor()
 
         # Haal alle gebruikers op
@@ -31,7 +31,7 @@ def re_encrypt_usernames(db_file):
     except Exception as e:
         print(f"Fout bij het opnieuw versleutelen van gebruikersnamen: {e}")
     finally:
-        conn.close()
+        get_connection_manager(db_file).close()
 
 if __name__ == "__main__":
     re_encrypt_usernames("data/unique_meal.db")
@@ -0,0 +1,353 @@
+# service.py
+import re
+import json
+import time
+import asyncio
+import logging
+import secrets
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+from connection import get_connection_manager
+from database import create_connection, initialize_database
+from backup import recover_interrupted_restore
+from encrypt_decrypt import key_manager
+from log import log_activity, log_suspicious_activity, audit_logger
+import metrics
+import member
+import user
+
+DATABASE = "data/unique_meal.db"
+SERVICE_HOST = "127.0.0.1"  # Alleen lokaal bereikbaar
+SERVICE_PORT = 8421
+SERVICE_WORKERS = 8  # Threads voor database- en crypto-werk buiten de event loop
+SESSION_TTL = 30 * 60  # Seconden inactiviteit voordat een sessietoken verloopt
+KEY_RELOAD_INTERVAL = 5.0  # Seconden tussen twee controles op een gewisselde sleutel
+MAX_BODY_SIZE = 64 * 1024
+
+ADMIN_ROLES = ['super_admin', 'system_admin']
+MEMBER_ROLES = ['super_admin', 'system_admin', 'consultant']
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+               404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+
+class ServiceError(Exception):
+    """Fout die als HTTP-status met melding naar de client gaat."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class Session:
+    def __init__(self, user_id, username, role):
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.expires = time.monotonic() + SESSION_TTL
+
+def _require_role(session, roles):
+    if session.role not in roles:
+        raise ServiceError(403, "Geen toegang voor deze rol.")
+
+def _require_fields(body, fields):
+    missing = [field for field in fields if not str(body.get(field, "")).strip()]
+    if missing:
+        raise ServiceError(400, f"Ontbrekende velden: {', '.join(missing)}")
+
+def _member_fields(body):
+    """Valideer lidgegevens met dezelfde regels als add_member_prompt."""
+    try:
+        return member.validate_member_fields(body)
+    except ValueError as e:
+        raise ServiceError(400, str(e))
+
+class MemberService:
+    """Voert de operaties uit member.py en user.py uit met dezelfde rolcontroles als main_menu."""
+
+    def __init__(self, database=DATABASE, workers=SERVICE_WORKERS):
+        self.database = database
+        self.manager = get_connection_manager(database)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service")
+        self.sessions = {}
+        self.routes = [
+            ("POST", r"/login", self.login, False),
+            ("POST", r"/logout", self.logout, True),
+            ("POST", r"/password", self.update_own_password, True),
+            ("GET", r"/members", self.search_members, True),
+            ("POST", r"/members", self.add_member, True),
+            ("PUT", r"/members/(?P<membership_id>[^/]+)", self.update_member, True),
+            ("DELETE", r"/members/(?P<membership_id>[^/]+)", self.delete_member, True),
+            ("GET", r"/users", self.list_users, True),
+            ("POST", r"/users", self.add_user, True),
+            ("PUT", r"/users/(?P<username>[^/]+)", self.update_user, True),
+            ("DELETE", r"/users/(?P<username>[^/]+)", self.delete_user, True),
+            ("POST", r"/users/(?P<username>[^/]+)/password", self.reset_password, True),
+        ]
+
+    def setup(self):
+        """Eenmalige opstart: schema, super admin en sleutels warm in het geheugen."""
+        recover_interrupted_restore(self.database)
+        conn = create_connection(self.database)
+        initialize_database(conn)
+        key_manager.cipher
+
+    def _session(self, token):
+        session = self.sessions.get(token)
+        if session is None or session.expires < time.monotonic():
+            self.sessions.pop(token, None)
+            raise ServiceError(401, "Ongeldige of verlopen sessie.")
+        session.expires = time.monotonic() + SESSION_TTL
+        return session
+
+    # Sessies
+
+    def login(self, session, query, body, token=None):
+        _require_fields(body, ["username", "password"])
+        username = body["username"]
+        with self.manager.reader() as conn:
+            result = user.validate_login(conn, username, body["password"])
+        if not result:
+            log_suspicious_activity(username, "Failed login attempt", "Via service")
+            raise ServiceError(401, "Ongeldige inloggegevens.")
+        user_id, role = result
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = Session(user_id, username, role)
+        log_activity(username, "Logged in", "Via service")
+        return 200, {"token": token, "role": role}
+
+    def logout(self, session, query, body, token=None):
+        self.sessions.pop(token, None)
+        log_activity(session.username, "Logged out", "Via service")
+        return 200, {}
+
+    def update_own_password(self, session, query, body, token=None):
+        _require_fields(body, ["password"])
+        if not user.is_valid_password(body["password"]):
+            raise ServiceError(400, "Ongeldig wachtwoord.")
+        with self.manager.transaction() as conn:
+            user.set_password(conn, session.user_id, body["password"])
+        log_activity(session.username, "Password updated", "User updated their password via service")
+        return 200, {}
+
+    # Leden
+
+    def search_members(self, session, query, body, token=None):
+        _require_role(session, MEMBER_ROLES)
+        search_term = query.get("q", [""])[0].strip()
+        if not search_term:
+            raise ServiceError(400, "Geef een zoekterm op met ?q=")
+        with self.manager.reader() as conn:
+            return 200, {"members": member.search_member(conn, search_term)}
+
+    def add_member(self, session, query, body, token=None):
+        _require_role(session, MEMBER_ROLES)
+        fields = _member_fields(body)
+        with self.manager.transaction() as conn:
+            membership_id = member.generate_membership_id(conn)
+            if not member.add_member(conn, *fields, membership_id):
+                raise ServiceError(500, "Lid toevoegen mislukt.")
+        return 201, {"membership_id": membership_id}
+
+    def update_member(self, session, query, body, token=None, membership_id=None):
+        _require_role(session, MEMBER_ROLES)
+        fields = _member_fields(body)
+        with self.manager.transaction() as conn:
+            member_id = member.get_member_id(conn, membership_id)
+            if member_id is None:
+                raise ServiceError(404, f"Lid met lidmaatschapsnummer {membership_id} niet gevonden.")
+            member.save_member(conn, member_id, *fields, membership_id)
+        log_activity(session.username, "Member updated", f"Membership ID: {membership_id}")
+        return 200, {}
+
+    def delete_member(self, session, query, body, token=None, membership_id=None):
+        _require_role(session, ADMIN_ROLES)
+        with self.manager.transaction() as conn:
+            if member.get_member_id(conn, membership_id) is None or not member.delete_member(conn, membership_id):
+                raise ServiceError(404, f"Lid met lidmaatschapsnummer {membership_id} niet gevonden.")
+        log_activity(session.username, "Member deleted", f"Membership ID: {membership_id}")
+        return 200, {}
+
+    # Gebruikersbeheer
+
+    def _managed_user(self, session, conn, username):
+        """Zoek een gebruiker op die deze sessie mag beheren, net als in main_menu."""
+        found = user.get_user_by_username(conn, username)
+        if found is None:
+            raise ServiceError(404, f"Gebruiker {username} niet gevonden.")
+        target_role = found[3]
+        if target_role == 'consultant':
+            _require_role(session, ADMIN_ROLES)
+        elif target_role == 'system_admin':
+            _require_role(session, ['super_admin'])
+        else:
+            raise ServiceError(403, "Deze gebruiker kan niet via de service beheerd worden.")
+        return found
+
+    def list_users(self, session, query, body, token=None):
+        _require_role(session, ADMIN_ROLES)
+        with self.manager.reader() as conn:
+            users = user.get_users(conn)
+        return 200, {"users": [{"username": username, "role": role} for username, role in users]}
+
+    def add_user(self, session, query, body, token=None):
+        _require_fields(body, ["username", "password", "role", "first_name", "last_name"])
+        role = body["role"]
+        if role == 'consultant':
+            _require_role(session, ADMIN_ROLES)
+        elif role == 'system_admin':
+            _require_role(session, ['super_admin'])
+        else:
+            raise ServiceError(400, "Rol moet 'consultant' of 'system_admin' zijn.")
+        if not user.is_valid_username(body["username"]) or not user.is_valid_password(body["password"]):
+            raise ServiceError(400, "Gebruikersnaam of wachtwoord voldoet niet aan de vereisten.")
+        with self.manager.transaction() as conn:
+            if user.username_exists(conn, body["username"]):
+                raise ServiceError(409, "Deze gebruikersnaam bestaat al.")
+            if user.add_user(conn, body["username"], body["password"], role, body["first_name"], body["last_name"]) is None:
+                # Een ander proces kan dezelfde naam net hebben toegevoegd; anders is het een databasefout
+                if user.username_exists(conn, body["username"]):
+                    raise ServiceError(409, "Deze gebruikersnaam bestaat al.")
+                raise ServiceError(500, "Gebruiker kon niet worden toegevoegd.")
+        return 201, {}
+
+    def update_user(self, session, query, body, token=None, username=None):
+        _require_fields(body, ["new_username", "first_name", "last_name"])
+        new_username = body["new_username"]
+        if not user.is_valid_username(new_username):
+            raise ServiceError(400, "Gebruikersnaam voldoet niet aan de vereisten.")
+        with self.manager.transaction() as conn:
+            found = self._managed_user(session, conn, username)
+            if new_username != username and user.username_exists(conn, new_username):
+                raise ServiceError(409, "Deze gebruikersnaam bestaat al.")
+            try:
+                updated = user.update_user(conn, found[0], new_username, body["first_name"], body["last_name"])
+            except sqlite3.IntegrityError:
+                raise ServiceError(409, "Deze gebruikersnaam bestaat al.")
+            if not updated:
+                raise ServiceError(500, "Gebruiker kon niet worden bijgewerkt.")
+        log_activity(session.username, "User updated", f"User {username} changed to {new_username} via service")
+        return 200, {}
+
+    def delete_user(self, session, query, body, token=None, username=None):
+        with self.manager.transaction() as conn:
+            found = self._managed_user(session, conn, username)
+            if not user.delete_user(conn, found[0]):
+                raise ServiceError(500, "Gebruiker kon niet worden verwijderd.")
+        return 200, {}
+
+    def reset_password(self, session, query, body, token=None, username=None):
+        _require_fields(body, ["password"])
+        if not user.is_valid_password(body["password"]):
+            raise ServiceError(400, "Ongeldig wachtwoord.")
+        with self.manager.transaction() as conn:
+            found = self._managed_user(session, conn, username)
+            user.set_password(conn, found[0], body["password"])
+        log_activity(session.username, "Password reset", f"Password for {username} was reset via service")
+        return 200, {}
+
+    # HTTP
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, handler, needs_session in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match:
+                if route_method == method:
+                    return handler, needs_session, {name: unquote(value) for name, value in match.groupdict().items()}
+                allowed = True
+        raise ServiceError(405 if allowed else 404, "Onbekende methode." if allowed else "Onbekend pad.")
+
+    async def handle(self, reader, writer):
+        """Verwerk één HTTP-verzoek; het database- en crypto-werk draait in de thread pool."""
+        status, payload = 500, {"error": "Interne fout."}
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_SIZE:
+                raise ServiceError(413, "Verzoek te groot.")
+            body = json.loads(await reader.readexactly(length)) if length else {}
+            if not isinstance(body, dict):
+                raise ServiceError(400, "Verwacht een JSON-object.")
+
+            url = urlsplit(target)
+            handler, needs_session, path_params = self._route(method.upper(), url.path)
+            token = headers.get("authorization", "").removeprefix("Bearer ").strip() or None
+            session = self._session(token) if needs_session else None
+
+            loop = asyncio.get_running_loop()
+            status, payload = await loop.run_in_executor(
+                self.executor, lambda: handler(session, parse_qs(url.query), body, token=token, **path_params))
+        except ServiceError as e:
+            status, payload = e.status, {"error": e.message}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {"error": f"Ongeldig verzoek: {e}"}
+        except Exception as e:
+            logging.error(f"Service error: {e}")
+        try:
+            data = json.dumps(payload).encode()
+            writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _reload_keys(self):
+        """Pak periodiek een geroteerde sleutel op zonder herstart; de controle leest de database, dus niet op de event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(KEY_RELOAD_INTERVAL)
+            try:
+                await loop.run_in_executor(self.executor, key_manager.reload_if_changed)
+            except Exception as e:
+                logging.error(f"Reloading keys failed: {e}")
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Unique Meal service luistert op http://{host}:{port}")
+        reload_task = asyncio.create_task(self._reload_keys())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reload_task.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        audit_logger.flush()
+        self.manager.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Start de Unique Meal service voor gelijktijdige clients.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(filename='data/system.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = MemberService(workers=args.workers)
+    service.setup()
+    metrics_writer = metrics.MetricsWriter()  # Alleen actief met UNIQUE_MEAL_METRICS=1
+    metrics_writer.start()
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Service gestopt.")
+    finally:
+        metrics_writer.stop()
+        service.close()
+
+if __name__ == '__main__':
+    main()
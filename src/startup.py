@@ -0,0 +1,54 @@
+# startup.py
+import os
+import sys
+import time
+import builtins
+
+# Zet UNIQUE_MEAL_STARTUP_REPORT=1 om na het opstarten te zien waar de tijd naartoe gaat
+STARTUP_REPORT = os.environ.get("UNIQUE_MEAL_STARTUP_REPORT") == "1"
+STARTUP_REPORT_THRESHOLD = 1.0  # Imports die sneller zijn (in ms, cumulatief) worden niet getoond
+
+_started = time.perf_counter()
+_phases = []  # (naam, seconden sinds de vorige fase)
+_imports = []  # (diepte, module, eigen tijd, cumulatieve tijd) in de volgorde waarin imports klaar zijn
+_stack = []  # Tijd die geneste imports van de lopende imports gebruikten
+_original_import = builtins.__import__
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """Meet net als -X importtime hoe lang het laden van een nog niet geladen module duurt."""
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = len(_stack)
+    _stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.perf_counter() - started
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1] += cumulative
+        _imports.append((depth, name, cumulative - nested, cumulative))
+
+if STARTUP_REPORT:
+    builtins.__import__ = _timed_import
+
+def mark(phase):
+    """Sluit een opstartfase af, bijvoorbeeld 'imports' of 'schema'."""
+    global _started
+    now = time.perf_counter()
+    _phases.append((phase, now - _started))
+    _started = now
+
+def report():
+    """Druk de opstarttijd per fase en de traagste imports af, en stop met meten."""
+    if not STARTUP_REPORT:
+        return
+    builtins.__import__ = _original_import
+    print(f"\nOpstarttijd: {sum(seconds for _, seconds in _phases) * 1000:.1f} ms")
+    for phase, seconds in _phases:
+        print(f"  {phase:<24} {seconds * 1000:>8.1f} ms")
+    print(f"Imports (eigen | cumulatief, vanaf {STARTUP_REPORT_THRESHOLD:g} ms):")
+    for depth, name, own, cumulative in _imports:
+        if cumulative * 1000 >= STARTUP_REPORT_THRESHOLD:
+            print(f"  {own * 1000:>7.1f} | {cumulative * 1000:>7.1f} ms  {'  ' * depth}{name}")
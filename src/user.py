@@ -1,5 +1,5 @@
 from datetime import datetime
-from encrypt_decrypt import encrypt_data, decrypt_data
+from encrypt_decrypt import encrypt_data, encrypt_many, decrypt_data, blind_index
 from log import log_activity, log_suspicious_activity
 from utils import hash_password  # Gebruik de hash_password-functie vanuit utils
 import sqlite3
@@ -37,24 +37,27 @@ def is_valid_password(password):
         return False
     return True
 
+def get_user_by_username(conn, username):
+    """Zoek een gebruiker op via de blinde index en retourneer (id, username, password, role)."""
+    cur = conn.cursor()
+    cur.execute("SELECT id, username, password, role FROM users WHERE username_hash=?", (blind_index(username),))
+    for row in cur.fetchall():
+        # Controleer de versleutelde waarde om botsingen in de index uit te sluiten
+        if decrypt_data(row[1]) == username:
+            return row
+    return None
+
 def validate_login(conn, username, password):
     try:
-        cursor = conn.cursor()
-        
-        # Haal alle gebruikers op en ontsleutel de gebruikersnamen
-        cursor.execute("SELECT id, username, password, role FROM users")
-        users = cursor.fetchall()
-        
-        for user in users:
-            decrypted_username = decrypt_data(user[1])  # Ontsleutel de gebruikersnaam
-            
-            if decrypted_username == username:
-                # Vergelijk gehasht wachtwoord
-                hashed_password = hash_password(password)
-                
-                if user[2] == hashed_password:
-                    return user[0], user[3]  # retourneer user_id en role
-        
+        user = get_user_by_username(conn, username)
+
+        if user:
+            # Vergelijk gehasht wachtwoord
+            hashed_password = hash_password(password)
+
+            if user[2] == hashed_password:
+                return user[0], user[3]  # retourneer user_id en role
+
         return None  # retourneer None als de inloggegevens ongeldig zijn
     except Exception as e:
         logging.error(f"Fout bij inloggen: {e}")
@@ -62,33 +65,35 @@ def validate_login(conn, username, password):
 
 # Voeg logging toe voor gebruikersbeheer
 def add_user(conn, username, password, role, first_name, last_name):
+    """Voeg een gebruiker toe en log het resultaat; retourneert het user_id of None als het toevoegen mislukte."""
     from database import insert_user  # Importeer alleen binnen de functie
     user_id = insert_user(conn, username, password, role, first_name, last_name)
     if user_id:
         log_activity(username, "User added", f"Role: {role}, Name: {first_name} {last_name}")
     else:
         log_suspicious_activity(username, "Failed to add user", f"Role: {role}, Name: {first_name} {last_name}")
+    return user_id
 
 def delete_user(conn, user_id):
+    """Verwijder een gebruiker en log het resultaat; retourneert of er een gebruiker verwijderd is."""
     from database import remove_user  # Importeer alleen binnen de functie
     if remove_user(conn, user_id):
         log_activity("system", "User deleted", f"User ID: {user_id}")
-    else:
-        log_suspicious_activity("system", "Failed to delete user", f"User ID: {user_id}")
+        return True
+    log_suspicious_activity("system", "Failed to delete user", f"User ID: {user_id}")
+    return False
+
+def update_user(conn, user_id, new_username, first_name, last_name):
+    """Wijzig de gebruikersnaam en naam van een gebruiker; retourneert of de gebruiker bestond."""
+    sql_update = "UPDATE users SET username=?, username_hash=?, first_name=?, last_name=? WHERE id=?"
+    cur = conn.cursor()
+    cur.execute(sql_update, (encrypt_data(new_username), blind_index(new_username), *encrypt_many([first_name, last_name]), user_id))
+    return cur.rowcount == 1
 
 def username_exists(conn, username):
     """Controleer of een gegeven gebruikersnaam al bestaat in de database."""
     try:
-        sql = "SELECT username FROM users"
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-
-        for row in rows:
-            decrypted_username = decrypt_data(row[0])
-            if decrypted_username == username:
-                return True
-        return False
+        return get_user_by_username(conn, username) is not None
     except Error as e:
         logging.error(f"Error checking for existing username: {e}")
         return False
@@ -120,20 +125,26 @@ def add_user_prompt(conn, default_role=None):
     # Als default_role niet is opgegeven, vraag dan de gebruiker om een rol in te voeren
     role = default_role if default_role else input("Rol: ")
 
-    encrypted_username = encrypt_data(username)  # Encrypt de gebruikersnaam voor opslag
+    # Encrypt de gebruikersnaam en namen voor opslag
+    encrypted_username, encrypted_first_name, encrypted_last_name = encrypt_many([username, first_name, last_name])
     hashed_password = hash_password(password)    # Hash het wachtwoord voor opslag
-    encrypted_first_name = encrypt_data(first_name)
-    encrypted_last_name = encrypt_data(last_name)
 
     try:
-        sql = """INSERT INTO users (username, password, role, first_name, last_name, registration_date)
-                 VALUES (?, ?, ?, ?, ?, ?)"""
+        sql = """INSERT INTO users (username, username_hash, password, role, first_name, last_name, registration_date)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)"""
         cur = conn.cursor()
-        cur.execute(sql, (encrypted_username, hashed_password, role, encrypted_first_name, encrypted_last_name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        cur.execute(sql, (encrypted_username, blind_index(username), hashed_password, role, encrypted_first_name, encrypted_last_name, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         conn.commit()
         log_activity(username, "User added via prompt", f"Role: {role}, Name: {first_name} {last_name}")
         print(f"Gebruiker {username} succesvol toegevoegd.")
+    except sqlite3.IntegrityError as e:
+        # Een ander proces (bijvoorbeeld de service) heeft dezelfde gebruikersnaam net toegevoegd
+        conn.rollback()
+        logging.error(f"Error adding user, username already exists: {e}")
+        print("Deze gebruikersnaam bestaat al. Kies een andere gebruikersnaam.")
+        log_suspicious_activity(username, "Failed to add user via prompt", f"Role: {role}, Name: {first_name} {last_name}")
     except Error as e:
+        conn.rollback()  # Geef de schrijflock vrij, anders blijft de auditlog erop wachten
         logging.error(f"Error adding user: {e}")
         log_suspicious_activity(username, "Failed to add user via prompt", f"Role: {role}, Name: {first_name} {last_name}")
 
@@ -177,27 +188,39 @@ def update_password(conn, user_id):
             logging.error("Failed to find user for password update.")
 
     except Error as e:
+        conn.rollback()
         logging.error(f"Error updating password: {e}")
         log_suspicious_activity("system", "Failed to update password", f"Attempted to update password for user ID {user_id} with error: {e}")
 
+def get_users(conn):
+    """Retourneer (gebruikersnaam, rol) voor alle gebruikers; None als de naam niet te ontsleutelen is."""
+    sql = "SELECT username, role FROM users"
+    cur = conn.cursor()
+    cur.execute(sql)
+    users = []
+    for row in cur.fetchall():
+        try:
+            users.append((decrypt_data(row[0]), row[1]))  # Ontsleutel de gebruikersnaam
+        except Exception as e:
+            logging.error(f"Error decrypting data: {row[0]}. Exception: {e}")
+            users.append((None, row[1]))
+    return users
+
 def list_users(conn):
     """Geef een lijst van alle gebruikers en hun rollen."""
     try:
-        sql = "SELECT username, role FROM users"
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-
-        for row in rows:
-            try:
-                decrypted_username = decrypt_data(row[0])  # Ontsleutel de gebruikersnaam
-                print(f"Gebruikersnaam: {decrypted_username}, Rol: {row[1]}")
-            except Exception as e:
-                logging.error(f"Error decrypting data: {row[0]}. Exception: {e}")
-                print(f"Gebruikersnaam: [gehashed], Rol: {row[1]}")
+        for username, role in get_users(conn):
+            print(f"Gebruikersnaam: {username if username is not None else '[gehashed]'}, Rol: {role}")
     except Error as e:
         logging.error(f"Error listing users: {e}")
 
+def set_password(conn, user_id, password):
+    """Sla een nieuw (gehasht) wachtwoord op voor een gebruiker."""
+    sql_update = "UPDATE users SET password=? WHERE id=?"
+    cur = conn.cursor()
+    cur.execute(sql_update, (hash_password(password), user_id))
+    conn.commit()
+
 def update_user_prompt(conn):
     """Prompt de gebruiker om een bestaande gebruiker bij te werken."""
     while True:
@@ -219,27 +242,12 @@ def update_user_prompt(conn):
     last_name = input("Nieuwe achternaam: ")
 
     try:
-        # Haal alle gebruikers op en decrypt de gebruikersnamen om de juiste gebruiker te vinden
-        sql_fetch_all = "SELECT id, username FROM users"
-        cur = conn.cursor()
-        cur.execute(sql_fetch_all)
-        rows = cur.fetchall()
-
-        user_id = None
-        encrypted_current_username = None
-        encrypted_new_username = encrypt_data(new_username)
+        # Zoek de gebruiker op via de blinde index
+        user = get_user_by_username(conn, username)
 
-        for row in rows:
-            decrypted_username = decrypt_data(row[1])
-            if decrypted_username == username:
-                user_id = row[0]
-                encrypted_current_username = row[1]
-                break
-
-        if user_id:
-            # Update de gebruiker op basis van user_id
-            sql_update = "UPDATE users SET username=?, first_name=?, last_name=? WHERE id=?"
-            cur.execute(sql_update, (encrypted_new_username, first_name, last_name, user_id))
+        if user:
+            # Update de gebruiker op basis van user_id; de namen worden net als bij toevoegen versleuteld
+            update_user(conn, user[0], new_username, first_name, last_name)
             conn.commit()
 
             log_activity(username, "User updated", f"Username changed to {new_username}, Name updated to {first_name} {last_name}")
@@ -247,7 +255,12 @@ def update_user_prompt(conn):
         else:
             print(f"Gebruiker {username} niet gevonden.")
             log_suspicious_activity(username, "Failed to update user", f"Attempted to update non-existent user {username}")
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        logging.error(f"Error updating user, username already exists: {e}")
+        print("Deze nieuwe gebruikersnaam bestaat al. Kies een andere gebruikersnaam.")
     except Error as e:
+        conn.rollback()
         logging.error(f"Error updating user: {e}")
         log_suspicious_activity(username, "Failed to update user", f"Attempted to update {username} with error: {e}")
 
@@ -257,30 +270,22 @@ def delete_user_prompt(conn):
         username = input("Voer de gebruikersnaam in van de gebruiker die u wilt verwijderen: ")
         if is_valid_username(username):
             break
-    encrypted_username = None
 
     try:
-        # Haal alle gebruikers op en decrypt deze om te vinden wie verwijderd moet worden
-        sql = "SELECT username FROM users"
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-
-        for row in rows:
-            decrypted_username = decrypt_data(row[0])
-            if decrypted_username == username:
-                encrypted_username = row[0]
-                break
-
-        if encrypted_username:
-            sql_delete = "DELETE FROM users WHERE username=?"
-            cur.execute(sql_delete, (encrypted_username,))
+        # Zoek de gebruiker op die verwijderd moet worden
+        user = get_user_by_username(conn, username)
+
+        if user:
+            sql_delete = "DELETE FROM users WHERE id=?"
+            cur = conn.cursor()
+            cur.execute(sql_delete, (user[0],))
             conn.commit()
             log_activity(username, "User deleted", f"User {username} was deleted")
             print(f"Gebruiker {username} succesvol verwijderd.")
         else:
             print(f"Gebruiker {username} niet gevonden.")
     except Error as e:
+        conn.rollback()
         logging.error(f"Error deleting user: {e}")
         log_suspicious_activity(username, "Failed to delete user", f"Attempted to delete {username}")
 
@@ -295,37 +300,21 @@ def reset_user_password(conn):
         new_password = input("Voer het nieuwe wachtwoord in: ")
         if is_valid_password(new_password):
             break
-    
-    hashed_password = hash_password(new_password)
 
     try:
-        # Haal alle gebruikers op en decrypt de gebruikersnamen om de juiste gebruiker te vinden
-        sql_fetch_all = "SELECT id, username FROM users"
-        cur = conn.cursor()
-        cur.execute(sql_fetch_all)
-        rows = cur.fetchall()
-
-        user_id = None
-        encrypted_username = None
+        # Zoek de gebruiker op via de blinde index
+        user = get_user_by_username(conn, username)
 
-        for row in rows:
-            decrypted_username = decrypt_data(row[1])
-            if decrypted_username == username:
-                user_id = row[0]
-                encrypted_username = row[1]
-                break
-
-        if user_id:
+        if user:
             # Reset het wachtwoord voor de gevonden gebruiker
-            sql_update = "UPDATE users SET password=? WHERE id=?"
-            cur.execute(sql_update, (hashed_password, user_id))
-            conn.commit()
+            set_password(conn, user[0], new_password)
             log_activity(username, "Password reset", f"Password for {username} was reset")
             print(f"Wachtwoord voor gebruiker {username} succesvol gereset.")
         else:
             print(f"Gebruiker {username} niet gevonden.")
             log_suspicious_activity(username, "Failed to reset password", f"Attempted to reset password for non-existent user {username}")
     except Error as e:
+        conn.rollback()
         logging.error(f"Error resetting password: {e}")
         log_suspicious_activity(username, "Failed to reset password", f"Attempted to reset password for {username} with error: {e}")
 
@@ -350,32 +339,17 @@ def update_admin_prompt(conn):
         break
 
     try:
-        # Haal alle gebruikers op en decrypt de gebruikersnamen om de juiste gebruiker te vinden
-        sql_fetch_all = "SELECT id, username, role FROM users"
-        cur = conn.cursor()
-        cur.execute(sql_fetch_all)
-        rows = cur.fetchall()
-
-        user_id = None
-        encrypted_current_username = None
-        encrypted_new_username = encrypt_data(new_username)
+        # Zoek de systeembeheerder op via de blinde index
+        user = get_user_by_username(conn, username)
 
-        for row in rows:
-            decrypted_username = decrypt_data(row[1])
-            if decrypted_username == username:
-                user_id = row[0]
-                encrypted_current_username = row[1]
-                role = row[2]
-                break
-
-        if user_id:
+        if user:
+            user_id, role = user[0], user[3]
             if role != 'system_admin':
                 print("Deze functie is alleen beschikbaar voor systeembeheerder accounts.")
                 return
 
             # Update de systeembeheerder op basis van user_id
-            sql_update = "UPDATE users SET username=?, first_name=?, last_name=? WHERE id=?"
-            cur.execute(sql_update, (encrypted_new_username, encrypt_data(first_name), encrypt_data(last_name), user_id))
+            update_user(conn, user_id, new_username, first_name, last_name)
             conn.commit()
 
             log_activity(username, "System Admin updated", f"Username changed to {new_username}, Name updated to {first_name} {last_name}")
@@ -383,7 +357,12 @@ def update_admin_prompt(conn):
         else:
             print(f"Systeembeheerder {username} niet gevonden.")
             log_suspicious_activity(username, "Failed to update system admin", f"Attempted to update non-existent system admin {username}")
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        logging.error(f"Error updating system admin, username already exists: {e}")
+        print("Deze nieuwe gebruikersnaam bestaat al. Kies een andere gebruikersnaam.")
     except Error as e:
+        conn.rollback()
         logging.error(f"Error updating system admin: {e}")
         log_suspicious_activity(username, "Failed to update system admin", f"Attempted to update system admin {username} with error: {e}")
 
@@ -393,30 +372,19 @@ def delete_admin_prompt(conn):
         username = input("Voer de gebruikersnaam in van de systeembeheerder die u wilt verwijderen: ")
         if is_valid_username(username):
             break
-    encrypted_username = None
 
     try:
-        # Haal alle gebruikers op en decrypt deze om te vinden wie verwijderd moet worden
-        sql = "SELECT id, username, role FROM users"
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-
-        user_id = None
-        for row in rows:
-            decrypted_username = decrypt_data(row[1])
-            if decrypted_username == username:
-                encrypted_username = row[1]
-                role = row[2]
-                user_id = row[0]
-                break
+        # Zoek de systeembeheerder op die verwijderd moet worden
+        user = get_user_by_username(conn, username)
 
-        if user_id:
+        if user:
+            user_id, role = user[0], user[3]
             if role != 'system_admin':
                 print("Deze functie is alleen beschikbaar voor systeembeheerder accounts.")
                 return
 
             sql_delete = "DELETE FROM users WHERE id=?"
+            cur = conn.cursor()
             cur.execute(sql_delete, (user_id,))
             conn.commit()
             log_activity(username, "System Admin deleted", f"System Admin {username} was deleted")
@@ -424,6 +392,7 @@ def delete_admin_prompt(conn):
         else:
             print(f"Systeembeheerder {username} niet gevonden.")
     except Error as e:
+        conn.rollback()
         logging.error(f"Error deleting system admin: {e}")
         log_suspicious_activity(username, "Failed to delete system admin", f"Attempted to delete {username}")
 
@@ -435,18 +404,9 @@ def reset_admin_password_prompt(conn):
             break
 
     try:
-        # Haal alle systeembeheerders op en decrypt de gebruikersnamen om de juiste te vinden
-        sql_fetch_all = "SELECT id, username, role FROM users WHERE role='system_admin'"
-        cur = conn.cursor()
-        cur.execute(sql_fetch_all)
-        rows = cur.fetchall()
-
-        user_id = None
-        for row in rows:
-            decrypted_username = decrypt_data(row[1])
-            if decrypted_username == username:
-                user_id = row[0]
-                break
+        # Zoek de systeembeheerder op via de blinde index
+        user = get_user_by_username(conn, username)
+        user_id = user[0] if user and user[3] == 'system_admin' else None
 
         if user_id:
             while True:
@@ -454,17 +414,14 @@ def reset_admin_password_prompt(conn):
                 if is_valid_password(new_password):
                     break
 
-            hashed_password = hash_password(new_password)
-
             # Reset het wachtwoord voor de gevonden systeembeheerder
-            sql_update = "UPDATE users SET password=? WHERE id=?"
-            cur.execute(sql_update, (hashed_password, user_id))
-            conn.commit()
+            set_password(conn, user_id, new_password)
             log_activity(username, "System Admin password reset", f"Password for system admin {username} was reset")
             print(f"Wachtwoord voor systeembeheerder {username} succesvol gereset.")
         else:
             print(f"Systeembeheerder {username} niet gevonden.")
             log_suspicious_activity(username, "Failed to reset password for system admin", f"Attempted to reset password for non-existent system admin {username}")
     except Error as e:
+        conn.rollback()
         logging.error(f"Error resetting password for system admin: {e}")
         log_suspicious_activity(username, "Failed to reset password for system admin", f"Attempted to reset password for {username} with error: {e}")
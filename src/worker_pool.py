@@ -0,0 +1,56 @@
+# worker_pool.py
+import atexit
+import threading
+import metrics
+from encrypt_decrypt import key_manager
+
+# Workers starten als vers proces: een fork van de applicatie (met de auditlog- en snapshot-threads)
+# kan in het kind blijven hangen op een lock die op het moment van de fork vastgehouden werd
+WORKER_START_METHOD = "spawn"
+
+def init_worker(database_path=None):
+    """Laad de sleutels in een nieuw workerproces, zodat het eerste blok er niet op hoeft te wachten."""
+    metrics.stop_export()  # Alleen het hoofdproces schrijft het metrics-bestand
+    if database_path:
+        key_manager.set_database(database_path)  # Dezelfde data keys als het hoofdproces
+    key_manager.cipher
+    key_manager.index_key
+
+def process_pool(workers, database_path=None):
+    """Een process pool met gespawnde workers waarin de sleutels al geladen zijn."""
+    # Pas hier laden: multiprocessing is alleen nodig voor grote bewerkingen
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # Zorg in het hoofdproces voor een actieve data key; anders kan elke worker die er nog geen ziet er zelf een maken
+    key_manager.data_keys.active()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                               initializer=init_worker, initargs=(database_path,))
+
+_shared_pool = None
+_shared_pool_key = None
+_shared_pool_lock = threading.Lock()
+
+def shared_process_pool(workers, database_path=None):
+    """Een process pool die blijft bestaan, zodat niet elke zoekopdracht opnieuw workers hoeft op te starten.
+
+    Niet in een with-blok gebruiken; close_shared_pool stopt de workers.
+    """
+    global _shared_pool, _shared_pool_key
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool_key != (workers, database_path):
+            _shared_pool.shutdown(wait=False, cancel_futures=True)
+            _shared_pool = None
+        if _shared_pool is None:
+            _shared_pool = process_pool(workers, database_path)
+            _shared_pool_key = (workers, database_path)
+        return _shared_pool
+
+def close_shared_pool():
+    """Stop de gedeelde workers, bij het afsluiten of als hun sleutels niet meer kloppen (na een restore)."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.shutdown(wait=True, cancel_futures=True)
+            _shared_pool = None
+
+atexit.register(close_shared_pool)
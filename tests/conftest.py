@@ -0,0 +1,23 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Een lege database in een tijdelijke werkmap; alle paden van de applicatie zijn relatief."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    from database import create_connection, close_connections, initialize_database
+    from encrypt_decrypt import key_manager
+    conn = create_connection("data/unique_meal.db")
+    initialize_database(conn)
+    yield conn
+    from log import audit_logger
+    audit_logger.flush()  # Anders komen logs van deze test in de database van de volgende terecht
+    key_manager.data_keys.close()
+    key_manager.set_database("data/unique_meal.db")  # Een test kan een andere database hebben gekozen
+    key_manager._cipher = None
+    key_manager._index_key = None
+    close_connections("data/unique_meal.db")
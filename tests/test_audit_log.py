@@ -0,0 +1,58 @@
+import io
+import csv
+
+def _legacy_csv_line(key_manager, log_number, date, description, suspicious="No"):
+    """Een regel zoals de oude log_activity die schreef: lognummer en datum leesbaar, de rest versleuteld."""
+    legacy = key_manager.cipher.legacy_cipher
+    encrypted = [legacy.encrypt(value.encode()).decode() for value in ("jan", description, "", suspicious)]
+    line = io.StringIO()
+    csv.writer(line).writerow([log_number, date, "12:00:00", *encrypted])
+    return line.getvalue()
+
+def test_import_legacy_logs_skips_unreadable_rows_and_reads_encrypted_file(database):
+    from encrypt_decrypt import key_manager
+    from log import import_legacy_logs, log_store, LOG_FILE, ENCRYPTED_LOG_FILE, ENCRYPTED_LOG_HEADER
+    with open(LOG_FILE, "w", newline="") as log_file:
+        log_file.write(_legacy_csv_line(key_manager, 1, "10-06-2024", "Logged in"))
+        log_file.write("2,10-06-2024,12:00:00,x,y,z,geen-token\n")  # Met een andere sleutel geschreven
+        log_file.write("3,niet-een-datum,12:00:00,x,y,z,w\n")
+    # De versleutelde kopie bevat ook rij 1 en daarnaast een rij die in logs.csv ontbreekt
+    with open(ENCRYPTED_LOG_FILE, "wb") as encrypted_file:
+        encrypted_file.write(ENCRYPTED_LOG_HEADER)
+        for line in (_legacy_csv_line(key_manager, 1, "10-06-2024", "Logged in"),
+                     _legacy_csv_line(key_manager, 4, "11-06-2024", "Member added", "Yes")):
+            encrypted_file.write(key_manager.cipher.legacy_cipher.encrypt(line.encode()) + b"\n")
+        encrypted_file.write(b"kapot\n")
+
+    assert import_legacy_logs(database) == (2, 3)
+    logs = log_store.query()
+    assert [(log[0], log[4], log[6]) for log in logs] == [(1, "Logged in", "No"), (4, "Member added", "Yes")]
+
+def test_suspicious_activity_is_written_before_returning(database):
+    from log import log_suspicious_activity, log_store
+    log_suspicious_activity("jan", "Failed login attempt", "Attempt 1")
+    # Geen flush: een verdachte activiteit is al weggeschreven als log_activity terugkeert
+    logs = log_store.query(suspicious=True)
+    assert [(log[3], log[4], log[6]) for log in logs] == [("jan", "Failed login attempt", "Yes")]
+
+def test_flush_writes_queued_records(database):
+    from log import log_activity, audit_logger, log_store
+    for number in range(50):
+        log_activity("jan", "Member searched", f"Search {number}")
+    audit_logger.flush()
+    assert len(log_store.query()) == 50
+
+def test_open_transaction_does_not_block_logging_or_flush(database):
+    from log import log_activity, audit_logger, log_store
+    from connection import get_connection_manager
+    manager = get_connection_manager("data/unique_meal.db")
+    database.execute("UPDATE users SET role=role")  # Opent een transactie en houdt de schrijflock vast
+    assert manager.holds_write_lock()
+
+    log_activity("jan", "Member updated")
+    audit_logger.flush()  # Mag niet blijven hangen op de eigen transactie
+
+    database.rollback()
+    assert not manager.holds_write_lock()
+    audit_logger.flush()
+    assert [log[4] for log in log_store.query()] == ["Member updated"]
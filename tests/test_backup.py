@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import sqlite3
+import pytest
+
+def _chunk_files():
+    from backup import CHUNK_DIR
+    return {name for _, _, names in os.walk(CHUNK_DIR) for name in names}
+
+def test_second_backup_reuses_unchanged_chunks(database):
+    from backup import backup_database_and_logs
+    first = backup_database_and_logs("data/unique_meal.db", quiet=True)
+    chunks = _chunk_files()
+    second = backup_database_and_logs("data/unique_meal.db", quiet=True)
+
+    assert first != second
+    assert _chunk_files() == chunks
+    with open(first) as first_file, open(second) as second_file:
+        assert json.load(first_file)["files"] == json.load(second_file)["files"]
+
+def test_backup_only_lists_existing_log_files(database, capsys):
+    from backup import backup_database_and_logs
+    with open("data/system.log", "w") as log_file:
+        log_file.write("start\n")
+    with open(backup_database_and_logs("data/unique_meal.db")) as manifest_file:
+        names = [entry["name"] for entry in json.load(manifest_file)["files"]]
+    assert names == ["unique_meal.db", "system.log"]
+    assert "niet gevonden" not in capsys.readouterr().out
+
+def test_prune_chunks_keeps_chunks_of_remaining_manifests(database):
+    from backup import backup_database_and_logs, prune_chunks
+    first = backup_database_and_logs("data/unique_meal.db", quiet=True)
+    database.execute("CREATE TABLE extra (data blob)")
+    database.execute("INSERT INTO extra VALUES (randomblob(200000))")
+    database.commit()
+    second = backup_database_and_logs("data/unique_meal.db", quiet=True)
+    with open(second) as manifest_file:
+        needed = {chunk for entry in json.load(manifest_file)["files"] for chunk in entry["chunks"]}
+
+    assert prune_chunks(grace_period=0) == (0, 0)
+    os.remove(first)
+    assert prune_chunks(grace_period=3600)[0] == 0  # Nog te jong; kan bij een lopende back-up horen
+    removed, freed = prune_chunks(grace_period=0)
+
+    assert removed > 0 and freed > 0
+    assert _chunk_files() == needed
+
+def _add_member(conn):
+    from member import add_member
+    return add_member(conn, "Jan", "Jansen", 42, "M", 80.5, "Dorpsstraat 1, 1234AB Utrecht", "jan@example.com",
+                      "+31-6-12345678", "2412345675")
+
+def _leftover_restore_files():
+    return [name for name in os.listdir("data") if name.endswith((".restore", ".pre-restore", "-restore.json"))]
+
+def test_restore_brings_back_the_backed_up_database(database):
+    from backup import backup_database_and_logs, restore_backup
+    from member import get_member_id
+    from user import validate_login
+    backup_path = backup_database_and_logs("data/unique_meal.db", quiet=True)
+    _add_member(database)
+
+    conn = restore_backup(backup_path, "data/unique_meal.db")
+
+    assert get_member_id(conn, "2412345675") is None
+    assert validate_login(conn, "super_admin", "Admin_123?") is not None
+    assert _leftover_restore_files() == []
+
+def test_restore_refuses_damaged_chunk_and_keeps_database(database):
+    from backup import backup_database_and_logs, restore_backup, RestoreError, _chunk_path
+    backup_path = backup_database_and_logs("data/unique_meal.db", quiet=True)
+    member_id = _add_member(database)
+    with open(backup_path) as manifest_file:
+        chunk_hash = json.load(manifest_file)["files"][0]["chunks"][0]
+    with open(_chunk_path(chunk_hash), "r+b") as chunk_file:
+        chunk_file.write(b"beschadigd")
+
+    with pytest.raises(RestoreError):
+        restore_backup(backup_path, "data/unique_meal.db")
+
+    assert database.execute("SELECT id FROM members").fetchall() == [(member_id,)]
+    assert _leftover_restore_files() == []
+
+def test_failed_swap_puts_original_files_back(database, monkeypatch):
+    import backup
+    backup_path = backup.backup_database_and_logs("data/unique_meal.db", quiet=True)
+    member_id = _add_member(database)
+    replace = os.replace
+
+    def failing_replace(source, target):
+        if source.endswith(".restore") and not source.endswith(".pre-restore"):  # Alleen de klaargezette bestanden
+            raise OSError("schijf vol")
+        replace(source, target)
+
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(backup.os, "replace", failing_replace)
+        backup.restore_backup(backup_path, "data/unique_meal.db")
+
+    from database import create_connection
+    conn = create_connection("data/unique_meal.db")
+    assert conn.execute("SELECT id FROM members").fetchall() == [(member_id,)]
+    assert _leftover_restore_files() == []
+
+def test_interrupted_restore_is_rolled_back_at_startup(database):
+    from backup import recover_interrupted_restore, _restore_journal
+    from database import close_connections
+    database.execute("CREATE TABLE marker (id integer)")
+    database.commit()
+    close_connections("data/unique_meal.db")
+    # Toestand na een crash midden in _swap_files: het origineel staat opzij, een half teruggezet bestand op zijn plek
+    shutil.copyfile("data/unique_meal.db", "data/unique_meal.db.pre-restore")
+    with open("data/unique_meal.db", "wb") as database_file:
+        database_file.write(b"half teruggezet")
+    with open(_restore_journal("data/unique_meal.db"), "w") as journal_file:
+        json.dump({"data/unique_meal.db": "data/unique_meal.db.pre-restore",
+                   "data/system.log": None}, journal_file)
+    with open("data/system.log", "w") as log_file:
+        log_file.write("uit de back-up\n")
+
+    assert recover_interrupted_restore("data/unique_meal.db")
+
+    conn = sqlite3.connect("data/unique_meal.db")
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name='marker'").fetchone() == ("marker",)
+    conn.close()
+    assert not os.path.exists("data/system.log")
+    assert _leftover_restore_files() == []
+    assert not recover_interrupted_restore("data/unique_meal.db")
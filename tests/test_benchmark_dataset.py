@@ -0,0 +1,22 @@
+import random
+
+def _stored_member(conn):
+    """Het enige lid in de database: de kolommen buiten het record, het ontsleutelde record en de naamtokens."""
+    from member_record import decrypt_member_record
+    member_id, first_name, last_name, membership_id, id_hash, record = conn.execute(
+        "SELECT id, first_name, last_name, membership_id, membership_id_hash, record FROM members").fetchone()
+    tokens = sorted(token for token, in conn.execute("SELECT token FROM member_name_tokens WHERE member_id=?", (member_id,)))
+    return (first_name, last_name, membership_id, id_hash), decrypt_member_record(record), tokens
+
+def test_generated_member_is_stored_like_add_member(database):
+    from benchmark_dataset import _generate_members, random_member, DATASET_SEED
+    from member import add_member
+    _generate_members(database, random.Random(DATASET_SEED), 1, report=lambda message: None)
+    generated = _stored_member(database)
+    database.execute("DELETE FROM member_name_tokens")
+    database.execute("DELETE FROM members")
+    database.commit()
+
+    add_member(database, *random_member(random.Random(DATASET_SEED), 0))
+
+    assert _stored_member(database) == generated
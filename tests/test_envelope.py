@@ -0,0 +1,14 @@
+def test_legacy_values_readable_after_switching_to_aesgcm(database, monkeypatch):
+    import encrypt_decrypt
+    from encrypt_decrypt import key_manager, encrypt_data, decrypt_data
+    pre_envelope = key_manager.cipher.legacy_cipher.encrypt(b"Jan").decode()
+    fernet_value = encrypt_data("Jansen")
+
+    monkeypatch.setattr(encrypt_decrypt, "CIPHER_BACKEND", "aesgcm")
+    key_manager._cipher = None  # Laad het cipher opnieuw met het nieuwe backend
+    aesgcm_value = encrypt_data("Utrecht")
+
+    assert isinstance(aesgcm_value, bytes)
+    assert [decrypt_data(value) for value in (pre_envelope, fernet_value, aesgcm_value)] == ["Jan", "Jansen", "Utrecht"]
+    assert not key_manager.cipher.is_current(fernet_value.encode())
+    assert key_manager.cipher.is_current(aesgcm_value)
@@ -0,0 +1,50 @@
+import io
+import pytest
+
+def _add_member(conn, first_name, last_name, age, membership_id):
+    from member import add_member
+    return add_member(conn, first_name, last_name, age, "M", 80.5, "Dorpsstraat 1, 1234AB Utrecht",
+                      f"{first_name.lower()}@example.com", "+31-6-12345678", membership_id)
+
+def _add_legacy_member(conn, first_name, last_name, membership_id):
+    """Een lid van vóór het record-formaat, met een token per kolom."""
+    from encrypt_decrypt import encrypt_many
+    conn.execute("""INSERT INTO members (first_name, last_name, membership_id, registration_date)
+                    VALUES (?, ?, ?, '2024-06-10 00:19:59')""", encrypt_many([first_name, last_name, membership_id]))
+    conn.commit()
+
+def test_filters_on_encrypted_columns(database):
+    from export import export_rows
+    _add_member(database, "Jan", "Jansen", 42, "2412345675")
+    _add_member(database, "Anna", "de Vries", 42, "2412345684")
+    _add_legacy_member(database, "Piet", "Jansen", "2412345693")
+
+    rows = list(export_rows(database, "members", ["first_name", "membership_id"], {"last_name": "Jansen"}, fetch_size=1))
+
+    assert rows == [{"first_name": "Jan", "membership_id": "2412345675"},
+                    {"first_name": "Piet", "membership_id": "2412345693"}]
+    assert [row["first_name"] for row in export_rows(database, "members", ["first_name"], {"age": 42})] == ["Jan", "Anna"]
+    assert list(export_rows(database, "members", filters={"last_name": "jansen"})) == []
+
+def test_filters_on_plain_columns_and_secrets_stay_out(database):
+    from export import export_rows
+    from user import add_user
+    add_user(database, "jansen_01", "Welkom_12345?", "consultant", "Jan", "Jansen")
+    add_user(database, "devries_1", "Welkom_12345?", "system_admin", "Anna", "de Vries")
+
+    rows = list(export_rows(database, "users", filters={"role": "consultant"}))
+
+    assert [row["username"] for row in rows] == ["jansen_01"]
+    assert set(rows[0]) == {"username", "role", "first_name", "last_name", "registration_date"}
+    with pytest.raises(ValueError):
+        export_rows(database, "users", ["password"])
+    with pytest.raises(ValueError):
+        export_rows(database, "users", filters={"username_hash": "x"})
+
+def test_export_writes_jsonl(database):
+    from export import export_rows, write_export
+    _add_member(database, "Jan", "Jansen", 42, "2412345675")
+    output = io.StringIO()
+
+    assert write_export(export_rows(database, "members", ["first_name", "age"]), output, ["first_name", "age"], "jsonl") == 1
+    assert output.getvalue() == '{"first_name": "Jan", "age": "42"}\n'
@@ -0,0 +1,109 @@
+import os
+
+def _insert_legacy_member(conn):
+    """Een lid zoals in de back-up uit 2024: tekst met de oude sleutel versleuteld, leeftijd en gewicht als getal."""
+    from encrypt_decrypt import key_manager
+    legacy = key_manager.cipher.legacy_cipher
+    first_name, last_name = (legacy.encrypt(name.encode()).decode() for name in ("Jan", "Jansen"))
+    cur = conn.execute("""INSERT INTO members (first_name, last_name, age, gender, weight, registration_date, membership_id)
+                          VALUES (?, ?, 42, NULL, 80.5, '2024-06-10 00:19:59', '')""", (first_name, last_name))
+    conn.commit()
+    return cur.lastrowid
+
+def test_rotate_chunk_keeps_numeric_legacy_values(database):
+    from key_rotation import rotate_chunk, ROTATION_TABLES
+    from encrypt_decrypt import key_manager
+    member_id = _insert_legacy_member(database)
+    rows = database.execute(f"SELECT id, {', '.join(ROTATION_TABLES['members'])} FROM members WHERE id=?",
+                            (member_id,)).fetchall()
+
+    changes, unreadable = rotate_chunk(rows)
+
+    assert unreadable == 2  # Leeftijd en gewicht
+    (row_id, originals, rotated), = changes
+    assert row_id == member_id
+    assert rotated[2:5] == (42, None, 80.5)
+    assert [key_manager.cipher.decrypt_value(value) for value in rotated[:2]] == ["Jan", "Jansen"]
+
+def test_rotate_keys_completes_with_legacy_row_and_keeps_old_keys(database):
+    from key_rotation import rotate_keys, rotation_checkpoint_file
+    from encrypt_decrypt import key_manager
+    member_id = _insert_legacy_member(database)
+    old_key_id = key_manager.data_keys.active()[0]
+
+    rotate_keys("data/unique_meal.db", chunk_size=1, workers=1, use_processes=False)
+
+    assert not os.path.exists(rotation_checkpoint_file("data/unique_meal.db"))
+    age, weight = database.execute("SELECT age, weight FROM members WHERE id=?", (member_id,)).fetchone()
+    assert (age, weight) == (42, 80.5)
+    # De oude data key blijft bestaan tot remove_old_keys
+    assert database.execute("SELECT COUNT(*) FROM data_keys WHERE id=?", (old_key_id,)).fetchone()[0] == 1
+
+def test_write_changes_does_not_overwrite_concurrent_update(database):
+    from key_rotation import rotate_chunk, _write_changes, ROTATION_TABLES
+    from connection import get_connection_manager
+    from encrypt_decrypt import key_manager, encrypt_data
+    columns = ROTATION_TABLES["members"]
+    member_id = _insert_legacy_member(database)
+    rows = database.execute(f"SELECT id, {', '.join(columns)} FROM members WHERE id=?", (member_id,)).fetchall()
+    changes, _ = rotate_chunk(rows)
+
+    # De applicatie wijzigt de rij tussen het lezen en het wegschrijven van de rotatie
+    database.execute("UPDATE members SET first_name=? WHERE id=?", (encrypt_data("Piet"), member_id))
+    database.commit()
+    _write_changes(get_connection_manager("data/unique_meal.db"), "members", columns, changes)
+
+    first_name, last_name = database.execute("SELECT first_name, last_name FROM members WHERE id=?", (member_id,)).fetchone()
+    assert key_manager.cipher.decrypt_value(first_name) == "Piet"
+    assert key_manager.cipher.decrypt_value(last_name) == "Jansen"
+
+def test_checkpoint_belongs_to_its_database(database):
+    import json
+    from key_rotation import rotate_keys, rotation_checkpoint_file
+    from database import create_connection, initialize_database, close_connections
+    from encrypt_decrypt import key_manager
+    # Een onderbroken rotatie van de standaarddatabase mag een rotatie van een andere database niet beïnvloeden
+    with open(rotation_checkpoint_file("data/unique_meal.db"), "w") as checkpoint_file:
+        json.dump({"started": "2024-06-10 00:00:00", "phase": "verify", "data_key_id": 1,
+                   "tables": {"users": 10 ** 9, "members": 10 ** 9, "logs": 10 ** 9}}, checkpoint_file)
+    other = create_connection("data/other.db")
+    initialize_database(other)
+    member_id = _insert_legacy_member(other)
+
+    rotate_keys("data/other.db", workers=1, use_processes=False)
+
+    assert os.path.exists(rotation_checkpoint_file("data/unique_meal.db"))
+    assert not os.path.exists(rotation_checkpoint_file("data/other.db"))
+    first_name = other.execute("SELECT first_name FROM members WHERE id=?", (member_id,)).fetchone()[0]
+    assert first_name.startswith("k")  # Met een data key versleuteld, niet meer met de oude sleutel
+    key_manager.data_keys.close()
+    close_connections("data/other.db")
+
+def test_remove_old_keys_waits_for_grace_period(database):
+    from key_rotation import rotate_keys, remove_old_keys
+    _insert_legacy_member(database)
+    rotate_keys("data/unique_meal.db", workers=1, use_processes=False)
+
+    assert remove_old_keys("data/unique_meal.db", grace_period=3600) is None
+    assert remove_old_keys("data/unique_meal.db", grace_period=0) >= 1
+
+def test_rotate_master_key_keeps_old_key_until_retired(database):
+    from encrypt_decrypt import key_manager, encrypt_data
+    data_keys = key_manager.data_keys
+    value = encrypt_data("Jan")
+    old_master_key_id, = {row[0] for row in database.execute("SELECT master_key_id FROM data_keys")}
+    wrapped_before = database.execute("SELECT id, wrapped_key, master_key_id FROM data_keys").fetchall()
+
+    data_keys.rotate_master_key()
+
+    # Een teruggezette back-up heeft de data keys nog met de oude master key verpakt
+    database.execute("DELETE FROM data_keys")
+    database.executemany("INSERT INTO data_keys (id, wrapped_key, master_key_id, created, active) VALUES (?, ?, ?, '', 1)",
+                         wrapped_before)
+    database.commit()
+    data_keys.close()
+    assert key_manager.cipher.decrypt_value(value) == "Jan"
+    assert data_keys.retire_master_keys({old_master_key_id}) == []
+
+    data_keys.rotate_master_key()
+    assert old_master_key_id in data_keys.retire_master_keys(set())
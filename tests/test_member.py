@@ -0,0 +1,69 @@
+def _add_member(conn, first_name, last_name, membership_id):
+    from member import add_member
+    return add_member(conn, first_name, last_name, 42, "M", 80.5, "Dorpsstraat 1, 1234AB Utrecht",
+                      f"{first_name.lower()}@example.com", "+31-6-12345678", membership_id)
+
+def test_membership_id_lookup_uses_blind_index(database):
+    from member import get_member_id
+    member_id = _add_member(database, "Jan", "Jansen", "2412345675")
+
+    assert get_member_id(database, "2412345675") == member_id
+    assert get_member_id(database, "2412345684") is None
+
+def test_membership_id_lookup_finds_member_from_before_records(database):
+    from member import get_member_id, membership_id_hash
+    from encrypt_decrypt import encrypt_data
+    cur = database.execute("""INSERT INTO members (first_name, last_name, registration_date, membership_id, membership_id_hash)
+                              VALUES (?, ?, '2024-06-10 00:19:59', ?, ?)""",
+                           (encrypt_data("Jan"), encrypt_data("Jansen"), encrypt_data("2412345675"),
+                            membership_id_hash("2412345675")))
+    database.commit()
+
+    assert get_member_id(database, "2412345675") == cur.lastrowid
+
+def test_delete_member_by_membership_id(database):
+    from member import delete_member, get_member_id
+    member_id = _add_member(database, "Jan", "Jansen", "2412345675")
+
+    assert delete_member(database, "2412345675") == 1
+    assert get_member_id(database, "2412345675") is None
+    assert database.execute("SELECT COUNT(*) FROM member_name_tokens WHERE member_id=?", (member_id,)).fetchone()[0] == 0
+    assert delete_member(database, "2412345675") == 0
+
+def test_name_search_uses_trigram_tokens(database):
+    from member import search_member
+    from name_index import find_candidate_ids
+    jan = _add_member(database, "Jan", "Jansen", "2412345675")
+    _add_member(database, "Anna", "de Vries", "2412345684")
+
+    assert [member["last_name"] for member in search_member(database, "anse")] == ["Jansen"]
+    assert [member["first_name"] for member in search_member(database, "VRIES")] == ["Anna"]
+    assert find_candidate_ids(database, "anse") == [jan]
+    assert search_member(database, "Pietersen") == []
+
+def test_short_search_term_scans_all_members(database):
+    from member import search_member
+    from name_index import find_candidate_ids
+    _add_member(database, "Jan", "Jansen", "2412345675")
+    _add_member(database, "Anna", "de Vries", "2412345684")
+
+    assert find_candidate_ids(database, "an") is None
+    assert sorted(member["first_name"] for member in search_member(database, "an")) == ["Anna", "Jan"]
+    assert [member["last_name"] for member in search_member(database, "Vr")] == ["de Vries"]
+
+def test_search_by_membership_id(database):
+    from member import search_member
+    _add_member(database, "Jan", "Jansen", "2412345675")
+
+    assert [member["first_name"] for member in search_member(database, "2412345675")] == ["Jan"]
+
+def test_parallel_scan_finds_the_same_members(database):
+    from member_scan import scan_members, scan_members_serial
+    for number, name in enumerate(["Jan", "Anna", "Daan", "Piet"]):
+        _add_member(database, name, "Smit", f"24{number:07d}0")
+
+    serial = sorted(member.id for member in scan_members_serial(database, "an"))
+    parallel = sorted(member.id for member in scan_members(database, "an", workers=2, chunk_size=1,
+                                                           use_processes=False, threshold=0))
+    assert len(serial) == 3
+    assert parallel == serial
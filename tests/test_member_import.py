@@ -0,0 +1,49 @@
+import csv
+import json
+
+def _member(number, **overrides):
+    return {"first_name": f"Jan{number}", "last_name": "Jansen", "age": "42", "gender": "M", "weight": "80.5",
+            "street": "Dorpsstraat", "house_number": str(number), "zip_code": "1234AB", "city": "Utrecht",
+            "email": f"jan{number}@example.com", "phone": "+31-6-12345678", **overrides}
+
+def _write_csv(path, records):
+    with open(path, "w", newline="") as import_file:
+        writer = csv.DictWriter(import_file, fieldnames=list(_member(0)))
+        writer.writeheader()
+        writer.writerows(records)
+
+def test_import_rejects_invalid_rows_and_keeps_the_rest(database):
+    from member_import import import_members
+    _write_csv("leden.csv", [_member(1), _member(2, age="200"), _member(3, city="Parijs"), _member(4, email="")])
+
+    imported, rejects = import_members(database, "leden.csv", batch_size=2, workers=1, use_processes=False)
+
+    assert imported == 1
+    assert [line for line, _ in rejects] == [3, 4, 5]
+    assert "leeftijd" in rejects[0][1] and "stad" in rejects[1][1] and "email" in rejects[2][1]
+    assert database.execute("SELECT COUNT(*) FROM members").fetchone()[0] == 1
+
+def test_import_rejects_invalid_json_lines(database):
+    from member_import import import_members
+    with open("leden.jsonl", "w") as import_file:
+        import_file.write(json.dumps(_member(1)) + "\n{kapot\n[1, 2]\n")
+
+    imported, rejects = import_members(database, "leden.jsonl", workers=1, use_processes=False)
+
+    assert imported == 1
+    assert [line for line, _ in rejects] == [2, 3]
+
+def test_imported_members_are_searchable_and_attributed(database):
+    from member_import import import_members
+    from member import search_members
+    from log import audit_logger, log_store
+    _write_csv("leden.csv", [_member(number) for number in range(1, 8)])
+
+    imported, rejects = import_members(database, "leden.csv", username="beheerder", batch_size=3, workers=2,
+                                       use_processes=False)
+
+    assert (imported, rejects) == (7, [])
+    # De naamtokens horen bij de juiste leden, ook over meerdere blokken
+    assert [member["first_name"] for member in search_members(database, "jan5")] == ["Jan5"]
+    audit_logger.flush()
+    assert {(log[3], log[4]) for log in log_store.query()} == {("beheerder", "Members imported")}
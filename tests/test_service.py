@@ -0,0 +1,87 @@
+import pytest
+
+@pytest.fixture
+def service(database):
+    from service import MemberService
+    member_service = MemberService("data/unique_meal.db", workers=1)
+    yield member_service
+    member_service.close()
+
+def _login(service, username, password):
+    status, payload = service.login(None, {}, {"username": username, "password": password})
+    assert status == 200
+    return service._session(payload["token"])
+
+def _new_user(username, role="consultant"):
+    return {"username": username, "password": "Welkom_12345?", "role": role, "first_name": "Jan", "last_name": "Jansen"}
+
+def test_roles_limit_user_management(service):
+    from service import ServiceError
+    admin = _login(service, "super_admin", "Admin_123?")
+    assert service.add_user(admin, {}, _new_user("consult01"))[0] == 201
+    consultant = _login(service, "consult01", "Welkom_12345?")
+
+    for handler, kwargs in ((service.list_users, {}), (service.add_user, {}), (service.delete_user, {"username": "consult01"})):
+        with pytest.raises(ServiceError) as error:
+            handler(consultant, {}, _new_user("consult02"), **kwargs)
+        assert error.value.status == 403
+
+def test_duplicate_username_is_a_conflict(service):
+    from service import ServiceError
+    admin = _login(service, "super_admin", "Admin_123?")
+    service.add_user(admin, {}, _new_user("consult01"))
+    service.add_user(admin, {}, _new_user("consult02"))
+
+    with pytest.raises(ServiceError) as error:
+        service.add_user(admin, {}, _new_user("consult01"))
+    assert error.value.status == 409
+    with pytest.raises(ServiceError) as error:
+        service.update_user(admin, {}, {"new_username": "consult02", "first_name": "A", "last_name": "B"},
+                            username="consult01")
+    assert error.value.status == 409
+
+def test_failed_insert_is_not_reported_as_created(service, monkeypatch):
+    import database
+    from service import ServiceError
+    admin = _login(service, "super_admin", "Admin_123?")
+    monkeypatch.setattr(database, "insert_user", lambda *args: None)
+
+    with pytest.raises(ServiceError) as error:
+        service.add_user(admin, {}, _new_user("consult01"))
+    assert error.value.status == 500
+
+def test_update_user_encrypts_names(service):
+    from encrypt_decrypt import decrypt_many
+    admin = _login(service, "super_admin", "Admin_123?")
+    service.add_user(admin, {}, _new_user("consult01"))
+
+    assert service.update_user(admin, {}, {"new_username": "consult03", "first_name": "Piet", "last_name": "Smit"},
+                               username="consult01")[0] == 200
+    with service.manager.reader() as conn:
+        names = conn.execute("SELECT first_name, last_name FROM users WHERE role='consultant'").fetchone()
+    assert decrypt_many(names) == ["Piet", "Smit"]
+
+def test_update_user_prompt_encrypts_names(service, monkeypatch):
+    from user import update_user_prompt
+    from encrypt_decrypt import decrypt_many
+    admin = _login(service, "super_admin", "Admin_123?")
+    service.add_user(admin, {}, _new_user("consult01"))
+    answers = iter(["consult01", "consult04", "Piet", "Smit"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+
+    update_user_prompt(service.manager.writer)
+
+    with service.manager.reader() as conn:
+        names = conn.execute("SELECT first_name, last_name FROM users WHERE role='consultant'").fetchone()
+    assert decrypt_many(names) == ["Piet", "Smit"]
+
+def test_username_index_is_unique(service):
+    import sqlite3
+    from database import insert_user
+    conn = service.manager.writer
+    assert insert_user(conn, "consult01", "Welkom_12345?", "consultant", "Jan", "Jansen")
+    # Zonder de controle van username_exists, zoals bij twee processen die tegelijk toevoegen
+    assert insert_user(conn, "consult01", "Welkom_12345?", "consultant", "Piet", "Smit") is None
+    index = conn.execute("SELECT sql FROM sqlite_master WHERE name='idx_users_username_hash_unique'").fetchone()
+    assert index and index[0].startswith("CREATE UNIQUE INDEX")
+    assert not service.manager.holds_write_lock()
@@ -0,0 +1,36 @@
+import sqlite3
+import pytest
+
+def test_login_finds_user_through_blind_index(database):
+    from user import add_user, validate_login
+    from encrypt_decrypt import blind_index
+    user_id = add_user(database, "jansen_01", "Welkom_12345?", "consultant", "Jan", "Jansen")
+
+    assert validate_login(database, "jansen_01", "Welkom_12345?") == (user_id, "consultant")
+    assert validate_login(database, "jansen_01", "Verkeerd_12345?") is None
+    assert validate_login(database, "jansen_02", "Welkom_12345?") is None
+    # De gebruikersnaam staat alleen versleuteld en als blinde index in de database
+    username, username_hash = database.execute("SELECT username, username_hash FROM users WHERE id=?", (user_id,)).fetchone()
+    assert username != "jansen_01"
+    assert username_hash == blind_index("jansen_01")
+
+def test_login_after_username_change(database):
+    from user import add_user, update_user, validate_login
+    user_id = add_user(database, "jansen_01", "Welkom_12345?", "consultant", "Jan", "Jansen")
+    assert update_user(database, user_id, "jansen_02", "Jan", "Jansen")
+    database.commit()
+
+    assert validate_login(database, "jansen_01", "Welkom_12345?") is None
+    assert validate_login(database, "jansen_02", "Welkom_12345?") == (user_id, "consultant")
+
+def test_username_index_is_unique(database):
+    from user import add_user
+    from encrypt_decrypt import encrypt_data, blind_index
+    assert add_user(database, "jansen_01", "Welkom_12345?", "consultant", "Jan", "Jansen")
+    assert add_user(database, "jansen_01", "Welkom_12345?", "consultant", "Piet", "Jansen") is None
+
+    # Ook buiten insert_user om, zoals een tweede proces dat tegelijk dezelfde naam toevoegt
+    with pytest.raises(sqlite3.IntegrityError):
+        database.execute("""INSERT INTO users (username, username_hash, password, role, first_name, last_name, registration_date)
+                            VALUES (?, ?, '', 'consultant', '', '', '')""", (encrypt_data("jansen_01"), blind_index("jansen_01")))
+    database.rollback()